@@ -0,0 +1,49 @@
+from argparse import ArgumentParser
+from glob import glob
+from os import chdir, remove
+from os.path import abspath, dirname
+
+# Compiles core.py with mypyc, the extension is written next to it and imported instead of core.py
+# Needs mypy and setuptools: pip install mypy setuptools
+# Without the extension, or after --clean, the game runs the pure Python module as before
+
+################################################################
+#                           Configs                            #
+################################################################
+
+BASE_PATH = abspath(dirname(__file__))
+MODULES = ['core.py']
+OPT_LEVEL = '3'
+
+################################################################
+#                            Build                             #
+################################################################
+
+def get_extensions() -> list:
+    return sorted(path for module in MODULES for path in glob(BASE_PATH + '/' + module[:-3] + '.*.so') + glob(BASE_PATH + '/' + module[:-3] + '.*.pyd'))
+
+def build(opt_level: str) -> None:
+    from mypyc.build import mypycify
+    from setuptools import setup
+    setup(
+        name='spaceinvaders-core',
+        ext_modules=mypycify(MODULES, opt_level=opt_level),
+        script_args=['build_ext', '--inplace']
+    )
+
+def clean() -> None:
+    for path in get_extensions():
+        remove(path)
+        print("Removed " + path)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compiles the core of the game with mypyc, or removes the compiled module")
+    parser.add_argument('--clean', action='store_true', help="removes the compiled module, the pure Python one is used again")
+    parser.add_argument('--opt-level', default=OPT_LEVEL, help="of the C compiler, 0 to 3")
+    args = parser.parse_args()
+    chdir(BASE_PATH)
+    if args.clean:
+        clean()
+    else:
+        build(args.opt_level)
+        print("Built " + ', '.join(get_extensions()))
@@ -0,0 +1,1145 @@
+from array import array
+from bisect import bisect_right
+from struct import Struct
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Protocol, Tuple, TypeVar, Union
+
+# The rules of the game without its window: no Tk, no PIL, only numbers
+# Kept to what mypyc compiles, see build_core.py, the game runs the same with or without the compiled build
+
+################################################################
+#                           Configs                            #
+################################################################
+
+IMAGE_SCALE = 5     # default, see set_scale
+SPEED_SCALE = 1
+
+TICK_DELAY = 30     # ms between two game ticks
+
+# Timers are counted in ticks so that they are part of the game state
+EXPLOSION_TICKS = round(60 / TICK_DELAY)
+DEFENDER_EXPLOSION_TICKS = round(1140 / TICK_DELAY)        # the game is frozen meanwhile
+DEFENDER_EXPLOSION_FRAME_TICKS = round(120 / TICK_DELAY)
+
+SNAPSHOT_VERSION = 1
+
+FLEET_ROWS = 5      # default, see set_fleet_size
+FLEET_COLUMNS = 11
+
+# Challenge mode, see Projectiles: the fleet fires barrages of bombs and the defender a spread of bullets
+PROJECTILES_CAPACITY = 1024
+PROJECTILE_FRAME_TICKS = 4      # between two frames of a bomb, sent for hundreds of them at once
+BARRAGE_DELAY = round(1500 / TICK_DELAY)
+BARRAGE_ALIENS = 4      # among the lowest ones, each fires a fan of bombs
+BARRAGE_SPREAD = 5      # bombs per fan
+BARRAGE_DX = 2          # between two bombs of a fan, per tick
+BARRAGE_DY = 6
+SPREAD_PAIRS = 1        # of bullets fired on each side of the bullet of the defender
+SPREAD_DX = 3
+
+################################################################
+#                            Assets                            #
+################################################################
+
+# Loaded by the game, which hands them over with use_assets
+Images: Any = None
+Sounds: Any = None
+
+def use_assets(images: Any, sounds: Any) -> None:
+    global Images, Sounds
+    Images = images
+    Sounds = sounds
+
+class Scale:
+    image: ClassVar[float] = float(IMAGE_SCALE)
+    speed: ClassVar[float] = float(SPEED_SCALE)
+
+################################################################
+#                            Utils                             #
+################################################################
+
+BBox = Tuple[float, float, float, float]
+T = TypeVar('T')
+
+def get_bbox(x: float, y: float, width: int, height: int) -> BBox:
+    # Same as the canvas bbox of an image item centered on x, y
+    return x - width / 2, y - height / 2, x + width / 2, y + height / 2
+
+def bbox_overlap(a_bbox: BBox, b_bbox: BBox) -> bool:
+    inXRange = a_bbox[0] <= b_bbox[0] <= a_bbox[2] or a_bbox[0] <= b_bbox[2] <= a_bbox[2]
+    inYRange = a_bbox[1] <= b_bbox[1] <= a_bbox[3] or a_bbox[1] <= b_bbox[3] <= a_bbox[3]
+    return inXRange and inYRange
+
+class XorShift:
+    # xorshift64*, unlike random.Random its whole state is one integer to snapshot
+    def __init__(self, seed: int) -> None:
+        self.state = (seed ^ 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF or 1
+
+    def next(self) -> int:
+        x = self.state
+        x ^= x >> 12
+        x ^= (x << 25) & 0xFFFFFFFFFFFFFFFF
+        x ^= x >> 27
+        self.state = x
+        return (x * 0x2545F4914F6CDD1D) & 0xFFFFFFFFFFFFFFFF
+
+    def randrange(self, start: int, stop: Optional[int] = None) -> int:
+        if stop is None:
+            start, stop = 0, start
+        return start + self.next() % (stop - start)
+
+    def sample(self, population: List[T], k: int) -> List[T]:
+        pool = list(population)
+        for i in range(k):
+            j = i + self.next() % (len(pool) - i)
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+################################################################
+#                            Render                            #
+################################################################
+
+ItemRef = Union[int, str]
+
+# Events, with the entity they are about
+EVENT_KILL = 1          # value: points
+EVENT_BOMB_DROP = 2     # value: kind of bomb
+EVENT_EXPLOSION = 3
+EVENT_SOUND = 4         # value: index of the sound
+EVENT_SHOT = 5
+EVENT_HIT = 6           # value: kind of bomb
+EVENT_NAMES = {EVENT_KILL: 'kill', EVENT_BOMB_DROP: 'bomb drop', EVENT_EXPLOSION: 'explosion', EVENT_SOUND: 'sound', EVENT_SHOT: 'shot', EVENT_HIT: 'hit'}
+
+ENTITY_NONE = 0
+ENTITY_DEFENDER = 1
+ENTITY_BULLET = 2
+ENTITY_ALIEN = 3
+ENTITY_BOMB = 4
+ENTITY_NAMES = {ENTITY_NONE: '', ENTITY_DEFENDER: 'defender', ENTITY_BULLET: 'bullet', ENTITY_ALIEN: 'alien', ENTITY_BOMB: 'bomb'}
+
+# Kind, entity, x, y, value and index of the alien of a game event, see recorder
+EventListener = Callable[[int, int, float, float, int, int], None]
+
+class Render(Protocol):
+    # What the entities change on the canvas, see RenderBuffer
+    @property
+    def width(self) -> float: ...
+    @property
+    def height(self) -> float: ...
+    def create_image(self, x: float, y: float, **options: Any) -> int: ...
+    def move(self, item: ItemRef, dx: float, dy: float) -> None: ...
+    def coords(self, item: ItemRef, x: float, y: float) -> None: ...
+    def itemconfigure(self, item: ItemRef, **options: Any) -> None: ...
+    def delete(self, item: ItemRef) -> None: ...
+    def flush(self) -> None: ...
+    def photo(self, image: Any) -> Any: ...
+    def photos(self, images: List[Any]) -> List[Any]: ...
+    def play(self, sound: str) -> None: ...
+    def event(self, kind: int, entity: int, x: float, y: float, value: int = 0, index: int = -1) -> None: ...
+
+class NullRender:
+    # Stands for a RenderBuffer when the game runs without a window, as the clones of a World do
+    def __init__(self, width: float, height: float) -> None:
+        self.width = width
+        self.height = height
+        self.items = 0
+        self.listeners: List[EventListener] = []
+
+    def create_image(self, x: float, y: float, **options: Any) -> int:
+        self.items += 1
+        return self.items
+
+    def move(self, item: ItemRef, dx: float, dy: float) -> None: pass
+    def coords(self, item: ItemRef, x: float, y: float) -> None: pass
+    def itemconfigure(self, item: ItemRef, **options: Any) -> None: pass
+    def delete(self, item: ItemRef) -> None: pass
+    def flush(self) -> None: pass
+    def photo(self, image: Any) -> Any: return None
+    def photos(self, images: List[Any]) -> List[Any]: return [None] * len(images)
+    def play(self, sound: str) -> None: pass
+
+    def event(self, kind: int, entity: int, x: float, y: float, value: int = 0, index: int = -1) -> None:
+        for listener in self.listeners:
+            listener(kind, entity, x, y, value, index)
+
+################################################################
+#                             Core                             #
+################################################################
+
+ALIVE = 1
+EXPLODES = 2
+
+def flags(entity: Any) -> int:
+    return (ALIVE if entity.alive else 0) | (EXPLODES if entity.explodes else 0)
+
+class Defender:
+    def __init__(self, render: Render) -> None:
+        self.render = render
+        self.image = render.photo(Images.defender)
+        self.images_explosion = render.photos(Images.defender_explosion)
+        self.width, self.height = Images.defender.size
+        self.delta_x = 20 * Scale.speed
+        self.lives = 3
+        self.score = 0
+        self.alive = True
+        self.explodes = False
+        self.explosion_ticks = 0
+        self.bullet: Optional['Bullet'] = None
+        self.x = self.render.width / 2
+        self.y = self.render.height - self.height / 2
+        self.id = self._create_id()
+
+    def _create_id(self) -> int:
+        return self.render.create_image(self.x, self.y, image=self.image)
+
+    def bbox(self) -> BBox:
+        return get_bbox(self.x, self.y, self.width, self.height)
+
+    def isAlive(self) -> bool:
+        return self.alive and not self.explodes
+
+    def kill(self) -> None:
+        if self.alive:
+            self.alive = False
+            self.lives = 0
+            self.render.delete(self.id)
+
+    def explode(self) -> None:
+        if self.isAlive():
+            self.explodes = True
+            self.explosion_ticks = DEFENDER_EXPLOSION_TICKS
+            self.render.play(Sounds.defender_killed)
+            self.render.event(EVENT_EXPLOSION, ENTITY_DEFENDER, self.x, self.y)
+            self.lives -= 1
+            self.render.itemconfigure(self.id, image=self.images_explosion[0])
+
+    def _explosion_frame(self) -> int:
+        return (DEFENDER_EXPLOSION_TICKS - self.explosion_ticks) // DEFENDER_EXPLOSION_FRAME_TICKS % 2
+
+    def update(self) -> bool:
+        # The game stays frozen until the end of the explosion, returns whether it goes on
+        if self.alive and self.explodes:
+            self.explosion_ticks -= 1
+            if self.explosion_ticks > 0:
+                if (DEFENDER_EXPLOSION_TICKS - self.explosion_ticks) % DEFENDER_EXPLOSION_FRAME_TICKS == 0:
+                    self.render.itemconfigure(self.id, image=self.images_explosion[self._explosion_frame()])
+                return True
+            elif self.lives > 0:
+                self.render.itemconfigure(self.id, image=self.image)
+                self.explodes = False
+            else:
+                self.kill()
+        return False
+
+    def restore(self, x: float, state: int, lives: int, score: int, explosion_ticks: int) -> None:
+        alive = state & ALIVE != 0
+        if alive and not self.alive:
+            self.id = self._create_id()
+        elif not alive and self.alive:
+            self.render.delete(self.id)
+        if alive:
+            self.render.move(self.id, x - self.x, 0)
+        self.x = x
+        self.alive = alive
+        self.explodes = state & EXPLODES != 0
+        self.lives = lives
+        self.score = score
+        self.explosion_ticks = explosion_ticks
+        if alive:
+            self.render.itemconfigure(self.id, image=self.images_explosion[self._explosion_frame()] if self.explodes else self.image)
+
+    def move(self, dx: float) -> None:
+        if self.isAlive():
+            bbox = self.bbox()
+            x2_max = self.render.width
+            if bbox[0] + dx < 0:
+                dx -= bbox[0] + dx
+            elif bbox[2] + dx > x2_max:
+                dx -= bbox[2] + dx - x2_max
+            self.x += dx
+            self.render.move(self.id, dx, 0)
+
+    def fire(self) -> None:
+        if self.isAlive() and self.bullet is None:
+            self.bullet = Bullet(self.render, self, self.x, self.bbox()[1] - Images.bullet.height / 2)
+            self.render.play(Sounds.defender_shoot)
+            self.render.event(EVENT_SHOT, ENTITY_BULLET, self.bullet.x, self.bullet.y)
+
+    def touched_by(self, bomb: 'Bomb') -> bool:
+        if self.isAlive() and bomb.isAlive():
+            return bbox_overlap(self.bbox(), bomb.bbox())
+        return False
+
+class Bullet:
+    def __init__(self, render: Render, defender: Defender, x: float, y: float) -> None:
+        self.render = render
+        self.defender = defender
+        self.image = render.photo(Images.bullet)
+        self.image_explosion = render.photo(Images.bullet_explosion)
+        self.width, self.height = Images.bullet.size
+        self.delta_y = 18 * Scale.speed
+        self.alive = True
+        self.explodes = False
+        self.explosion_ticks = 0
+        self.x = x
+        self.y = y
+        self.id = self._create_id()
+
+    def _create_id(self) -> int:
+        return self.render.create_image(self.x, self.y, image=self.image)
+
+    def bbox(self) -> BBox:
+        return get_bbox(self.x, self.y, self.width, self.height)
+
+    def isAlive(self) -> bool:
+        return self.alive and not self.explodes
+
+    def kill(self) -> None:
+        if self.alive:
+            self.alive = False
+            self.render.delete(self.id)
+            self.defender.bullet = None
+
+    def explode(self) -> None:
+        if self.isAlive():
+            self.explodes = True
+            self.explosion_ticks = EXPLOSION_TICKS
+            self.render.itemconfigure(self.id, image=self.image_explosion)
+            self.render.event(EVENT_EXPLOSION, ENTITY_BULLET, self.x, self.y)
+
+    def update(self) -> bool:
+        if self.alive and self.explodes:
+            self.explosion_ticks -= 1
+            if self.explosion_ticks > 0:
+                return True
+            self.kill()
+        return False
+
+    def restore(self, x: float, y: float, state: int, explosion_ticks: int) -> None:
+        self.render.move(self.id, x - self.x, y - self.y)
+        self.x = x
+        self.y = y
+        self.explodes = state & EXPLODES != 0
+        self.explosion_ticks = explosion_ticks
+        self.render.itemconfigure(self.id, image=self.image_explosion if self.explodes else self.image)
+
+    def move(self) -> None:
+        if self.isAlive():
+            if self.bbox()[1] > self.delta_y:
+                self.y -= self.delta_y
+                self.render.move(self.id, 0, -self.delta_y)
+            else:
+                self.explode()
+
+class Alien:
+    def __init__(self, render: Render, fleet: 'Fleet', x: float, y: float, frames: List[Any], kind: str, worth: int, index: int) -> None:
+        self.render = render
+        self.fleet = fleet
+        self.index = index  # in fleet.aliens, row by row
+        self.start_pos = x, y
+        self.frames = render.photos(frames)
+        self.image_explosion = render.photo(Images.alien_explosion)
+        self.width, self.height = frames[0].size
+        self.kind = kind
+        self.worth = worth
+        self.alive = True
+        self.explodes = False
+        self.explosion_ticks = 0
+        self.id = self._create_id()
+
+    def _create_id(self) -> int:
+        # Tagged by the fleet to be moved, and by kind to be animated, all at once
+        return self.render.create_image(*self.start_pos, image=self.frames[0], tags=(self.fleet.tag, self.kind))
+
+    # Follows the fleet without being moved alien by alien
+    @property
+    def x(self) -> float: return self.start_pos[0] + self.fleet.offset_x
+
+    @property
+    def y(self) -> float: return self.start_pos[1] + self.fleet.offset_y
+
+    def bbox(self) -> BBox:
+        return get_bbox(self.x, self.y, self.width, self.height)
+
+    def isAlive(self) -> bool:
+        return self.alive and not self.explodes
+
+    def reset(self) -> None:
+        # The fleet shows the canvas items again for a new wave
+        self.alive = True
+        self.explodes = False
+        self.explosion_ticks = 0
+
+    def kill(self) -> None:
+        if self.alive:
+            self.alive = False
+            self.render.itemconfigure(self.id, state='hidden')
+
+    def explode(self) -> None:
+        if self.isAlive():
+            self.explodes = True
+            self.explosion_ticks = EXPLOSION_TICKS
+            self.render.itemconfigure(self.id, image=self.image_explosion)
+            self.render.event(EVENT_EXPLOSION, ENTITY_ALIEN, self.x, self.y)
+
+    def update(self) -> bool:
+        if self.alive and self.explodes:
+            self.explosion_ticks -= 1
+            if self.explosion_ticks > 0:
+                return True
+            self.kill()
+        return False
+
+    def restore(self, state: int, frame: int) -> None:
+        # The canvas item is only changed when it looks different
+        alive = state & ALIVE != 0
+        explodes = state & EXPLODES != 0
+        self.explosion_ticks = state >> 2
+        if alive != self.alive or explodes != self.explodes:
+            self.alive = alive
+            self.explodes = explodes
+            self.render.itemconfigure(self.id, state='normal' if alive else 'hidden', image=self.image_explosion if explodes else self.frames[frame])
+
+    def touched_by(self, bullet: Bullet) -> bool:
+        if self.isAlive() and bullet.isAlive():
+            return bbox_overlap(self.bbox(), bullet.bbox())
+        return False
+
+class Bomb:
+    def __init__(self, render: Render, fleet: 'Fleet', kind: int, x: float, y: float) -> None:
+        self.render = render
+        self.fleet = fleet
+        self.current_frame = 0
+        self.kind = kind
+        self.frames = render.photos(Bomb.get_frames(kind))
+        self.image_explosion = render.photo(Images.bomb_explosion)
+        self.width, self.height = Bomb.get_frames(kind)[0].size
+        self.delta_y = 8 * Scale.speed
+        self.alive = True
+        self.explodes = False
+        self.explosion_ticks = 0
+        self.x = x
+        self.y = y
+        self.id = self._create_id()
+
+    def _create_id(self) -> int:
+        return self.render.create_image(self.x, self.y, image=self.frames[0])
+
+    def bbox(self) -> BBox:
+        return get_bbox(self.x, self.y, self.width, self.height)
+
+    def isAlive(self) -> bool:
+        return self.alive and not self.explodes
+
+    def kill(self) -> None:
+        if self.alive:
+            self.alive = False
+            self.render.delete(self.id)
+            self.fleet.dropped_bombs.remove(self)
+
+    def explode(self) -> None:
+        if self.isAlive():
+            self.explodes = True
+            self.explosion_ticks = EXPLOSION_TICKS
+            self.render.itemconfigure(self.id, image=self.image_explosion)
+            self.render.event(EVENT_EXPLOSION, ENTITY_BOMB, self.x, self.y)
+
+    def update(self) -> bool:
+        if self.alive and self.explodes:
+            self.explosion_ticks -= 1
+            if self.explosion_ticks > 0:
+                return True
+            self.kill()
+        return False
+
+    def restore(self, kind: int, x: float, y: float, current_frame: int, state: int, explosion_ticks: int) -> None:
+        if kind != self.kind:
+            self.kind = kind
+            self.frames = self.render.photos(Bomb.get_frames(kind))
+            self.width, self.height = Bomb.get_frames(kind)[0].size
+        self.render.move(self.id, x - self.x, y - self.y)
+        self.x = x
+        self.y = y
+        self.current_frame = current_frame
+        self.explodes = state & EXPLODES != 0
+        self.explosion_ticks = explosion_ticks
+        self.render.itemconfigure(self.id, image=self.image_explosion if self.explodes else self.frames[current_frame])
+
+    def move(self) -> None:
+        if self.isAlive():
+            if self.bbox()[3] + self.delta_y < self.render.height:
+                self.y += self.delta_y
+                self.render.move(self.id, 0, self.delta_y)
+            else:
+                self.explode()
+
+    def animate(self) -> None:
+        if self.isAlive():
+            self.current_frame = (self.current_frame + 1) % len(self.frames)
+            self.render.itemconfigure(self.id, image=self.frames[self.current_frame])
+
+    @staticmethod
+    def get_frames(kind: int) -> List[Any]:
+        return [Images.bomb_1, Images.bomb_2, Images.bomb_3][kind]
+
+class Fleet:
+    # Size of the fleets to come, see set_fleet_size
+    rows: ClassVar[int] = FLEET_ROWS
+    columns: ClassVar[int] = FLEET_COLUMNS
+
+    def __init__(self, render: Render, seed: int) -> None:
+        self.render = render
+        self.random = XorShift(seed)
+        self.delta_y = 15 * Scale.speed
+        self.animation_ticks = 0
+        self.current_frame = 0
+        self.current_sound = 0
+        self.dropped_bombs: List[Bomb] = []
+        self.dropped_bombs_ticks = 0
+        self.tag = 'fleet'
+        self.nb_rows = Fleet.rows
+        self.nb_columns = Fleet.columns
+        self.kinds: Dict[str, List[Any]] = {}
+        self.aliens = self._create_fleet()
+        # Top of each row at the start, a row is as high as its aliens plus the inner gap
+        self.row_tops = [Fleet.get_start_pos(row, 0)[1] - Fleet.get_row_type(row)[2][0].height / 2 for row in range(self.nb_rows)]
+        self.alive_count = len(self.aliens)
+        self.exploding: List[Alien] = []
+        # Bbox of the aliens shown at their start positions, computed again once one is killed
+        self.start_bbox: Optional[BBox] = None
+        self.start_bbox_valid = False
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.wave = 1
+        self._set_difficulty()
+
+    def _set_difficulty(self) -> None:
+        # Each wave moves, animates and bombs faster than the previous one
+        level = self.wave - 1
+        self.delta_x = min(3 + level, 9) * Scale.speed
+        self.animation_delay = round(max(800 - 100 * level, 200) / TICK_DELAY)
+        self.dropped_bombs_max = min(3 + level // 2, 6)
+        self.dropped_bombs_delay = round(max(400 - 50 * level, 100) / TICK_DELAY)
+
+    def _create_fleet(self) -> List[Alien]:
+        aliens: List[Alien] = []
+        for row in range(self.nb_rows):
+            kind, worth, frames = Fleet.get_row_type(row)
+            self.kinds[kind] = self.render.photos(frames)
+            for column in range(self.nb_columns):
+                x, y = Fleet.get_start_pos(row, column)
+                alien = Alien(self.render, self, x, y, frames, kind, worth, len(aliens))
+                aliens.append(alien)
+        return aliens
+
+    def lowest_aliens(self) -> List[Alien]:
+        # The ones able to drop bombs, column by column
+        lowest_aliens = []
+        for column in range(self.nb_columns):
+            for row in range(self.nb_rows - 1, -1, -1):
+                alien = self.aliens[self.nb_columns * row + column]
+                if alien.isAlive():
+                    lowest_aliens.append(alien)
+                    break
+        return lowest_aliens
+
+    def _rand_bomb_drop(self) -> None:
+        if self.dropped_bombs_ticks > 0:
+            self.dropped_bombs_ticks -= 1
+        if len(self.dropped_bombs) < self.dropped_bombs_max and self.dropped_bombs_ticks == 0:
+            lowest_aliens = self.lowest_aliens()
+            if lowest_aliens != []:
+                selected_aliens = self.random.sample(lowest_aliens, self.random.randrange(0, min(len(lowest_aliens), self.dropped_bombs_max - len(self.dropped_bombs)) + 1))
+                for alien in selected_aliens:
+                    kind = self.random.randrange(3)
+                    y = alien.bbox()[3] + Bomb.get_frames(kind)[0].height / 2
+                    self.dropped_bombs.append(Bomb(self.render, self, kind, alien.x, y))
+                    self.render.event(EVENT_BOMB_DROP, ENTITY_BOMB, alien.x, y, kind, alien.index)
+                self.dropped_bombs_ticks = self.dropped_bombs_delay
+
+    def bbox(self) -> Optional[BBox]:
+        # Only the aliens still shown, None once they are all killed
+        if not self.start_bbox_valid:
+            bboxes = [get_bbox(*alien.start_pos, alien.width, alien.height) for alien in self.aliens if alien.alive]
+            self.start_bbox = (min(b[0] for b in bboxes), min(b[1] for b in bboxes), max(b[2] for b in bboxes), max(b[3] for b in bboxes)) if bboxes else None
+            self.start_bbox_valid = True
+        if self.start_bbox is None:
+            return None
+        x1, y1, x2, y2 = self.start_bbox
+        return x1 + self.offset_x, y1 + self.offset_y, x2 + self.offset_x, y2 + self.offset_y
+
+    def update(self) -> bool:
+        # Ends the explosions of the aliens, returns whether some are still going
+        for alien in self.exploding.copy():
+            if not alien.update():
+                self.exploding.remove(alien)
+                self.alive_count -= 1
+                self.start_bbox_valid = False
+        return len(self.exploding) > 0
+
+    def move(self) -> None:
+        bbox = self.bbox()
+        animate = self.animation_ticks <= 0
+        if bbox is not None:
+            change_direction = bbox[0] + self.delta_x <= 0 or bbox[2] + self.delta_x >= self.render.width
+            dx, dy = (0.0, self.delta_y) if change_direction else (self.delta_x, 0.0)
+            self.render.move(self.tag, dx, dy)
+            if change_direction:
+                self.offset_y += self.delta_y
+                self.delta_x = -self.delta_x
+            else:
+                self.offset_x += self.delta_x
+            if animate:
+                self.current_frame = (self.current_frame + 1) % len(Images.alien_squid)
+                self._show_frame()
+            self._rand_bomb_drop()
+        if animate:
+            self.animation_ticks = self.animation_delay
+            self.render.play(Sounds.alien_move[self.current_sound])
+            self.current_sound = (self.current_sound + 1) % len(Sounds.alien_move)
+        self.animation_ticks -= 1
+
+    def _show_frame(self) -> None:
+        # One change per kind of alien, hidden ones included, then the explosions are shown again
+        for kind, frames in self.kinds.items():
+            self.render.itemconfigure(kind, image=frames[self.current_frame])
+        for alien in self.exploding:
+            self.render.itemconfigure(alien.id, image=alien.image_explosion)
+
+    def next_wave(self) -> None:
+        self.wave += 1
+        self._set_difficulty()
+        for bomb in self.dropped_bombs.copy():
+            bomb.kill()
+        for alien in self.aliens:
+            alien.reset()
+        self.exploding.clear()
+        self.alive_count = len(self.aliens)
+        self.start_bbox_valid = False
+        self.render.move(self.tag, -self.offset_x, -self.offset_y)
+        self.render.itemconfigure(self.tag, state='normal')
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.current_frame = 0
+        self._show_frame()
+
+    def restore(self, offset_x: float, offset_y: float, delta_x: float, wave: int, current_frame: int, current_sound: int, animation_ticks: int, dropped_bombs_ticks: int, states: bytes) -> None:
+        if wave != self.wave:
+            self.wave = wave
+            self._set_difficulty()
+        self.render.move(self.tag, offset_x - self.offset_x, offset_y - self.offset_y)
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.delta_x = delta_x
+        self.current_sound = current_sound
+        self.animation_ticks = animation_ticks
+        self.dropped_bombs_ticks = dropped_bombs_ticks
+        for alien, state in zip(self.aliens, states):
+            alien.restore(state, current_frame)
+        self.exploding = [alien for alien in self.aliens if alien.alive and alien.explodes]
+        self.alive_count = sum(alien.alive for alien in self.aliens)
+        self.start_bbox_valid = False
+        if current_frame != self.current_frame:
+            self.current_frame = current_frame
+            self._show_frame()
+
+    def _aliens_near(self, bbox: BBox) -> List[Alien]:
+        # The columns around the bbox of a bullet, in the order of self.aliens
+        pitch = Fleet.get_frames_max_width() + Fleet.get_inner_gap()
+        x1, _, x2, _ = bbox
+        first = max(int((x1 - self.offset_x) // pitch) - 1, 0)
+        last = min(int((x2 - self.offset_x) // pitch) + 1, self.nb_columns - 1)
+        return [self.aliens[row * self.nb_columns + column] for row in range(self.nb_rows) for column in range(first, last + 1)]
+
+    def _aliens_at(self, bbox: BBox, pitch: float) -> List[Alien]:
+        # The cells of the fleet crossed by the bbox, one or two for a bullet, an alien does not overflow its cell
+        x1, y1, x2, y2 = bbox
+        first = max(int((x1 - self.offset_x) // pitch), 0)
+        last = min(int((x2 - self.offset_x) // pitch), self.nb_columns - 1)
+        top = max(bisect_right(self.row_tops, y1 - self.offset_y) - 1, 0)
+        bottom = bisect_right(self.row_tops, y2 - self.offset_y) - 1
+        return [self.aliens[row * self.nb_columns + column] for row in range(top, bottom + 1) for column in range(first, last + 1)]
+
+    def manage_touched_aliens_by(self, defender: Defender) -> None:
+        bullet = defender.bullet
+        if bullet is not None and bullet.isAlive():
+            bbox = self.bbox()
+            if bbox is not None and bbox_overlap(bbox, bullet.bbox()):
+                for alien in self._aliens_near(bullet.bbox()):
+                    if alien.touched_by(bullet):
+                        self._kill(alien, defender)
+                        bullet.kill()
+                        break
+
+    def manage_touched_aliens_by_projectiles(self, defender: Defender, projectiles: 'Projectiles') -> None:
+        # Same for the bullets of the spread, most of them are away from the fleet and only compared to its bbox
+        bbox = self.bbox()
+        if bbox is None:
+            return
+        x1, y1, x2, y2 = bbox
+        pitch = Fleet.get_frames_max_width() + Fleet.get_inner_gap()
+        xs, ys, kinds, explosion_ticks = projectiles.xs, projectiles.ys, projectiles.kinds, projectiles.explosion_ticks
+        half_width = projectiles.half_widths[PROJECTILE_BULLET]
+        half_height = projectiles.half_heights[PROJECTILE_BULLET]
+        touching: List[int] = []
+        for index in range(projectiles.count):
+            if kinds[index] != PROJECTILE_BULLET or explosion_ticks[index]:
+                continue
+            x = xs[index]
+            y = ys[index]
+            if x + half_width < x1 or x - half_width > x2 or y + half_height < y1 or y - half_height > y2:
+                continue
+            bullet_bbox = x - half_width, y - half_height, x + half_width, y + half_height
+            for alien in self._aliens_at(bullet_bbox, pitch):
+                if alien.isAlive() and bbox_overlap(alien.bbox(), bullet_bbox):
+                    self._kill(alien, defender)
+                    touching.append(index)
+                    break
+        # From the last one, the projectiles moved by a removal are already checked
+        for index in reversed(touching):
+            projectiles.remove(index)
+
+    def _kill(self, alien: Alien, defender: Defender) -> None:
+        self.render.play(Sounds.alien_killed)
+        self.render.event(EVENT_KILL, ENTITY_ALIEN, alien.x, alien.y, alien.worth, alien.index)
+        alien.explode()
+        self.exploding.append(alien)
+        defender.score += alien.worth
+
+    @staticmethod
+    def get_row_type(row: int) -> Tuple[str, int, List[Any]]:
+        return (
+            ('squid', 30, Images.alien_squid) if row < 1 else
+            ('crab', 20, Images.alien_crab) if row < 3 else
+            ('octopus', 10, Images.alien_octopus)
+        )
+
+    @staticmethod
+    def get_start_pos(row: int, column: int) -> Tuple[float, float]:
+        frames = Fleet.get_row_type(row)[2]
+        frames_max_width = Fleet.get_frames_max_width()
+        inner_gap = Fleet.get_inner_gap()
+        x = column * (frames_max_width + inner_gap) + frames_max_width / 2
+        y = row * (frames[0].height + inner_gap) + frames[0].height / 2
+        return x, y
+
+    @staticmethod
+    def get_inner_gap() -> float:
+        return 4 * Scale.image
+
+    @staticmethod
+    def get_frames_max_width() -> int:
+        return max(max(Images.alien_squid[0].width, Images.alien_crab[0].width), Images.alien_octopus[0].width)
+
+    @staticmethod
+    def get_width() -> float:
+        return Fleet.columns * (Fleet.get_frames_max_width() + Fleet.get_inner_gap()) - Fleet.get_inner_gap()
+
+    @staticmethod
+    def get_height() -> float:
+        height = -Fleet.get_inner_gap()
+        for row in range(Fleet.rows):
+            height += Fleet.get_row_type(row)[2][0].height + Fleet.get_inner_gap()
+        return height
+
+def set_fleet_size(rows: int, columns: int) -> None:
+    # The screens are sized after the fleet, they have to be created again
+    Fleet.rows = rows
+    Fleet.columns = columns
+
+################################################################
+#                         Projectiles                          #
+################################################################
+
+PROJECTILE_BULLET = 3   # kinds 0 to 2 are the ones of the bombs
+
+class Projectiles:
+    # Bombs and bullets of the challenge mode, hundreds of them next to the ones of the classic game
+    # One typed array per field, all moved in one pass per tick, a projectile is removed by moving the last one in its place
+    # The canvas items are kept once created, hidden until a new projectile takes them
+    def __init__(self, render: Render, capacity: int = PROJECTILES_CAPACITY) -> None:
+        self.render = render
+        self.capacity = capacity
+        self.count = 0
+        self.xs = array('d', bytes(8 * capacity))
+        self.ys = array('d', bytes(8 * capacity))
+        self.dxs = array('d', bytes(8 * capacity))
+        self.dys = array('d', bytes(8 * capacity))
+        self.kinds = array('B', bytes(capacity))
+        self.frames = array('B', bytes(capacity))
+        self.explosion_ticks = array('B', bytes(capacity))
+        self.items: List[int] = []
+        self.frame_ticks = 0
+        # By kind
+        self.sources = [Bomb.get_frames(kind) for kind in range(3)] + [[Images.bullet]]
+        self.sources_explosion = [Images.bomb_explosion] * 3 + [Images.bullet_explosion]
+        self.images = [render.photos(frames) for frames in self.sources]
+        self.images_explosion = [render.photo(image) for image in self.sources_explosion]
+        self.half_widths = [frames[0].width / 2 for frames in self.sources]
+        self.half_heights = [frames[0].height / 2 for frames in self.sources]
+
+    def add(self, kind: int, x: float, y: float, dx: float, dy: float) -> bool:
+        # Not fired once full
+        index = self.count
+        if index == self.capacity:
+            return False
+        self.xs[index] = x
+        self.ys[index] = y
+        self.dxs[index] = dx
+        self.dys[index] = dy
+        self.kinds[index] = kind
+        self.frames[index] = 0
+        self.explosion_ticks[index] = 0
+        if index < len(self.items):
+            self.render.coords(self.items[index], x, y)
+            self.render.itemconfigure(self.items[index], image=self.images[kind][0], state='normal')
+        else:
+            self.items.append(self.render.create_image(x, y, image=self.images[kind][0]))
+        self.count = index + 1
+        return True
+
+    def remove(self, index: int) -> None:
+        last = self.count - 1
+        item = self.items[index]
+        if index != last:
+            self.xs[index] = self.xs[last]
+            self.ys[index] = self.ys[last]
+            self.dxs[index] = self.dxs[last]
+            self.dys[index] = self.dys[last]
+            self.kinds[index] = self.kinds[last]
+            self.frames[index] = self.frames[last]
+            self.explosion_ticks[index] = self.explosion_ticks[last]
+            self.items[index] = self.items[last]
+            self.items[last] = item
+        self.render.itemconfigure(item, state='hidden')
+        self.count = last
+
+    def clear(self) -> None:
+        for index in range(self.count):
+            self.render.itemconfigure(self.items[index], state='hidden')
+        self.count = 0
+
+    def bbox(self, index: int) -> BBox:
+        kind = self.kinds[index]
+        x = self.xs[index]
+        y = self.ys[index]
+        half_width = self.half_widths[kind]
+        half_height = self.half_heights[kind]
+        return x - half_width, y - half_height, x + half_width, y + half_height
+
+    def get_image(self, index: int) -> Any:
+        # Source image of the projectile as shown
+        kind = self.kinds[index]
+        return self.sources_explosion[kind] if self.explosion_ticks[index] else self.sources[kind][self.frames[index]]
+
+    def explode(self, index: int) -> None:
+        if not self.explosion_ticks[index]:
+            kind = self.kinds[index]
+            self.explosion_ticks[index] = EXPLOSION_TICKS
+            self.render.itemconfigure(self.items[index], image=self.images_explosion[kind])
+            self.render.event(EVENT_EXPLOSION, ENTITY_BULLET if kind == PROJECTILE_BULLET else ENTITY_BOMB, self.xs[index], self.ys[index])
+
+    def explode_all(self) -> None:
+        for index in range(self.count):
+            self.explode(index)
+
+    def set_state(self, index: int, frame: int, explosion_ticks: int) -> None:
+        kind = self.kinds[index]
+        self.frames[index] = frame
+        self.explosion_ticks[index] = explosion_ticks
+        self.render.itemconfigure(self.items[index], image=self.images_explosion[kind] if explosion_ticks else self.images[kind][frame])
+
+    def update(self) -> bool:
+        # Ends the explosions, returns whether some are still going
+        pending = False
+        index = 0
+        while index < self.count:
+            ticks = self.explosion_ticks[index]
+            if ticks == 1:
+                # The last one takes its place and is looked at next
+                self.remove(index)
+                continue
+            if ticks:
+                self.explosion_ticks[index] = ticks - 1
+                pending = True
+            index += 1
+        return pending
+
+    def move(self) -> None:
+        # The ones leaving by a side are dropped, the others explode at the top or the bottom as the classic ones
+        render = self.render
+        width = render.width
+        height = render.height
+        xs, ys, dxs, dys, kinds, frames, items = self.xs, self.ys, self.dxs, self.dys, self.kinds, self.frames, self.items
+        explosion_ticks, half_heights, images = self.explosion_ticks, self.half_heights, self.images
+        animate = self.frame_ticks == 0
+        self.frame_ticks = (self.frame_ticks + 1) % PROJECTILE_FRAME_TICKS
+        index = 0
+        while index < self.count:
+            if explosion_ticks[index]:
+                index += 1
+                continue
+            kind = kinds[index]
+            dx = dxs[index]
+            dy = dys[index]
+            x = xs[index] + dx
+            y = ys[index] + dy
+            if x < 0 or x > width:
+                self.remove(index)
+                continue
+            half_height = half_heights[kind]
+            if y - half_height < 0 or y + half_height > height:
+                self.explode(index)
+            else:
+                xs[index] = x
+                ys[index] = y
+                render.move(items[index], dx, dy)
+                if animate and kind != PROJECTILE_BULLET:
+                    frame = (frames[index] + 1) % len(images[kind])
+                    frames[index] = frame
+                    render.itemconfigure(items[index], image=images[kind][frame])
+            index += 1
+
+    def touching(self, bbox: BBox) -> int:
+        # Index of the first bomb in flight overlapping the bbox, -1 if none
+        x1, y1, x2, y2 = bbox
+        xs, ys, kinds = self.xs, self.ys, self.kinds
+        for index in range(self.count):
+            kind = kinds[index]
+            if kind == PROJECTILE_BULLET or self.explosion_ticks[index]:
+                continue
+            half_width = self.half_widths[kind]
+            half_height = self.half_heights[kind]
+            if xs[index] + half_width >= x1 and xs[index] - half_width <= x2 and ys[index] + half_height >= y1 and ys[index] - half_height <= y2:
+                return index
+        return -1
+
+################################################################
+#                            World                             #
+################################################################
+
+# Version, image scale, aliens, tick, game over, random state
+SNAPSHOT_HEAD = Struct('<BdHIBQ')
+# x, flags, lives, score, explosion ticks
+SNAPSHOT_DEFENDER = Struct('<dBBIB')
+# Offsets, delta x, wave, frame, sound, animation and bombs ticks, followed by one byte per alien
+SNAPSHOT_FLEET = Struct('<dddHBBBB')
+# Flags (0 without bullet), x, y, explosion ticks
+SNAPSHOT_BULLET = Struct('<BddB')
+SNAPSHOT_COUNT = Struct('<B')
+# Kind, x, y, frame, flags, explosion ticks
+SNAPSHOT_BOMB = Struct('<BddBBB')
+# Challenge mode only: count, frame and barrage ticks, followed by the projectiles
+SNAPSHOT_PROJECTILES = Struct('<HBB')
+# Kind, x, y, dx, dy, frame, explosion ticks
+SNAPSHOT_PROJECTILE = Struct('<BddddBB')
+
+class World:
+    # The game without its window: ticks the entities and saves or restores them as a blob
+    def __init__(self, render: Render, seed: int, challenge: bool = False) -> None:
+        self.render = render
+        self.seed = seed
+        self.tick = 0
+        self.gameover = False
+        self.fleet = Fleet(render, seed)
+        self.defender = Defender(render)
+        self.projectiles = Projectiles(render) if challenge else None
+        self.barrage_ticks = BARRAGE_DELAY
+
+    def move_bombs(self) -> None:
+        for bomb in self.fleet.dropped_bombs:
+            if self.defender.touched_by(bomb):
+                self.render.event(EVENT_HIT, ENTITY_DEFENDER, self.defender.x, self.defender.y, bomb.kind)
+                bomb.kill()
+                self.explode_defender()
+                break
+            bomb.move()
+            bomb.animate()
+        if self.projectiles is not None:
+            self.move_projectiles(self.projectiles)
+
+    def move_projectiles(self, projectiles: Projectiles) -> None:
+        projectiles.move()
+        self.barrage(projectiles)
+        if self.defender.isAlive():
+            index = projectiles.touching(self.defender.bbox())
+            if index >= 0:
+                self.render.event(EVENT_HIT, ENTITY_DEFENDER, self.defender.x, self.defender.y, projectiles.kinds[index])
+                projectiles.remove(index)
+                self.explode_defender()
+
+    def barrage(self, projectiles: Projectiles) -> None:
+        # Some of the lowest aliens fire a fan of bombs each
+        if self.barrage_ticks > 0:
+            self.barrage_ticks -= 1
+            return
+        fleet = self.fleet
+        lowest_aliens = fleet.lowest_aliens()
+        for alien in fleet.random.sample(lowest_aliens, min(BARRAGE_ALIENS, len(lowest_aliens))):
+            kind = fleet.random.randrange(3)
+            y = alien.bbox()[3] + projectiles.half_heights[kind]
+            for index in range(BARRAGE_SPREAD):
+                projectiles.add(kind, alien.x, y, (index - (BARRAGE_SPREAD - 1) / 2) * BARRAGE_DX * Scale.speed, BARRAGE_DY * Scale.speed)
+            self.render.event(EVENT_BOMB_DROP, ENTITY_BOMB, alien.x, y, kind, alien.index)
+        self.barrage_ticks = BARRAGE_DELAY
+
+    def explode_defender(self) -> None:
+        # Everything in flight explodes with it
+        self.defender.explode()
+        if self.defender.bullet is not None:
+            self.defender.bullet.explode()
+        for bomb in self.fleet.dropped_bombs.copy():
+            bomb.explode()
+        if self.projectiles is not None:
+            self.projectiles.explode_all()
+
+    def move_aliens(self) -> None:
+        self.fleet.manage_touched_aliens_by(self.defender)
+        if self.projectiles is not None:
+            self.fleet.manage_touched_aliens_by_projectiles(self.defender, self.projectiles)
+        self.fleet.move()
+
+    def action_defender(self, left: bool, right: bool, fire: bool) -> None:
+        if left and not right:
+            self.defender.move(-self.defender.delta_x)
+        if not left and right:
+            self.defender.move(self.defender.delta_x)
+        if fire:
+            loaded = self.defender.bullet is None
+            self.defender.fire()
+            bullet = self.defender.bullet
+            if loaded and bullet is not None and self.projectiles is not None:
+                # The spread leaves with the bullet
+                for pair in range(1, SPREAD_PAIRS + 1):
+                    for side in (-1, 1):
+                        self.projectiles.add(PROJECTILE_BULLET, bullet.x, bullet.y, side * pair * SPREAD_DX * Scale.speed, -bullet.delta_y)
+
+    def move_bullet(self) -> None:
+        if self.defender.bullet is not None:
+            self.defender.bullet.move()
+
+    def check_status(self) -> None:
+        bbox_fleet = self.fleet.bbox()
+        bbox_defender = self.defender.bbox()
+        self.gameover = self.defender.lives == 0 or (bbox_fleet is not None and bbox_fleet[3] >= bbox_defender[1])
+        if not self.gameover and bbox_fleet is None:
+            self.next_wave()
+
+    def next_wave(self) -> None:
+        if self.defender.bullet is not None:
+            self.defender.bullet.kill()
+        if self.projectiles is not None:
+            self.projectiles.clear()
+        self.fleet.next_wave()
+
+    def update_timers(self) -> bool:
+        # Counts the explosions down, returns whether some are still going
+        pending = self.defender.update()
+        if self.defender.bullet is not None:
+            pending = self.defender.bullet.update() or pending
+        for bomb in self.fleet.dropped_bombs.copy():
+            pending = bomb.update() or pending
+        if self.projectiles is not None:
+            pending = self.projectiles.update() or pending
+        pending = self.fleet.update() or pending
+        return pending
+
+    def step(self, left: bool = False, right: bool = False, fire: bool = False) -> bool:
+        # Same tick as Game.MainGame.step, without the metrics and the window
+        self.update_timers()
+        if not self.defender.explodes:
+            self.move_bombs()
+            self.move_aliens()
+            self.move_bullet()
+            self.action_defender(left, right, fire)
+            self.check_status()
+        self.tick += 1
+        return not self.gameover
+
+    def save(self) -> bytes:
+        defender = self.defender
+        fleet = self.fleet
+        bullet = defender.bullet
+        parts = [
+            SNAPSHOT_HEAD.pack(SNAPSHOT_VERSION, Scale.image, len(fleet.aliens), self.tick, self.gameover, fleet.random.state),
+            SNAPSHOT_DEFENDER.pack(defender.x, flags(defender), defender.lives, defender.score, defender.explosion_ticks),
+            SNAPSHOT_FLEET.pack(fleet.offset_x, fleet.offset_y, fleet.delta_x, fleet.wave, fleet.current_frame, fleet.current_sound, fleet.animation_ticks, fleet.dropped_bombs_ticks),
+            bytes([flags(alien) | alien.explosion_ticks << 2 for alien in fleet.aliens]),
+            SNAPSHOT_BULLET.pack(0, 0, 0, 0) if bullet is None else SNAPSHOT_BULLET.pack(flags(bullet), bullet.x, bullet.y, bullet.explosion_ticks),
+            SNAPSHOT_COUNT.pack(len(fleet.dropped_bombs))
+        ]
+        for bomb in fleet.dropped_bombs:
+            parts.append(SNAPSHOT_BOMB.pack(bomb.kind, bomb.x, bomb.y, bomb.current_frame, flags(bomb), bomb.explosion_ticks))
+        projectiles = self.projectiles
+        if projectiles is not None:
+            parts.append(SNAPSHOT_PROJECTILES.pack(projectiles.count, projectiles.frame_ticks, self.barrage_ticks))
+            for index in range(projectiles.count):
+                parts.append(SNAPSHOT_PROJECTILE.pack(
+                    projectiles.kinds[index], projectiles.xs[index], projectiles.ys[index], projectiles.dxs[index], projectiles.dys[index],
+                    projectiles.frames[index], projectiles.explosion_ticks[index]
+                ))
+        return b''.join(parts)
+
+    def restore(self, data: bytes) -> None:
+        defender = self.defender
+        fleet = self.fleet
+        version, image_scale, nb_aliens, tick, gameover, state = SNAPSHOT_HEAD.unpack_from(data)
+        if version != SNAPSHOT_VERSION or image_scale != Scale.image or nb_aliens != len(fleet.aliens):
+            raise ValueError("The snapshot was not taken from a game like this one")
+        self.tick = tick
+        self.gameover = gameover != 0
+        fleet.random.state = state
+        offset = SNAPSHOT_HEAD.size
+        defender.restore(*SNAPSHOT_DEFENDER.unpack_from(data, offset))
+        offset += SNAPSHOT_DEFENDER.size
+        offset_x, offset_y, delta_x, wave, current_frame, current_sound, animation_ticks, dropped_bombs_ticks = SNAPSHOT_FLEET.unpack_from(data, offset)
+        states = data[offset + SNAPSHOT_FLEET.size:offset + SNAPSHOT_FLEET.size + nb_aliens]
+        fleet.restore(offset_x, offset_y, delta_x, wave, current_frame, current_sound, animation_ticks, dropped_bombs_ticks, states)
+        offset += SNAPSHOT_FLEET.size + nb_aliens
+        bullet_flags, x, y, explosion_ticks = SNAPSHOT_BULLET.unpack_from(data, offset)
+        offset += SNAPSHOT_BULLET.size
+        # The bullet and the bombs already shown are reused
+        if not bullet_flags:
+            if defender.bullet is not None:
+                defender.bullet.kill()
+        else:
+            if defender.bullet is None:
+                defender.bullet = Bullet(self.render, defender, x, y)
+            defender.bullet.restore(x, y, bullet_flags, explosion_ticks)
+        count, = SNAPSHOT_COUNT.unpack_from(data, offset)
+        offset += SNAPSHOT_COUNT.size
+        for bomb in fleet.dropped_bombs[count:]:
+            bomb.kill()
+        for index in range(count):
+            kind, x, y, current_frame, bomb_flags, explosion_ticks = SNAPSHOT_BOMB.unpack_from(data, offset)
+            offset += SNAPSHOT_BOMB.size
+            if index == len(fleet.dropped_bombs):
+                fleet.dropped_bombs.append(Bomb(self.render, fleet, kind, x, y))
+            fleet.dropped_bombs[index].restore(kind, x, y, current_frame, bomb_flags, explosion_ticks)
+        projectiles = self.projectiles
+        # Only the snapshots of the challenge mode go on with the projectiles
+        if (projectiles is None) != (offset == len(data)):
+            raise ValueError("The snapshot was not taken from a game of this mode")
+        if projectiles is not None:
+            # The canvas items are taken again in the same order
+            count, projectiles.frame_ticks, self.barrage_ticks = SNAPSHOT_PROJECTILES.unpack_from(data, offset)
+            offset += SNAPSHOT_PROJECTILES.size
+            projectiles.clear()
+            for index in range(count):
+                kind, x, y, dx, dy, current_frame, explosion_ticks = SNAPSHOT_PROJECTILE.unpack_from(data, offset)
+                offset += SNAPSHOT_PROJECTILE.size
+                projectiles.add(kind, x, y, dx, dy)
+                projectiles.set_state(index, current_frame, explosion_ticks)
+
+    def clone(self) -> 'World':
+        # A copy without a window for what-if rollouts, restoring into the same clone is cheaper
+        world = World(NullRender(self.render.width, self.render.height), self.seed, self.projectiles is not None)
+        world.restore(self.save())
+        return world
+
+    @staticmethod
+    def headless(seed: int, challenge: bool = False) -> 'World':
+        return World(NullRender(*World.get_size()), seed, challenge)
+
+    @staticmethod
+    def get_size() -> Tuple[float, float]:
+        return Fleet.get_width() * 1.5, Fleet.get_height() * 2.5
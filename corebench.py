@@ -0,0 +1,98 @@
+from argparse import ArgumentParser
+from hashlib import blake2b
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import abspath, dirname
+from subprocess import run
+from sys import executable, exit, modules
+from time import perf_counter
+from typing import List, NamedTuple
+
+# Plays the same headless games with the pure Python core and with the one compiled by build_core.py
+# Compares the tick throughput, and the snapshots of every tick which have to be the same
+
+################################################################
+#                           Configs                            #
+################################################################
+
+BASE_PATH = abspath(dirname(__file__))
+SIZES = [55, 500, 2000]     # aliens per fleet
+TICKS = 3000                # per fleet size
+SEED = 1
+VARIANTS = ['pure', 'compiled']
+
+################################################################
+#                            Bench                             #
+################################################################
+
+class Result(NamedTuple):
+    variant: str
+    aliens: int
+    ticks: int
+    seconds: float
+    digest: str
+
+def load_core(variant: str) -> None:
+    # Before the game imports it, core.py is found first for the pure variant, the extension otherwise
+    if variant == 'pure':
+        spec = spec_from_file_location('core', BASE_PATH + '/core.py')
+        module = module_from_spec(spec)
+        modules['core'] = module
+        spec.loader.exec_module(module)
+    else:
+        import core
+        if core.__file__.endswith('.py'):
+            exit("core.py is not compiled, run python build_core.py first")
+
+def play(variant: str, aliens: int, ticks: int) -> Result:
+    # Ticks of the autopilot, a new game with the next seed after each game over
+    load_core(variant)
+    from spaceinvaders import World, set_fleet_size
+    from stress import HeadlessGame, fleet_shape
+    from soak import Autopilot
+    set_fleet_size(*fleet_shape(aliens))
+    seed = SEED
+    game = HeadlessGame(World.headless(seed))
+    autopilot = Autopilot(game)
+    digest = blake2b(digest_size=16)
+    seconds = 0.0
+    for _ in range(ticks):
+        if game.world.gameover:
+            seed += 1
+            game = HeadlessGame(World.headless(seed))
+            autopilot = Autopilot(game)
+        autopilot.drive()
+        start = perf_counter()
+        game.world.step(game.left_key_pressed, game.right_key_pressed, game.space_key_pressed)
+        seconds += perf_counter() - start
+        digest.update(game.world.save())
+    return Result(variant, len(game.world.fleet.aliens), ticks, seconds, digest.hexdigest())
+
+def play_apart(variant: str, aliens: int, ticks: int) -> Result:
+    # Each variant in a process of its own, both cannot be imported as core in the same one
+    output = run([executable, __file__, str(aliens), '--ticks', str(ticks), '--variant', variant], capture_output=True, text=True, check=True).stdout
+    name, nb_aliens, nb_ticks, seconds, digest = output.split()
+    return Result(name, int(nb_aliens), int(nb_ticks), float(seconds), digest)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compares the headless ticks of the pure Python and the compiled core")
+    parser.add_argument('sizes', type=int, nargs='*', default=SIZES, help="aliens per fleet, rounded up to full rows")
+    parser.add_argument('--ticks', type=int, default=TICKS, help="ticks played per size")
+    parser.add_argument('--variant', choices=VARIANTS, help="plays one size with one variant only, in this process")
+    args = parser.parse_args()
+    if args.variant is not None:
+        r = play(args.variant, args.sizes[0], args.ticks)
+        print(r.variant, r.aliens, r.ticks, repr(r.seconds), r.digest)
+        exit(0)
+    mismatches: List[int] = []
+    for size in args.sizes:
+        pure, compiled = (play_apart(variant, size, args.ticks) for variant in VARIANTS)
+        same = pure.digest == compiled.digest
+        if not same:
+            mismatches.append(pure.aliens)
+        print("%6d aliens: pure %8.0f ticks/s, compiled %8.0f ticks/s, x%.2f, snapshots %s" % (
+            pure.aliens, pure.ticks / pure.seconds, compiled.ticks / compiled.seconds,
+            pure.seconds / compiled.seconds, 'identical' if same else 'DIFFERENT'
+        ))
+    for aliens in mismatches:
+        print("The compiled core plays differently with %d aliens" % aliens)
+    exit(1 if mismatches else 0)
@@ -0,0 +1,137 @@
+from argparse import ArgumentParser
+from collections import Counter
+from gc import get_objects
+from leaderboard import MEMORY_PATH
+from PIL import ImageTk
+from soak import Soak
+from spaceinvaders import SpaceInvaders
+from sys import exit
+from time import time
+from tkinter import Canvas
+from typing import Dict, List, NamedTuple, Optional
+import tracemalloc
+
+################################################################
+#                           Configs                            #
+################################################################
+
+INTERVAL = 30.0         # s between two samples
+TRACEBACK_DEPTH = 8
+TOP_SITES = 10
+
+# Growth allowed since the baseline (the first sample, taken after the warm-up)
+MAX_MEMORY_GROWTH = 4 * 1024 * 1024
+MAX_IMAGES_GROWTH = 50
+MAX_ITEMS_GROWTH = 50
+
+################################################################
+#                         Diagnostics                          #
+################################################################
+
+class Sample(NamedTuple):
+    time: float
+    memory: int
+    tk_images: int
+    tk_pixels: int
+    photoimages: int
+    items: Dict[str, int]
+
+class LeakDetector:
+    def __init__(self, app: SpaceInvaders, interval: float = INTERVAL, max_memory_growth: int = MAX_MEMORY_GROWTH, max_images_growth: int = MAX_IMAGES_GROWTH, max_items_growth: int = MAX_ITEMS_GROWTH) -> None:
+        self.app = app
+        self.interval = interval
+        self.max_memory_growth = max_memory_growth
+        self.max_images_growth = max_images_growth
+        self.max_items_growth = max_items_growth
+        self.baseline: Optional[Sample] = None
+        self.baseline_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.failures: List[str] = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_DEPTH)
+
+    def start(self) -> None:
+        self.app.after(int(self.interval * 1000), self.check)
+
+    def canvases(self) -> Dict[str, Canvas]:
+        game = self.app.game
+        return {'top_bar': game.top_bar, 'menu_play': game.menu_play, 'main_game': game.main_game}
+
+    def sample(self) -> Sample:
+        items: Counter[str] = Counter()
+        for name, canvas in self.canvases().items():
+            for item in canvas.find_all():
+                tags = canvas.gettags(item)
+                for tag in tags or ('',):
+                    items['%s:%s' % (name, tag)] += 1
+        images = self.app.tk.splitlist(self.app.tk.call('image', 'names'))
+        pixels = sum(int(self.app.tk.call('image', 'width', image)) * int(self.app.tk.call('image', 'height', image)) for image in images)
+        photoimages = sum(isinstance(obj, ImageTk.PhotoImage) for obj in get_objects())
+        return Sample(time(), tracemalloc.get_traced_memory()[0], len(images), pixels, photoimages, dict(items))
+
+    def snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')
+        ))
+
+    def check(self) -> None:
+        sample = self.sample()
+        snapshot = self.snapshot()
+        if self.baseline is None or self.baseline_snapshot is None:
+            self.baseline, self.baseline_snapshot = sample, snapshot
+        else:
+            self.report(sample, snapshot)
+            if self.failures:
+                # The loop ends as when the window is closed, the caller looks at the failures once it returns
+                print("Leak detected:\n  " + "\n  ".join(self.failures))
+                self.app.destroy()
+                return
+        self.app.after(int(self.interval * 1000), self.check)
+
+    def report(self, sample: Sample, snapshot: tracemalloc.Snapshot) -> None:
+        assert self.baseline is not None and self.baseline_snapshot is not None
+        base = self.baseline
+        memory_growth = sample.memory - base.memory
+        images_growth = sample.tk_images - base.tk_images
+        print("[%6.0fs] memory %+d B, Tk images %d (%+d, %d px), PhotoImages %d (%+d)" % (
+            sample.time - base.time, memory_growth, sample.tk_images, images_growth, sample.tk_pixels,
+            sample.photoimages, sample.photoimages - base.photoimages
+        ))
+        for tag in sorted(set(sample.items) | set(base.items)):
+            growth = sample.items.get(tag, 0) - base.items.get(tag, 0)
+            if growth:
+                print("  items %s: %d (%+d)" % (tag, sample.items.get(tag, 0), growth))
+                if growth > self.max_items_growth:
+                    self.failures.append("canvas items %s grew by %d" % (tag, growth))
+        for stat in snapshot.compare_to(self.baseline_snapshot, 'lineno')[:TOP_SITES]:
+            if stat.size_diff > 0:
+                print("  %+d B (%+d blocks) at %s" % (stat.size_diff, stat.count_diff, stat.traceback))
+        if memory_growth > self.max_memory_growth:
+            self.failures.append("traced memory grew by %d B" % memory_growth)
+        if images_growth > self.max_images_growth:
+            self.failures.append("Tk images grew by %d" % images_growth)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Plays the game while watching for leaking images, canvas items and memory")
+    parser.add_argument('--interval', type=float, default=INTERVAL, help="seconds between two samples")
+    parser.add_argument('--duration', type=float, default=0, help="seconds before a successful exit, 0 to run until closed")
+    parser.add_argument('--max-memory-growth', type=int, default=MAX_MEMORY_GROWTH, help="bytes")
+    parser.add_argument('--max-images-growth', type=int, default=MAX_IMAGES_GROWTH)
+    parser.add_argument('--max-items-growth', type=int, default=MAX_ITEMS_GROWTH)
+    parser.add_argument('--manual', action='store_true', help="lets you play instead of the autopilot of soak.py")
+    args = parser.parse_args()
+    app = SpaceInvaders(leaderboard_path=MEMORY_PATH, event_log_path=None)
+    detector = LeakDetector(app, args.interval, args.max_memory_growth, args.max_images_growth, args.max_items_growth)
+    detector.start()
+    soak = None
+    if not args.manual:
+        # Games are played, the checks see what the gameplay allocates and not only the menu
+        soak = Soak(app, args.duration, args.interval)
+        soak.start()
+    elif args.duration:
+        app.after(int(args.duration * 1000), app.destroy)
+    app.play()
+    if soak is not None and soak.failures:
+        print("Soak failed:\n  " + "\n  ".join(soak.failures))
+    exit(1 if detector.failures or (soak is not None and soak.failures) else 0)
@@ -0,0 +1,272 @@
+from argparse import ArgumentParser
+from array import array
+from collections import Counter
+from core import EVENT_BOMB_DROP, EVENT_HIT, EVENT_KILL, EVENT_NAMES, EVENT_SHOT, EventListener
+from glob import glob
+from os import makedirs, replace
+from os.path import abspath, dirname, join
+from queue import Queue
+from random import getrandbits
+from shutil import rmtree
+from sys import byteorder
+from tempfile import mkdtemp
+from threading import Thread
+from time import perf_counter
+from timeit import repeat
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    # Only needed to load the logs
+    import numpy as np
+except ImportError:
+    np = None
+
+################################################################
+#                           Configs                            #
+################################################################
+
+EVENTS_PATH = abspath(dirname(__file__)) + '/events'
+CHUNK_EVENTS = 64 * 1024    # per column buffer, written out once full and at the end of each game
+LOGGED = frozenset([EVENT_KILL, EVENT_BOMB_DROP, EVENT_HIT, EVENT_SHOT])
+
+# Name and array typecode of each column, the row and column of the alien are -1 for events without one
+COLUMNS = [
+    ('session', 'Q'), ('tick', 'I'), ('kind', 'B'), ('entity', 'B'), ('x', 'f'), ('y', 'f'),
+    ('value', 'H'), ('row', 'h'), ('column', 'h')
+]
+# Last column written of a chunk, the chunks without it are not complete yet
+LAST_COLUMN = COLUMNS[-1][0]
+# Kept while logging, the alien index is split into its row and column when the chunk is written
+BUFFERS = COLUMNS[:-2] + [('index', 'h')]
+
+################################################################
+#                            Files                             #
+################################################################
+
+def get_npy_header(typecode: str, length: int) -> bytes:
+    # Version 1.0 of the .npy format, for a 1-d array written straight from an array.array
+    itemsize = array(typecode).itemsize
+    kind = 'f' if typecode in 'fd' else 'u' if typecode.isupper() else 'i'
+    descr = '|%s%d' % (kind, itemsize) if itemsize == 1 else '%s%s%d' % ('<' if byteorder == 'little' else '>', kind, itemsize)
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    # Magic, version and length take 10 bytes, the data starts on 64 bytes
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin-1')
+
+def write_chunk(prefix: str, columns: List[Tuple[str, str, bytes]]) -> None:
+    makedirs(dirname(prefix), exist_ok=True)
+    for name, typecode, data in columns:
+        path = '%s.%s.npy' % (prefix, name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(get_npy_header(typecode, len(data) // array(typecode).itemsize))
+            file.write(data)
+        replace(path + '.tmp', path)
+
+################################################################
+#                            Logger                            #
+################################################################
+
+class EventLog:
+    # Every kill, bomb drop, hit and shot of the games, one preallocated typed array per column
+    # Full chunks are written by a thread of their own, as one .npy file per column
+    def __init__(self, path: str, chunk_events: int = CHUNK_EVENTS) -> None:
+        self.path = path
+        self.chunk_events = chunk_events
+        self.buffers: List[array] = [array(typecode, bytes(array(typecode).itemsize * chunk_events)) for _, typecode in BUFFERS]
+        # The session is the same for a whole chunk, its column is only filled when written
+        self.sessions = self.buffers[0]
+        self.count = 0
+        self.logged = 0     # all the events, written or not
+        self.nb_columns = 1
+        self.session = 0
+        self.chunk = 0
+        self.queue: 'Queue[Optional[Tuple[str, List[Tuple[str, str, bytes]]]]]' = Queue()
+        self.thread = Thread(target=self._write, name='event-log', daemon=True)
+        self.thread.start()
+
+    def attach(self, world: Any) -> None:
+        # A new session for the game of the world, the events of the previous one are written out
+        self.flush()
+        self.nb_columns = world.fleet.nb_columns
+        self.session = getrandbits(63)
+        self.chunk = 0
+        world.render.listeners.append(self.listener(world))
+
+    def listener(self, world: Any) -> EventListener:
+        # Called for every event of the game: the buffers and the world are bound once here rather than looked up on each call
+        _, ticks, kinds, entities, xs, ys, values, indexes = self.buffers
+        chunk_events = self.chunk_events
+
+        def event(kind: int, entity: int, x: float, y: float, value: int = 0, index: int = -1) -> None:
+            if kind in LOGGED:
+                n = self.count
+                ticks[n] = world.tick
+                kinds[n] = kind
+                entities[n] = entity
+                xs[n] = x
+                ys[n] = y
+                values[n] = value
+                indexes[n] = index
+                n += 1
+                self.count = n
+                if n == chunk_events:
+                    self.flush()
+        return event
+
+    def flush(self) -> None:
+        # The buffers are copied here and used again right away
+        count = self.count
+        if count:
+            self.sessions[:count] = array('Q', [self.session]) * count
+            prefix = join(self.path, '%016x-%04d' % (self.session, self.chunk))
+            data = [(name, typecode, buffer[:count].tobytes()) for (name, typecode), buffer in zip(BUFFERS[:-1], self.buffers)]
+            indexes, nb_columns = self.buffers[-1][:count], self.nb_columns
+            data.append(('row', 'h', array('h', [index // nb_columns if index >= 0 else -1 for index in indexes]).tobytes()))
+            data.append(('column', 'h', array('h', [index % nb_columns if index >= 0 else -1 for index in indexes]).tobytes()))
+            self.queue.put((prefix, data))
+            self.logged += count
+            self.chunk += 1
+            self.count = 0
+
+    def _write(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                write_chunk(*item)
+            except OSError as e:
+                print("Could not write the events to %s: %s" % (item[0], e))
+
+    def close(self) -> None:
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+################################################################
+#                            Loader                            #
+################################################################
+
+class EventLogReader:
+    # The chunks of a directory memory-mapped, the pages of a column are read when a query needs them
+    def __init__(self, path: str = EVENTS_PATH) -> None:
+        if np is None:
+            raise ImportError("Loading the events needs numpy: pip install numpy")
+        prefixes = sorted(p[:-len('.%s.npy' % LAST_COLUMN)] for p in glob(join(path, '*.%s.npy' % LAST_COLUMN)))
+        self.chunks: List[Dict[str, 'np.ndarray']] = [
+            {name: np.load('%s.%s.npy' % (prefix, name), mmap_mode='r') for name, _ in COLUMNS}
+            for prefix in prefixes
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(chunk['tick']) for chunk in self.chunks)
+
+    def column(self, name: str) -> 'np.ndarray':
+        # All the chunks in one array
+        if not self.chunks:
+            return np.empty(0, np.dtype(dict(COLUMNS)[name]))
+        return np.concatenate([chunk[name] for chunk in self.chunks])
+
+    def columns(self, *names: str) -> List['np.ndarray']:
+        return [self.column(name) for name in names]
+
+def report(reader: EventLogReader) -> None:
+    from spaceinvaders import Fleet
+    session, kind, value, row, column = reader.columns('session', 'kind', 'value', 'row', 'column')
+    sessions = np.unique(session)
+    print("%d events of %d sessions in %d chunks" % (len(kind), len(sessions), len(reader.chunks)))
+    counts = Counter(dict(zip(*np.unique(kind, return_counts=True))))
+    print("Events: " + ', '.join('%s %d' % (EVENT_NAMES.get(int(k), str(k)), n) for k, n in counts.most_common()))
+    kills = kind == EVENT_KILL
+    if kills.any():
+        print("\nKills by alien type")
+        rows, kills_by_row = np.unique(row[kills], return_counts=True)
+        by_type: Counter = Counter()
+        for r, n in zip(rows, kills_by_row):
+            by_type[Fleet.get_row_type(int(r))[0]] += int(n)
+        for name, n in by_type.most_common():
+            print("%10s %8d" % (name, n))
+        print("%10s %8d points" % ('total', int(value[kills].sum(dtype=np.int64))))
+    drops = kind == EVENT_BOMB_DROP
+    if drops.any():
+        print("\nBomb drops by column of the fleet")
+        columns, drops_by_column = np.unique(column[drops], return_counts=True)
+        print('  '.join('%d:%d' % (int(c), int(n)) for c, n in zip(columns, drops_by_column)))
+    shots, hits = int((kind == EVENT_SHOT).sum()), int((kind == EVENT_HIT).sum())
+    print("\n%.1f shots, %.1f kills and %.2f hits per session, %.1f%% of the shots kill" % (
+        shots / max(len(sessions), 1), int(kills.sum()) / max(len(sessions), 1), hits / max(len(sessions), 1),
+        100 * int(kills.sum()) / max(shots, 1)
+    ))
+
+################################################################
+#                            Bench                             #
+################################################################
+
+def bench(ticks: int, rounds: int, path: Optional[str]) -> None:
+    # Headless ticks of the autopilot with and without the log, the same games both ways
+    # The events go to a temporary directory unless one is given
+    from core import ENTITY_ALIEN
+    from soak import Autopilot
+    from spaceinvaders import World
+    from stress import HeadlessGame
+
+    def play(log: Optional[EventLog]) -> float:
+        seconds = 0.0
+        seed = 1
+        game = None
+        for _ in range(ticks):
+            if game is None or game.world.gameover:
+                game = HeadlessGame(World.headless(seed))
+                autopilot = Autopilot(game)
+                if log is not None:
+                    log.attach(game.world)
+                seed += 1
+            autopilot.drive()
+            start = perf_counter()
+            game.world.step(game.left_key_pressed, game.right_key_pressed, game.space_key_pressed)
+            seconds += perf_counter() - start
+        return seconds
+
+    directory = mkdtemp(prefix='events-') if path is None else path
+    try:
+        # Rounds in turns so that both get the same warm up, the best one of each, the others got more of the noise of the machine
+        log = EventLog(directory)
+        withouts, withs = [], []
+        for _ in range(rounds):
+            withouts.append(play(None))
+            withs.append(play(log))
+        log.close()
+        without, with_log = min(withouts), min(withs)
+        print("%d ticks: %.2f us without the log, %.2f us with it, %+.2f%%" % (
+            ticks, without / ticks * 1e6, with_log / ticks * 1e6, (with_log / without - 1) * 100
+        ))
+        # A difference within the noise of the ticks, the events alone tell what the log adds
+        events = log.logged / (ticks * rounds)
+        calls = 100000
+        timed = EventLog(directory, calls + 1)
+        event = timed.listener(World.headless(1))
+
+        def reset() -> None:
+            timed.count = 0
+
+        per_event = min(repeat('event(%d, %d, 0.0, 0.0, 10, 0)' % (EVENT_KILL, ENTITY_ALIEN), reset, number=calls, repeat=rounds, globals={'event': event})) / calls
+        timed.count = 0
+        timed.close()
+        print("%.3f events logged per tick, %.3f us each: %.3f us per tick, %.2f%% of a tick" % (
+            events, per_event * 1e6, events * per_event * 1e6, events * per_event / without * ticks * 100
+        ))
+    finally:
+        if path is None:
+            rmtree(directory)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Summarises the gameplay events logged by the games, or times the logging")
+    parser.add_argument('command', nargs='?', choices=['report', 'bench'], default='report')
+    parser.add_argument('path', nargs='?', help="of the events, %s by default, a temporary directory for the bench" % EVENTS_PATH)
+    parser.add_argument('--ticks', type=int, default=20000, help="per round of the bench")
+    parser.add_argument('--rounds', type=int, default=5, help="of the bench, with and without the log, the best one is kept")
+    args = parser.parse_args()
+    if args.command == 'bench':
+        bench(args.ticks, args.rounds, args.path)
+    else:
+        report(EventLogReader(args.path or EVENTS_PATH))
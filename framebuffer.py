@@ -0,0 +1,252 @@
+from argparse import ArgumentParser
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from PIL import Image
+from spaceinvaders import Game, Images, SpaceInvaders, World
+from struct import Struct
+from time import perf_counter, sleep
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import numpy as np
+
+################################################################
+#                           Configs                            #
+################################################################
+
+NAME = 'spaceinvaders-frames'
+SLOTS = 4               # frames kept, a reader has SLOTS - 1 ticks to use one
+CHANNELS = 3            # RGB, 8 bits each
+VERSION = 1
+MAGIC = b'SIFB'
+REPORT_DELAY = 5.0
+POLL_DELAY = 0.005      # s between two looks of a reader at the latest frame
+
+################################################################
+#                            Layout                            #
+################################################################
+
+# Magic, version, slots, channels, width, height, latest frame number (0 before the first one)
+HEADER = Struct('<4sBBBxHHQ')
+# Sequence (odd while the slot is written), frame number, game tick
+SLOT = Struct('<QQI4x')
+ALIGN = 64
+
+def get_data_offset(slots: int) -> int:
+    end = HEADER.size + slots * SLOT.size
+    return (end + ALIGN - 1) // ALIGN * ALIGN
+
+def get_shm_size(width: int, height: int, slots: int) -> int:
+    return get_data_offset(slots) + slots * width * height * CHANNELS
+
+def get_slot_views(shm: SharedMemory, width: int, height: int, slots: int) -> List[np.ndarray]:
+    # The pixels of each slot, straight in the shared memory
+    offset = get_data_offset(slots)
+    size = width * height * CHANNELS
+    return [np.ndarray((height, width, CHANNELS), np.uint8, shm.buf, offset + slot * size) for slot in range(slots)]
+
+# Names created by this process, its resource tracker must keep them
+created: Set[str] = set()
+
+def attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 the resource tracker of a reader unlinks the memory when the reader exits
+        shm = SharedMemory(name)
+        if name not in created:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+################################################################
+#                          Rasterizer                          #
+################################################################
+
+class Rasterizer:
+    # Draws the sprites of a world as the canvas shows them, on a black background
+    def __init__(self) -> None:
+        # By id of the image, kept along so that the id is not reused
+        self.sprites: Dict[int, Tuple[Image.Image, np.ndarray]] = {}
+
+    def _sprite(self, image: Image.Image) -> np.ndarray:
+        sprite = self.sprites.get(id(image))
+        if sprite is None:
+            # Black where transparent, drawn with a maximum which is much faster than a masked copy
+            rgba = np.asarray(image.convert('RGBA'))
+            sprite = self.sprites[id(image)] = image, np.where(rgba[..., 3:] > 0, rgba[..., :CHANNELS], 0).astype(np.uint8)
+        return sprite[1]
+
+    def blit(self, pixels: np.ndarray, image: Image.Image, x: float, y: float) -> None:
+        # Centered on x, y and clipped to the frame
+        rgb = self._sprite(image)
+        height, width = rgb.shape[:2]
+        x1, y1 = round(x - width / 2), round(y - height / 2)
+        cx1, cy1 = max(x1, 0), max(y1, 0)
+        cx2, cy2 = min(x1 + width, pixels.shape[1]), min(y1 + height, pixels.shape[0])
+        if cx1 < cx2 and cy1 < cy2:
+            sx, sy = cx1 - x1, cy1 - y1
+            area = pixels[cy1:cy2, cx1:cx2]
+            np.maximum(area, rgb[sy:sy + cy2 - cy1, sx:sx + cx2 - cx1], out=area)
+
+    def draw(self, pixels: np.ndarray, world: World) -> None:
+        pixels.fill(0)
+        fleet = world.fleet
+        for alien in fleet.aliens:
+            if alien.alive:
+                image = Images.alien_explosion if alien.explodes else getattr(Images, 'alien_' + alien.kind)[fleet.current_frame]
+                self.blit(pixels, image, alien.x, alien.y)
+        for bomb in fleet.dropped_bombs:
+            self.blit(pixels, Images.bomb_explosion if bomb.explodes else bomb.get_frames(bomb.kind)[bomb.current_frame], bomb.x, bomb.y)
+        defender = world.defender
+        if defender.alive:
+            image = Images.defender_explosion[defender._explosion_frame()] if defender.explodes else Images.defender
+            self.blit(pixels, image, defender.x, defender.y)
+        bullet = defender.bullet
+        if bullet is not None:
+            self.blit(pixels, Images.bullet_explosion if bullet.explodes else Images.bullet, bullet.x, bullet.y)
+        projectiles = world.projectiles
+        if projectiles is not None:
+            for index in range(projectiles.count):
+                self.blit(pixels, projectiles.get_image(index), projectiles.xs[index], projectiles.ys[index])
+
+################################################################
+#                          Publisher                           #
+################################################################
+
+class FramePublisher:
+    # Writes each frame in the next slot of a ring, whether readers are done with it or not
+    def __init__(self, width: int, height: int, name: str = NAME, slots: int = SLOTS) -> None:
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.shm = SharedMemory(name, create=True, size=get_shm_size(width, height, slots))
+        created.add(name)
+        self.views = get_slot_views(self.shm, width, height, slots)
+        self.rasterizer = Rasterizer()
+        self.frame = 0
+        self.publish_time = 0.0
+        self._write_header()
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, self.slots, CHANNELS, self.width, self.height, self.frame)
+
+    def publish(self, world: World) -> None:
+        start = perf_counter()
+        self.frame += 1
+        slot = self.frame % self.slots
+        offset = HEADER.size + slot * SLOT.size
+        # A seqlock: readers see an odd sequence, or a sequence that changed, on a slot being written
+        SLOT.pack_into(self.shm.buf, offset, 2 * self.frame - 1, self.frame, world.tick)
+        self.rasterizer.draw(self.views[slot], world)
+        SLOT.pack_into(self.shm.buf, offset, 2 * self.frame, self.frame, world.tick)
+        self._write_header()
+        self.publish_time += perf_counter() - start
+
+    def on_tick(self, main_game: Game.MainGame) -> None:
+        self.publish(main_game.world)
+
+    def close(self) -> None:
+        self.views.clear()
+        self.shm.close()
+        self.shm.unlink()
+        created.discard(self.shm.name)
+
+################################################################
+#                            Reader                            #
+################################################################
+
+class Frame(NamedTuple):
+    number: int
+    tick: int
+    sequence: int
+    slot: int
+    pixels: np.ndarray      # a view on the shared memory, see FrameReader.valid
+
+class FrameReader:
+    def __init__(self, name: str = NAME) -> None:
+        self.shm = attach(name)
+        magic, version, self.slots, channels, self.width, self.height, _ = HEADER.unpack_from(self.shm.buf)
+        if magic != MAGIC or version != VERSION or channels != CHANNELS:
+            self.shm.close()
+            raise ValueError("Not a frame buffer of this version: %r %d" % (magic, version))
+        self.views = get_slot_views(self.shm, self.width, self.height, self.slots)
+
+    def latest_number(self) -> int:
+        return HEADER.unpack_from(self.shm.buf)[-1]
+
+    def latest(self) -> Optional[Frame]:
+        # The most recent complete frame without copying it, None before the first one
+        number = self.latest_number()
+        while number > 0:
+            slot = number % self.slots
+            sequence, frame, tick = SLOT.unpack_from(self.shm.buf, HEADER.size + slot * SLOT.size)
+            if sequence == 2 * number:
+                return Frame(number, tick, sequence, slot, self.views[slot])
+            # Overwritten meanwhile by a newer frame
+            number = self.latest_number()
+        return None
+
+    def valid(self, frame: Frame) -> bool:
+        # Whether the pixels read since latest() are still the ones of the frame, False once the ring wrapped around
+        return SLOT.unpack_from(self.shm.buf, HEADER.size + frame.slot * SLOT.size)[0] == frame.sequence
+
+    def copy(self) -> Optional[Frame]:
+        # A frame of its own, for a reader slower than the ring
+        while True:
+            frame = self.latest()
+            if frame is None:
+                return None
+            pixels = frame.pixels.copy()
+            if self.valid(frame):
+                return frame._replace(pixels=pixels)
+
+    def close(self) -> None:
+        self.views.clear()
+        self.shm.close()
+
+def watch(name: str) -> None:
+    # Reports the rate of the frames and how many a reader polling at POLL_DELAY misses
+    reader = FrameReader(name)
+    print("Reading %dx%d frames from %s" % (reader.width, reader.height, name))
+    last = reader.latest_number()
+    report_time = perf_counter()
+    frames = missed = torn = lit = 0
+    try:
+        while True:
+            frame = reader.latest()
+            if frame is not None and frame.number != last:
+                missed += max(frame.number - last - 1, 0)
+                last = frame.number
+                lit = int(np.count_nonzero(frame.pixels.any(axis=2)))
+                if reader.valid(frame):
+                    frames += 1
+                else:
+                    torn += 1
+                del frame
+            now = perf_counter()
+            if now - report_time >= REPORT_DELAY:
+                print("%.1f frames/s, %d missed, %d overwritten while read, last frame %d with %d lit pixels" % (frames / (now - report_time), missed, torn, last, lit))
+                report_time = now
+                frames = missed = torn = 0
+            sleep(POLL_DELAY)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Publishes the frames of the game in shared memory, or reads them")
+    parser.add_argument('command', nargs='?', choices=['play', 'watch'], default='play')
+    parser.add_argument('--name', default=NAME, help="name of the shared memory")
+    parser.add_argument('--slots', type=int, default=SLOTS, help="frames in the ring")
+    args = parser.parse_args()
+    if args.command == 'watch':
+        watch(args.name)
+    else:
+        app = SpaceInvaders()
+        publisher = FramePublisher(*map(int, World.get_size()), args.name, args.slots)
+        app.game.tick_callbacks.append(publisher.on_tick)
+        try:
+            app.play()
+        finally:
+            if publisher.frame:
+                print("Published %d frames, %.0f us each" % (publisher.frame, publisher.publish_time / publisher.frame * 1e6))
+            publisher.close()
@@ -0,0 +1,168 @@
+from bisect import bisect_left, bisect_right
+from os.path import abspath, dirname
+from queue import Empty, Queue
+from threading import Thread
+from time import time
+from typing import List, NamedTuple, Optional, Tuple
+import sqlite3
+
+################################################################
+#                           Configs                            #
+################################################################
+
+DB_PATH = abspath(dirname(__file__)) + '/leaderboard.db'
+# Nothing is kept past the process, for the games of the harnesses: the top and the ranks are in memory anyway
+MEMORY_PATH = ':memory:'
+
+TOP_SIZE = 10
+BATCH_SIZE = 256
+BATCH_DELAY = 0.5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    wave INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    ended_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_score ON games (score DESC, id);
+CREATE TABLE IF NOT EXISTS score_counts (
+    score INTEGER PRIMARY KEY,
+    n INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+
+################################################################
+#                         Leaderboard                          #
+################################################################
+
+class Entry(NamedTuple):
+    score: int
+    duration: float
+    wave: int
+    seed: int
+    ended_at: float
+
+def connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+class Writer(Thread):
+    # Drains the submitted entries and writes them in one transaction per batch
+    def __init__(self, path: str, queue: 'Queue[Optional[Entry]]') -> None:
+        super().__init__(name='leaderboard-writer', daemon=True)
+        self.path = path
+        self.queue = queue
+
+    def run(self) -> None:
+        connection = connect(self.path)
+        running = True
+        while running:
+            batch: List[Entry] = []
+            entry = self.queue.get()
+            deadline = time() + BATCH_DELAY
+            # The size is checked before taking the next entry, an entry taken is always written
+            while entry is not None:
+                batch.append(entry)
+                if len(batch) == BATCH_SIZE:
+                    break
+                try: entry = self.queue.get(timeout=max(deadline - time(), 0))
+                except Empty: break
+            if entry is None:
+                running = False
+            if batch:
+                self.write(connection, batch)
+        connection.close()
+
+    @staticmethod
+    def write(connection: sqlite3.Connection, batch: List[Entry]) -> None:
+        connection.execute('BEGIN')
+        connection.executemany('INSERT INTO games (score, duration, wave, seed, ended_at) VALUES (?, ?, ?, ?, ?)', batch)
+        connection.executemany('INSERT INTO score_counts (score, n) VALUES (?, 1) ON CONFLICT (score) DO UPDATE SET n = n + 1', [(entry.score,) for entry in batch])
+        connection.execute('COMMIT')
+
+class ScoreCounts:
+    # Games per distinct score, summed up in a Fenwick tree: the games above a score take O(log distinct scores)
+    # A score never seen before builds the tree again, the scores are few since they add up alien worths
+    def __init__(self, counts: List[Tuple[int, int]]) -> None:
+        self.scores = [score for score, _ in counts]    # ascending
+        self.counts = [n for _, n in counts]
+        self.total = sum(self.counts)
+        self._build()
+
+    def _build(self) -> None:
+        self.tree = [0] + self.counts
+        for index in range(1, len(self.tree)):
+            parent = index + (index & -index)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[index]
+
+    def _sum(self, end: int) -> int:
+        # Games of the first end scores
+        total = 0
+        while end > 0:
+            total += self.tree[end]
+            end -= end & -end
+        return total
+
+    def add(self, score: int) -> None:
+        index = bisect_left(self.scores, score)
+        self.total += 1
+        if index < len(self.scores) and self.scores[index] == score:
+            self.counts[index] += 1
+            index += 1
+            while index < len(self.tree):
+                self.tree[index] += 1
+                index += index & -index
+        else:
+            self.scores.insert(index, score)
+            self.counts.insert(index, 1)
+            self._build()
+
+    def above(self, score: int) -> int:
+        return self.total - self._sum(bisect_right(self.scores, score))
+
+class Leaderboard:
+    def __init__(self, path: str = DB_PATH, top_size: int = TOP_SIZE) -> None:
+        self.top_size = top_size
+        self.connection = connect(path)
+        self.queue: 'Queue[Optional[Entry]]' = Queue()
+        self.writer = Writer(path, self.queue)
+        self.writer.start()
+        self.top = self._load_top()
+        self.score_counts = ScoreCounts(self.connection.execute('SELECT score, n FROM score_counts ORDER BY score').fetchall())
+
+    def _load_top(self) -> List[Entry]:
+        rows = self.connection.execute('SELECT score, duration, wave, seed, ended_at FROM games ORDER BY score DESC, id LIMIT ?', (self.top_size,))
+        return [Entry(*row) for row in rows]
+
+    def high_score(self) -> int:
+        return self.top[0].score if self.top else 0
+
+    def submit(self, score: int, duration: float, wave: int, seed: int) -> Entry:
+        # The top is kept up to date in memory, the database is written later by the writer
+        entry = Entry(score, duration, wave, seed, time())
+        self.queue.put(entry)
+        self.score_counts.add(score)
+        index = len(self.top)
+        while index > 0 and self.top[index - 1].score < score:
+            index -= 1
+        if index < self.top_size:
+            self.top.insert(index, entry)
+            del self.top[self.top_size:]
+        return entry
+
+    def rank(self, score: int) -> int:
+        # 1 + the games with a higher score, submitted ones included even before the writer gets to them
+        return self.score_counts.above(score) + 1
+
+    def close(self) -> None:
+        # Waits for the pending entries to be written
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
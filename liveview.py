@@ -0,0 +1,229 @@
+from argparse import ArgumentParser
+from asyncio import AbstractEventLoop, Event, StreamReader, StreamWriter, get_running_loop, run, start_server
+from framebuffer import CHANNELS, NAME, POLL_DELAY, FrameReader, Rasterizer
+from io import BytesIO
+from PIL import Image
+from spaceinvaders import Game, NullRender, SpaceInvaders, World
+from socket import SO_SNDBUF, SOL_SOCKET
+from threading import Condition, Thread
+from time import perf_counter, sleep, time
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+################################################################
+#                           Configs                            #
+################################################################
+
+HOST = '0.0.0.0'    # the cabinets are watched from the local network
+PORT = 8080
+QUALITY = 75        # of the JPEG frames
+
+# A client still sending an earlier frame misses the frame, one missing that many in a row is disconnected
+DROP_FRAMES = 300
+SEND_BUFFER = 64 * 1024     # bytes queued by the kernel for a client, a few frames at most
+REPORT_DELAY = 5.0
+
+BOUNDARY = b'frame'
+PAGE = b'''<!DOCTYPE html>
+<html><head><title>Space Invaders</title></head>
+<body style="margin: 0; background: #000000"><img src="/stream" style="display: block; margin: auto"></body></html>
+'''
+
+################################################################
+#                           Encoding                           #
+################################################################
+
+def encode_jpeg(pixels: np.ndarray, quality: int = QUALITY) -> bytes:
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def encode_part(jpeg: bytes) -> bytes:
+    return b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n' % (BOUNDARY, len(jpeg), jpeg)
+
+class GameSource(Thread):
+    # Draws and encodes the ticks of the game in its own thread, from snapshots taken by the game loop
+    # A tick still waiting when the next one comes is dropped
+    def __init__(self, view: 'LiveView') -> None:
+        super().__init__(name='liveview-encoder', daemon=True)
+        self.view = view
+        self.condition = Condition()
+        self.pending: Optional[Tuple[bytes, Tuple[float, float], bool]] = None
+        self.world: Optional[World] = None
+        self.rasterizer = Rasterizer()
+
+    def on_tick(self, main_game: Game.MainGame) -> None:
+        data = main_game.save()
+        with self.condition:
+            if self.pending is not None:
+                self.view.ticks_dropped += 1
+            self.pending = data, (main_game.render.width, main_game.render.height), main_game.world.projectiles is not None
+            self.condition.notify()
+
+    def _world(self, data: bytes, size: Tuple[float, float], challenge: bool) -> World:
+        # Follows the game with a world of its own, made again when the game is of another size, scale or mode
+        if self.world is None or (self.world.render.width, self.world.render.height) != size or (self.world.projectiles is not None) != challenge:
+            self.world = World(NullRender(*size), 0, challenge)
+        try:
+            self.world.restore(data)
+        except ValueError:
+            self.world = World(NullRender(*size), 0, challenge)
+            self.world.restore(data)
+        return self.world
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                (data, size, challenge), self.pending = self.pending, None
+            start = perf_counter()
+            world = self._world(data, size, challenge)
+            # A new array each time, the last one is kept by the view for the PNG snapshots
+            pixels = np.empty((int(size[1]), int(size[0]), CHANNELS), np.uint8)
+            self.rasterizer.draw(pixels, world)
+            self.view.submit(world.tick, pixels, start)
+
+class FramebufferSource(Thread):
+    # Encodes the frames published in shared memory by another process
+    def __init__(self, view: 'LiveView', name: str = NAME) -> None:
+        super().__init__(name='liveview-encoder', daemon=True)
+        self.view = view
+        self.reader = FrameReader(name)
+
+    def run(self) -> None:
+        last = self.reader.latest_number()
+        while True:
+            if self.reader.latest_number() != last:
+                start = perf_counter()
+                frame = self.reader.copy()
+                if frame is not None:
+                    self.view.ticks_dropped += max(frame.number - last - 1, 0)
+                    last = frame.number
+                    self.view.submit(frame.tick, frame.pixels, start)
+            sleep(POLL_DELAY)
+
+################################################################
+#                            Server                            #
+################################################################
+
+class LiveView:
+    # Serves the playfield as an MJPEG stream, each frame is encoded once for all the clients
+    def __init__(self, host: str = HOST, port: int = PORT, quality: int = QUALITY) -> None:
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.loop: Optional[AbstractEventLoop] = None
+        # Frames missed in a row by client
+        self.clients: Dict[StreamWriter, int] = {}
+        self.pixels: Optional[np.ndarray] = None
+        self.report_last_time = time()
+        self.frames = 0
+        self.frames_skipped = 0
+        self.ticks_dropped = 0
+        self.encode_time = 0.0
+
+    async def start(self, loop: AbstractEventLoop) -> None:
+        self.loop = loop
+        self.server = await start_server(self._handle, self.host, self.port)
+        print("Live view on http://%s:%d/" % (self.host, self.port))
+
+    def submit(self, tick: int, pixels: np.ndarray, start: float) -> None:
+        # Called from the encoder thread, the JPEG is only made for clients
+        jpeg = encode_part(encode_jpeg(pixels, self.quality)) if self.clients else None
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.publish, tick, pixels, jpeg, perf_counter() - start)
+
+    def publish(self, tick: int, pixels: np.ndarray, part: Optional[bytes], encode_time: float) -> None:
+        self.pixels = pixels
+        if part is not None:
+            for writer, skipped in list(self.clients.items()):
+                if writer.transport.get_write_buffer_size() == 0:
+                    self.clients[writer] = 0
+                    writer.write(part)
+                elif skipped < DROP_FRAMES:
+                    self.clients[writer] = skipped + 1
+                    self.frames_skipped += 1
+                else:
+                    del self.clients[writer]
+                    writer.close()
+            self.frames += 1
+            self.encode_time += encode_time
+        self._report()
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.split()
+            path = parts[1].decode('latin-1') if len(parts) > 1 else ''
+            if path == '/':
+                self._respond(writer, b'200 OK', b'text/html; charset=utf-8', PAGE)
+            elif path == '/frame.png' and self.pixels is not None:
+                png = await get_running_loop().run_in_executor(None, encode_png, self.pixels)
+                self._respond(writer, b'200 OK', b'image/png', png)
+            elif path == '/stream':
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary=%s\r\n'
+                    b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n' % BOUNDARY
+                )
+                writer.get_extra_info('socket').setsockopt(SOL_SOCKET, SO_SNDBUF, SEND_BUFFER)
+                self.clients[writer] = 0
+                # Nothing more is read, the stream goes on until the client leaves
+                while await reader.read(1024):
+                    pass
+            else:
+                self._respond(writer, b'404 Not Found', b'text/plain', b'Not found\n')
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    def _respond(self, writer: StreamWriter, status: bytes, content_type: bytes, body: bytes) -> None:
+        writer.write(b'HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s' % (status, content_type, len(body), body))
+
+    def _report(self) -> None:
+        now = time()
+        if now - self.report_last_time >= REPORT_DELAY:
+            print("Live view: %d clients, %.1f frames/s, %.1f ms/frame encoding, %d frames skipped, %d ticks dropped" % (
+                len(self.clients), self.frames / (now - self.report_last_time), self.encode_time / max(self.frames, 1) * 1000,
+                self.frames_skipped, self.ticks_dropped
+            ))
+            self.report_last_time = now
+            self.frames = 0
+            self.frames_skipped = 0
+            self.ticks_dropped = 0
+            self.encode_time = 0.0
+
+async def serve(host: str, port: int, quality: int, framebuffer: Optional[str]) -> None:
+    view = LiveView(host, port, quality)
+    await view.start(get_running_loop())
+    if framebuffer is not None:
+        FramebufferSource(view, framebuffer).start()
+        await Event().wait()
+    else:
+        # The server and the game share the asyncio loop, the encoding has a thread of its own
+        game = SpaceInvaders()
+        source = GameSource(view)
+        source.start()
+        game.game.tick_callbacks.append(source.on_tick)
+        await game.play_async()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Serves the live playfield to browsers as an MJPEG stream")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--quality', type=int, default=QUALITY, help="of the JPEG frames, 1 to 95")
+    parser.add_argument('--framebuffer', nargs='?', const=NAME, help="streams the frames published by framebuffer.py instead of playing")
+    args = parser.parse_args()
+    try:
+        run(serve(args.host, args.port, args.quality, args.framebuffer))
+    except KeyboardInterrupt:
+        pass
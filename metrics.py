@@ -0,0 +1,158 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import replace
+from threading import Thread
+from time import sleep
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+################################################################
+#                           Configs                            #
+################################################################
+
+# Upper bounds in seconds, from 50 us to 100 ms
+DURATION_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.03, 0.05, 0.1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+################################################################
+#                           Metrics                            #
+################################################################
+
+# Values are only written by the game thread, exporters only read them
+
+def format_labels(labels: Dict[str, str], extra: str = '') -> str:
+    pairs = ['%s="%s"' % (key, value.replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels.items()]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+def format_value(value: float) -> str:
+    return '%d' % value if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, labels: Dict[str, str]) -> None:
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def export(self, name: str) -> List[str]:
+        return ['%s%s %s' % (name, format_labels(self.labels), format_value(self.value))]
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, labels: Dict[str, str]) -> None:
+        self.labels = labels
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def export(self, name: str) -> List[str]:
+        return ['%s%s %s' % (name, format_labels(self.labels), format_value(self.value))]
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, labels: Dict[str, str], buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # One more slot for the values above the last bound, counts are made cumulative on export
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def export(self, name: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('%s_bucket%s %d' % (name, format_labels(self.labels, 'le="%s"' % le), total))
+        lines.append('%s_sum%s %s' % (name, format_labels(self.labels), format_value(self.sum)))
+        lines.append('%s_count%s %d' % (name, format_labels(self.labels), total))
+        return lines
+
+Metric = Union[Counter, Gauge, Histogram]
+
+class Registry:
+    def __init__(self) -> None:
+        # Name -> help, kind and one metric per set of labels
+        self.families: Dict[str, Tuple[str, str, List[Metric]]] = {}
+
+    def _register(self, name: str, help: str, metric: Metric) -> Metric:
+        family = self.families.setdefault(name, (help, metric.kind, []))
+        if family[1] != metric.kind:
+            raise ValueError("%s is already registered as a %s" % (name, family[1]))
+        family[2].append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        counter = Counter(labels or {})
+        self._register(name, help, counter)
+        return counter
+
+    def gauge(self, name: str, help: str, labels: Optional[Dict[str, str]] = None) -> Gauge:
+        gauge = Gauge(labels or {})
+        self._register(name, help, gauge)
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: Optional[Dict[str, str]] = None, buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        histogram = Histogram(labels or {}, buckets)
+        self._register(name, help, histogram)
+        return histogram
+
+    def export(self) -> str:
+        lines = []
+        for name, (help, kind, metrics) in self.families.items():
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for metric in metrics:
+                lines.extend(metric.export(name))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        # Written aside then renamed so that a collector never reads half a file
+        with open(path + '.tmp', 'w') as file:
+            file.write(self.export())
+        replace(path + '.tmp', path)
+
+    def write_every(self, path: str, delay: float) -> Thread:
+        def loop():
+            while True:
+                self.write(path)
+                sleep(delay)
+        thread = Thread(target=loop, name='metrics-writer', daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.export().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+REGISTRY = Registry()
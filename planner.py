@@ -0,0 +1,223 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, wait
+from leaderboard import MEMORY_PATH
+from multiprocessing import get_context
+from os import cpu_count
+from random import Random
+from recorder import INPUT_FIRE, INPUT_LEFT, INPUT_RIGHT
+from soak import Autopilot, percentile
+from spaceinvaders import TICK_DELAY, Game, NullRender, Scale, SpaceInvaders, World, set_fleet_size, set_scale
+from stress import HeadlessGame
+from time import monotonic, perf_counter
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+################################################################
+#                           Configs                            #
+################################################################
+
+WORKERS = max((cpu_count() or 2) - 1, 1)
+BUDGET = 20.0       # ms of rollouts per tick, the rest of the TICK_DELAY is left to the game
+SLACK = 3.0         # ms a rollout started before the deadline may take to end
+DEPTH = 40          # ticks per rollout, about what the bullet takes to reach the fleet
+HOLD_TICKS = 4      # the move evaluated is kept that long, the rollout then plays at random
+CHANGE_CHANCE = 0.25    # per tick, of a new random move after HOLD_TICKS
+DEATH_PENALTY = 500.0   # points, for a life lost or the fleet landing during a rollout
+REPORT_DELAY = 5.0
+# A fork would share the window of the game, the pool processes start from scratch
+POOL_CONTEXT = 'spawn'
+
+MOVES = [0, INPUT_LEFT, INPUT_RIGHT, INPUT_FIRE]
+MOVE_NAMES = ['wait', 'left', 'right', 'fire']
+
+################################################################
+#                           Rollouts                           #
+################################################################
+
+# The world of a pool process, made once and restored for each rollout
+rollout_world: Optional[World] = None
+
+def start_worker(width: float, height: float, image_scale: float, rows: int, columns: int, challenge: bool) -> None:
+    global rollout_world
+    if image_scale != Scale.image:
+        set_scale(image_scale)
+    set_fleet_size(rows, columns)
+    rollout_world = World(NullRender(width, height), 0, challenge)
+
+def rollout(world: World, snapshot: bytes, move: int, depth: int, random: Random) -> float:
+    # Points made from the snapshot on, less a penalty when the defender does not survive
+    world.restore(snapshot)
+    defender = world.defender
+    score = defender.score
+    inputs = move
+    for tick in range(depth):
+        if tick >= HOLD_TICKS and random.random() < CHANGE_CHANCE:
+            inputs = random.choice(MOVES)
+        world.step(inputs & INPUT_LEFT != 0, inputs & INPUT_RIGHT != 0, inputs & INPUT_FIRE != 0)
+        if defender.explodes or world.gameover:
+            return defender.score - score - DEATH_PENALTY
+    return float(defender.score - score)
+
+def run_rollouts(snapshot: bytes, deadline: float, depth: int, seed: int) -> List[Tuple[float, int]]:
+    # Each move in turn until the deadline, time.monotonic is the same clock in all the processes
+    world = rollout_world
+    random = Random(seed)
+    totals = [0.0] * len(MOVES)
+    counts = [0] * len(MOVES)
+    index = 0
+    while monotonic() < deadline:
+        totals[index] += rollout(world, snapshot, MOVES[index], depth, random)
+        counts[index] += 1
+        index = (index + 1) % len(MOVES)
+    return list(zip(totals, counts))
+
+################################################################
+#                           Planner                            #
+################################################################
+
+GameLike = Union[Game.MainGame, HeadlessGame]
+
+class Planner:
+    # Presses the keys of the defender like the Autopilot, after rollouts of each move from a copy of the game
+    # The moves are chosen within the budget, the Autopilot decides when no rollout came back in time
+    def __init__(self, game: GameLike, workers: int = WORKERS, budget: float = BUDGET, depth: int = DEPTH) -> None:
+        self.game = game
+        self.workers = workers
+        self.budget = budget
+        self.depth = depth
+        self.random = Random()
+        world = game.world
+        self.pool = ProcessPoolExecutor(
+            workers, get_context(POOL_CONTEXT), initializer=start_worker,
+            initargs=(
+                world.render.width, world.render.height, Scale.image, world.fleet.nb_rows, world.fleet.nb_columns,
+                world.projectiles is not None
+            )
+        )
+        # The processes are started and ready before the first tick
+        wait([self.pool.submit(run_rollouts, world.save(), 0.0, 0, 0) for _ in range(workers)])
+        self.report_last_time = perf_counter()
+        # Since the last report
+        self.rollouts = 0
+        self.decisions = 0
+        self.fallbacks = 0
+        self.decision_times: List[float] = []
+        self.moves = [0] * len(MOVES)
+
+    def drive(self) -> None:
+        game = self.game
+        world = game.world
+        if world.gameover or world.defender.explodes:
+            # Frozen, nothing to choose
+            self._press(0)
+            return
+        start = perf_counter()
+        deadline = monotonic() + self.budget / 1000
+        snapshot = world.save()
+        futures = [self.pool.submit(run_rollouts, snapshot, deadline, self.depth, self.random.getrandbits(32)) for _ in range(self.workers)]
+        done, _ = wait(futures, timeout=(self.budget + SLACK) / 1000)
+        totals = [0.0] * len(MOVES)
+        counts = [0] * len(MOVES)
+        for future in done:
+            for index, (total, count) in enumerate(future.result()):
+                totals[index] += total
+                counts[index] += count
+        if all(counts):
+            best = max(range(len(MOVES)), key=lambda index: totals[index] / counts[index])
+            self._press(MOVES[best])
+            self.moves[best] += 1
+        else:
+            Autopilot(game).drive()
+            self.fallbacks += 1
+        self.rollouts += sum(counts)
+        self.decisions += 1
+        self.decision_times.append(perf_counter() - start)
+        self._report()
+
+    def _press(self, inputs: int) -> None:
+        self.game.left_key_pressed = inputs & INPUT_LEFT != 0
+        self.game.right_key_pressed = inputs & INPUT_RIGHT != 0
+        self.game.space_key_pressed = inputs & INPUT_FIRE != 0
+
+    def _report(self, force: bool = False) -> None:
+        now = perf_counter()
+        if (force or now - self.report_last_time >= REPORT_DELAY) and self.decisions:
+            print("%.0f rollouts/s, %.0f per tick, decision p50 %.1f p99 %.1f max %.1f ms, %d over the %d ms tick, %d by the autopilot, moves %s" % (
+                self.rollouts / (now - self.report_last_time), self.rollouts / self.decisions,
+                percentile(self.decision_times, 50) * 1000, percentile(self.decision_times, 99) * 1000, max(self.decision_times) * 1000,
+                sum(t * 1000 > TICK_DELAY for t in self.decision_times), TICK_DELAY, self.fallbacks,
+                ' '.join('%s %d' % item for item in zip(MOVE_NAMES, self.moves))
+            ))
+            self.report_last_time = now
+            self.rollouts = 0
+            self.decisions = 0
+            self.fallbacks = 0
+            self.decision_times = []
+            self.moves = [0] * len(MOVES)
+
+    def close(self) -> None:
+        self._report(True)
+        self.pool.shutdown()
+
+################################################################
+#                             Play                             #
+################################################################
+
+class Result(NamedTuple):
+    seed: int
+    ticks: int
+    score: int
+    wave: int
+    lives: int
+
+def play_headless(seed: int, max_ticks: int, planner: Optional[Planner]) -> Result:
+    # With the planner, or the Autopilot alone to compare
+    game = HeadlessGame(World.headless(seed))
+    autopilot = Autopilot(game)
+    if planner is not None:
+        planner.game = game
+    while not game.world.gameover and game.world.tick < max_ticks:
+        if planner is not None:
+            planner.drive()
+        else:
+            autopilot.drive()
+        game.world.step(game.left_key_pressed, game.right_key_pressed, game.space_key_pressed)
+    return Result(seed, game.world.tick, game.defender.score, game.fleet.wave, game.defender.lives)
+
+def play_window(workers: int, budget: float, depth: int) -> None:
+    app = SpaceInvaders(leaderboard_path=MEMORY_PATH, event_log_path=None)
+    planner = Planner(app.game.main_game, workers, budget, depth)
+
+    def on_tick(main_game: Game.MainGame) -> None:
+        # A new MainGame comes with each game
+        planner.game = main_game
+        if not main_game.gameover:
+            planner.drive()
+
+    app.game.tick_callbacks.append(on_tick)
+    try:
+        app.play()
+    finally:
+        planner.close()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Plays with a planner running rollouts of each move in a process pool")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="processes running the rollouts")
+    parser.add_argument('--budget', type=float, default=BUDGET, help="ms of rollouts per tick")
+    parser.add_argument('--depth', type=int, default=DEPTH, help="ticks per rollout")
+    parser.add_argument('--games', type=int, default=3, help="played headless")
+    parser.add_argument('--seed', type=int, default=1, help="of the first game, the next ones get the next seeds")
+    parser.add_argument('--max-ticks', type=int, default=3000, help="per game played headless")
+    parser.add_argument('--compare', action='store_true', help="plays the same games with the Autopilot too")
+    parser.add_argument('--window', action='store_true', help="plays in the window instead of headless")
+    args = parser.parse_args()
+    if args.window:
+        play_window(args.workers, args.budget, args.depth)
+    else:
+        planner = Planner(HeadlessGame(World.headless(args.seed)), args.workers, args.budget, args.depth)
+        try:
+            for seed in range(args.seed, args.seed + args.games):
+                for name, player in [('planner', planner)] + ([('autopilot', None)] if args.compare else []):
+                    r = play_headless(seed, args.max_ticks, player)
+                    print("Seed %d, %s: %d ticks, score %d, wave %d, %d lives left" % (r.seed, name, r.ticks, r.score, r.wave, r.lives))
+        finally:
+            planner.close()
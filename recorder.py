@@ -0,0 +1,259 @@
+from argparse import ArgumentParser
+from collections import Counter
+from core import ENTITY_BOMB, ENTITY_NAMES, ENTITY_NONE, EVENT_BOMB_DROP, EVENT_KILL, EVENT_NAMES, EVENT_SOUND
+from glob import glob
+from os import makedirs, remove, replace
+from os.path import abspath, dirname, getmtime, getsize, join
+from struct import Struct
+from threading import Thread
+from time import perf_counter, time
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+################################################################
+#                           Configs                            #
+################################################################
+
+RECORDINGS_PATH = abspath(dirname(__file__)) + '/recordings'
+# The oldest dumps are deleted past either, a slow machine dumps every few seconds
+MAX_RECORDINGS = 100
+MAX_RECORDINGS_SIZE = 64 * 1024 * 1024    # bytes
+
+EVENTS_PER_TICK = 4     # room in the ring on average, bursts are fine
+MAGIC = b'SIFR'
+VERSION = 1
+
+# Inputs and states of a tick
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_FIRE = 4
+DEFENDER_EXPLODES = 8
+BULLET_FLYING = 16
+
+################################################################
+#                           Records                            #
+################################################################
+
+# Magic, version, tick delay and budget in ms, ticks, events, length of the names
+DUMP_HEAD = Struct('<4sBffIIH')
+# Tick, kind, entity, x, y, value
+EVENT = Struct('<IBBhhH')
+
+def get_tick_struct(nb_phases: int) -> Struct:
+    # Tick, s since the recorder started, s per phase, s of the whole tick, Tcl calls, aliens alive, aliens exploding, bombs, inputs
+    return Struct('<Id%dffHHHBB' % nb_phases)
+
+class Tick(NamedTuple):
+    tick: int
+    time: float
+    phases: Tuple[float, ...]
+    duration: float
+    tcl_calls: int
+    aliens: int
+    exploding: int
+    bombs: int
+    inputs: int
+
+class Event(NamedTuple):
+    tick: int
+    kind: int
+    entity: int
+    x: int
+    y: int
+    value: int
+
+class Ring:
+    # Fixed size records in one preallocated buffer, the oldest are overwritten
+    def __init__(self, record: Struct, capacity: int) -> None:
+        self.record = record
+        self.capacity = capacity
+        self.buffer = bytearray(record.size * capacity)
+        self.count = 0
+
+    def append(self, *values: object) -> None:
+        self.record.pack_into(self.buffer, self.count % self.capacity * self.record.size, *values)
+        self.count += 1
+
+    def ordered(self) -> bytes:
+        # Oldest first
+        if self.count <= self.capacity:
+            return bytes(self.buffer[:self.count * self.record.size])
+        split = self.count % self.capacity * self.record.size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+################################################################
+#                           Recorder                           #
+################################################################
+
+class FlightRecorder:
+    # Always on: keeps the last seconds of ticks and events, and writes them out when a tick goes over budget
+    def __init__(self, phases: Sequence[str], sounds: Sequence[str], tick_delay: float, seconds: float, budget: float, path: str = RECORDINGS_PATH,
+                 max_files: int = MAX_RECORDINGS, max_size: int = MAX_RECORDINGS_SIZE) -> None:
+        self.phases = list(phases)
+        self.sounds = list(sounds)
+        self.tick_delay = tick_delay
+        self.budget = budget
+        self.path = path
+        self.max_files = max_files
+        self.max_size = max_size
+        nb_ticks = max(int(seconds * 1000 / tick_delay), 1)
+        self.ticks = Ring(get_tick_struct(len(phases)), nb_ticks)
+        self.events = Ring(EVENT, nb_ticks * EVENTS_PER_TICK)
+        # Filled by the game during a tick
+        self.times = [0.0] * len(phases)
+        self.tick = 0
+        self.start_time = perf_counter()
+        # One dump per window, a hitch is often followed by others
+        self.dump_ticks = nb_ticks
+        self.last_dump_tick = -nb_ticks
+        self.dumps: List[str] = []
+
+    def event(self, kind: int, entity: int, x: float, y: float, value: int = 0, index: int = -1) -> None:
+        self.events.append(self.tick, kind, entity, max(min(int(x), 32767), -32768), max(min(int(y), 32767), -32768), value & 0xFFFF)
+
+    def end_tick(self, start: float, duration: float, tcl_calls: int, aliens: int, exploding: int, bombs: int, inputs: int) -> None:
+        self.ticks.append(
+            self.tick, start - self.start_time, *self.times, duration, min(tcl_calls, 0xFFFF),
+            min(aliens, 0xFFFF), min(exploding, 0xFFFF), min(bombs, 0xFF), inputs
+        )
+        for index in range(len(self.times)):
+            self.times[index] = 0.0
+        if duration * 1000 > self.budget and self.tick - self.last_dump_tick >= self.dump_ticks:
+            self.last_dump_tick = self.tick
+            self.dump("slow-%d-%d.sifr" % (time(), self.tick))
+        self.tick += 1
+
+    def dump(self, name: str) -> str:
+        # The rings are copied here, the file is written by a thread of its own
+        names = '\n'.join(self.phases + [''] + self.sounds).encode()
+        data = DUMP_HEAD.pack(MAGIC, VERSION, self.tick_delay, self.budget, len(self.ticks), len(self.events), len(names)) + names + self.ticks.ordered() + self.events.ordered()
+        path = join(self.path, name)
+        Thread(target=write, args=(path, data, self.max_files, self.max_size), name='recorder-dump').start()
+        self.dumps.append(path)
+        print("Tick %d over %.0f ms, the last ticks are written to %s" % (self.tick, self.budget, path))
+        return path
+
+def write(path: str, data: bytes, max_files: int, max_size: int) -> None:
+    makedirs(dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    # Renamed once complete so that a dump is never read half written
+    replace(path + '.tmp', path)
+    prune(dirname(path), max_files, max_size)
+
+def prune(path: str, max_files: int, max_size: int) -> None:
+    # Oldest first, the dump just written is kept whatever its size
+    dumps = []
+    for dump in glob(join(path, '*.sifr')):
+        try:
+            dumps.append((getmtime(dump), dump, getsize(dump)))
+        except OSError:
+            pass    # deleted meanwhile by another dump
+    dumps.sort()
+    count, size = len(dumps), sum(dump[2] for dump in dumps)
+    for _, dump, dump_size in dumps[:-1]:
+        if count <= max_files and size <= max_size:
+            break
+        try:
+            remove(dump)
+        except OSError:
+            pass
+        count -= 1
+        size -= dump_size
+
+################################################################
+#                           Analysis                           #
+################################################################
+
+class Dump(NamedTuple):
+    tick_delay: float
+    budget: float
+    phases: List[str]
+    sounds: List[str]
+    ticks: List[Tick]
+    events: List[Event]
+
+def load(path: str) -> Dump:
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version, tick_delay, budget, nb_ticks, nb_events, names_size = DUMP_HEAD.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a flight recorder dump of this version: %r %d" % (magic, version))
+    offset = DUMP_HEAD.size
+    names = data[offset:offset + names_size].decode().split('\n')
+    offset += names_size
+    split = names.index('')
+    phases, sounds = names[:split], names[split + 1:]
+    tick_struct = get_tick_struct(len(phases))
+    ticks = []
+    for values in tick_struct.iter_unpack(data[offset:offset + nb_ticks * tick_struct.size]):
+        tick, start, *rest = values
+        ticks.append(Tick(tick, start, tuple(rest[:len(phases)]), *rest[len(phases):]))
+    offset += nb_ticks * tick_struct.size
+    events = [Event(*values) for values in EVENT.iter_unpack(data[offset:offset + nb_events * EVENT.size])]
+    return Dump(tick_delay, budget, phases, sounds, ticks, events)
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)] if values else 0.0
+
+def describe_event(dump: Dump, event: Event) -> str:
+    what = event_name(event)
+    if event.kind == EVENT_SOUND:
+        return what + ' ' + (dump.sounds[event.value] if event.value < len(dump.sounds) else str(event.value))
+    if event.kind == EVENT_KILL:
+        return what + ' for %d at %d, %d' % (event.value, event.x, event.y)
+    if event.kind == EVENT_BOMB_DROP:
+        return what + ' of kind %d at %d, %d' % (event.value, event.x, event.y)
+    return what + ' at %d, %d' % (event.x, event.y)
+
+def event_name(event: Event) -> str:
+    what = EVENT_NAMES.get(event.kind, str(event.kind))
+    if event.entity not in (ENTITY_NONE, ENTITY_BOMB if event.kind == EVENT_BOMB_DROP else ENTITY_NONE):
+        what += ' ' + ENTITY_NAMES.get(event.entity, str(event.entity))
+    return what
+
+def describe_inputs(inputs: int) -> str:
+    names = [(INPUT_LEFT, 'left'), (INPUT_RIGHT, 'right'), (INPUT_FIRE, 'fire'), (DEFENDER_EXPLODES, 'exploding'), (BULLET_FLYING, 'bullet')]
+    return ','.join(name for bit, name in names if inputs & bit) or '-'
+
+def report(dump: Dump, context: int) -> None:
+    ticks = dump.ticks
+    if not ticks:
+        print("No ticks recorded")
+        return
+    print("%d ticks (%d to %d) over %.1f s, %d events, budget %.0f ms" % (
+        len(ticks), ticks[0].tick, ticks[-1].tick, ticks[-1].time - ticks[0].time, len(dump.events), dump.budget
+    ))
+    print("\n%-16s %8s %8s %8s  ms" % ('phase', 'p50', 'p95', 'max'))
+    for index, phase in enumerate(dump.phases + ['tick']):
+        values = [(tick.phases[index] if index < len(dump.phases) else tick.duration) * 1000 for tick in ticks]
+        print("%-16s %8.2f %8.2f %8.2f" % (phase, percentile(values, 50), percentile(values, 95), max(values)))
+    counts = Counter(event_name(event) for event in dump.events)
+    print("\nEvents: " + ', '.join('%s %d' % item for item in counts.most_common()))
+    slow = [tick for tick in ticks if tick.duration * 1000 > dump.budget]
+    print("\n%d ticks over budget" % len(slow))
+    # The ticks before the last slow one, with their events
+    last = slow[-1] if slow else ticks[-1]
+    events_by_tick: Dict[int, List[Event]] = {}
+    for event in dump.events:
+        events_by_tick.setdefault(event.tick, []).append(event)
+    print("\n%6s %9s %s %8s %5s %6s %4s %5s %s" % ('tick', 'time', ' '.join('%8s' % phase[:8] for phase in dump.phases), 'total', 'tcl', 'aliens', 'expl', 'bombs', 'inputs'))
+    for tick in ticks:
+        if last.tick - context <= tick.tick <= last.tick:
+            mark = ' <' if tick.duration * 1000 > dump.budget else ''
+            print("%6d %9.3f %s %8.2f %5d %6d %4d %5d %s%s" % (
+                tick.tick, tick.time, ' '.join('%8.2f' % (t * 1000) for t in tick.phases), tick.duration * 1000,
+                tick.tcl_calls, tick.aliens, tick.exploding, tick.bombs, describe_inputs(tick.inputs), mark
+            ))
+            for event in events_by_tick.get(tick.tick, []):
+                print("%16s %s" % ('', describe_event(dump, event)))
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Summarises a dump of the flight recorder")
+    parser.add_argument('path')
+    parser.add_argument('--context', type=int, default=20, help="ticks shown before the last slow one")
+    args = parser.parse_args()
+    report(load(args.path), args.context)
@@ -0,0 +1,212 @@
+from argparse import ArgumentParser
+from leaderboard import MEMORY_PATH
+from os import sysconf
+from resource import RUSAGE_SELF, getrusage
+from spaceinvaders import Game, SpaceInvaders
+from sys import exit
+from threading import active_count
+from time import perf_counter
+from typing import List, NamedTuple, Optional
+
+################################################################
+#                           Configs                            #
+################################################################
+
+DURATION = 4 * 3600.0   # s of wall time
+INTERVAL = 60.0         # s between two samples
+RESTART_DELAY = 2000    # ms between a game over and the next game, the explosions have to be over
+
+# Growth allowed per hour, estimated from the trend of the samples
+MAX_RSS_GROWTH = 16.0           # MB
+MAX_THREADS_GROWTH = 2.0
+MAX_ITEMS_GROWTH = 20.0
+MAX_FRAME_TIME_GROWTH = 2.0     # ms on the 95th percentile
+MIN_SAMPLES = 5                 # before trends are checked
+
+DANGER_TICKS = 12   # ticks ahead a bomb is dodged
+
+################################################################
+#                          Autopilot                           #
+################################################################
+
+class Autopilot:
+    # Presses the keys of the defender: dodges the bombs, then aims at the lowest alien
+    def __init__(self, main_game: Game.MainGame) -> None:
+        self.main_game = main_game
+
+    def threat(self) -> Optional[float]:
+        defender = self.main_game.defender
+        bbox = defender.bbox()
+        margin = defender.delta_x
+        for bomb in self.main_game.fleet.dropped_bombs:
+            if not bomb.isAlive():
+                continue
+            b_bbox = bomb.bbox()
+            close = bbox[1] - b_bbox[3] <= bomb.delta_y * DANGER_TICKS
+            if close and b_bbox[2] >= bbox[0] - margin and b_bbox[0] <= bbox[2] + margin:
+                return bomb.x
+        return None
+
+    def target(self) -> Optional[float]:
+        lowest = None
+        for alien in self.main_game.fleet.aliens:
+            if alien.isAlive() and (lowest is None or alien.y > lowest.y):
+                lowest = alien
+        return None if lowest is None else lowest.x
+
+    def drive(self) -> None:
+        main_game = self.main_game
+        defender = main_game.defender
+        left = right = fire = False
+        threat = self.threat()
+        if threat is not None:
+            # Away from the bomb, unless the edge is too close
+            left = threat >= defender.x and defender.bbox()[0] > defender.delta_x
+            right = not left
+        else:
+            target = self.target()
+            if target is not None:
+                left = target < defender.x - defender.delta_x / 2
+                right = target > defender.x + defender.delta_x / 2
+                fire = not left and not right
+        main_game.left_key_pressed = left
+        main_game.right_key_pressed = right
+        main_game.space_key_pressed = fire
+
+################################################################
+#                             Soak                             #
+################################################################
+
+class Sample(NamedTuple):
+    time: float
+    games: int
+    ticks: int
+    frame_p50: float
+    frame_p95: float
+    frame_p99: float
+    frame_max: float
+    rss: float
+    threads: int
+    items: int
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+def get_rss() -> float:
+    # MB, the current size where /proc is available, the peak size otherwise
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return getrusage(RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+def slope(xs: List[float], ys: List[float]) -> float:
+    # Least squares, per unit of x
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return 0.0 if variance == 0 else sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+class Soak:
+    # Runs until closed with a duration of 0
+    def __init__(self, app: SpaceInvaders, duration: float = DURATION, interval: float = INTERVAL) -> None:
+        self.app = app
+        self.duration = duration
+        self.interval = interval
+        self.start_time = perf_counter()
+        self.last_tick_time = 0.0
+        self.frame_times: List[float] = []
+        self.samples: List[Sample] = []
+        self.failures: List[str] = []
+        self.games = 0
+        self.ticks = 0
+        self.autopilot = Autopilot(app.game.main_game)
+
+    def start(self) -> None:
+        # Nobody is in front of the window
+        self.app.game.pause_when_away = False
+        self.app.game.tick_callbacks.append(self.on_tick)
+        self.app.after(int(self.interval * 1000), self.sample)
+        if self.duration:
+            self.app.after(int(self.duration * 1000), self.stop)
+        self.new_game()
+
+    def new_game(self) -> None:
+        if self.games > 0:
+            self.app.game.restart()
+        else:
+            self.app.game.play()
+        self.games += 1
+        self.autopilot = Autopilot(self.app.game.main_game)
+        self.last_tick_time = 0.0
+
+    def on_tick(self, main_game: Game.MainGame) -> None:
+        now = perf_counter()
+        if self.last_tick_time:
+            self.frame_times.append(now - self.last_tick_time)
+        self.last_tick_time = now
+        self.ticks += 1
+        if main_game.gameover:
+            self.app.after(RESTART_DELAY, self.new_game)
+        else:
+            self.autopilot.drive()
+
+    def sample(self) -> None:
+        frame_times = self.frame_times
+        self.frame_times = []
+        sample = Sample(
+            perf_counter() - self.start_time, self.games, self.ticks,
+            percentile(frame_times, 50) * 1000, percentile(frame_times, 95) * 1000, percentile(frame_times, 99) * 1000,
+            max(frame_times, default=0.0) * 1000, get_rss(), active_count(), len(self.app.game.main_game.find_all())
+        )
+        self.samples.append(sample)
+        print("%8.0fs games %d ticks %d frame p50 %.1f p95 %.1f p99 %.1f max %.1f ms rss %.1f MB threads %d items %d" % sample)
+        self.check()
+        if self.failures:
+            self.stop()
+        else:
+            self.app.after(int(self.interval * 1000), self.sample)
+
+    def check(self) -> None:
+        if len(self.samples) < MIN_SAMPLES:
+            return
+        hours = [sample.time / 3600 for sample in self.samples]
+        self.failures = [
+            "%s grows by %.1f%s per hour" % (name, growth, unit)
+            for name, unit, growth, limit in (
+                ('RSS', ' MB', slope(hours, [sample.rss for sample in self.samples]), MAX_RSS_GROWTH),
+                ('threads', '', slope(hours, [sample.threads for sample in self.samples]), MAX_THREADS_GROWTH),
+                ('canvas items', '', slope(hours, [sample.items for sample in self.samples]), MAX_ITEMS_GROWTH),
+                ('p95 frame time', ' ms', slope(hours, [sample.frame_p95 for sample in self.samples]), MAX_FRAME_TIME_GROWTH)
+            )
+            if growth > limit
+        ]
+
+    def stop(self) -> None:
+        self.app.destroy()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Plays games with an autopilot and fails when the resources used keep growing")
+    parser.add_argument('--duration', type=float, default=DURATION, help="seconds of wall time")
+    parser.add_argument('--interval', type=float, default=INTERVAL, help="seconds between two samples")
+    parser.add_argument('--leaks', action='store_true', help="also fails on leaking images, canvas items and memory, see diagnostics.py")
+    args = parser.parse_args()
+    # The scores of the autopilot stay out of the leaderboard
+    app = SpaceInvaders(leaderboard_path=MEMORY_PATH, event_log_path=None)
+    soak = Soak(app, args.duration, args.interval)
+    leak_failures: List[str] = []
+    if args.leaks:
+        # Imported here, diagnostics plays with this harness
+        from diagnostics import LeakDetector
+        detector = LeakDetector(app, args.interval)
+        detector.start()
+        leak_failures = detector.failures
+    soak.start()
+    app.play()
+    if soak.failures or leak_failures:
+        print("Soak failed:\n  " + "\n  ".join(soak.failures + leak_failures))
+        exit(1)
+    print("Soak passed: %d games, %d ticks" % (soak.games, soak.ticks))
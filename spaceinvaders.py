@@ -1,10 +1,20 @@
-from os.path import abspath, dirname
+from asyncio import AbstractEventLoop, Task, get_running_loop, sleep
+from collections import OrderedDict
+from core import ENTITY_NONE, EVENT_SOUND, FLEET_COLUMNS, FLEET_ROWS, IMAGE_SCALE, SPEED_SCALE, TICK_DELAY, EventListener, ItemRef, Scale, T, use_assets
+from core import Alien, Bomb, Bullet, Defender, Fleet, NullRender, World, set_fleet_size
+from eventlog import EventLog
+from io import BytesIO
+from leaderboard import DB_PATH, Leaderboard
+from metrics import REGISTRY
+from os import environ, scandir
+from os.path import abspath, basename, dirname
 from PIL import Image, ImageDraw, ImageFont, ImageTk
-from random import randrange, sample
-from time import time
-from threading import Thread
-from tkinter import BooleanVar, Canvas, Frame, Tk
-from typing import List, Tuple
+from random import getrandbits
+from recorder import BULLET_FLYING, DEFENDER_EXPLODES, INPUT_FIRE, INPUT_LEFT, INPUT_RIGHT, FlightRecorder
+from time import perf_counter, time
+from threading import Thread, enumerate as threads
+from tkinter import Canvas, Frame, Tk
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 try:
     # playsound version 1.2.2 -> pip install playsound==1.2.2
@@ -14,7 +24,7 @@ try:
         def tryplay():
             try: _ps.playsound(sound)
             except: print("Try an older version of playsound (ex: 1.2.2)")
-        Thread(target=tryplay).start()
+        Thread(target=tryplay, name='playsound').start()
 except:
     def playsound(sound: str) -> None: pass
 
@@ -22,8 +32,36 @@ except:
 #                           Configs                            #
 ################################################################
 
-IMAGE_SCALE = 5
-SPEED_SCALE = 1
+MIN_IMAGE_SCALE = 1
+MAX_IMAGE_SCALE = 8
+SCALED_CACHE_BYTES = 32 * 1024 * 1024
+
+FRAME_DELAY = 8     # ms between two frames, drawn between the last two ticks
+MAX_CATCHUP_TICKS = 8   # run late in a frame, the ticks missed beyond are dropped
+BATCH_RENDER = True # sends the canvas changes of a tick as one Tcl script
+EVENTS_DELAY = 10   # ms between two Tk updates when asyncio owns the loop
+IDLE_EVENTS_DELAY = 50  # same, when no game is running
+PAUSE_WHEN_AWAY = True  # while the window is minimised or has lost the focus
+CHALLENGE = environ.get('SPACE_INVADERS_CHALLENGE', '') == '1'     # barrages of bombs and spread shots, see core.Projectiles
+
+SCORE_DIGITS = 6    # shown for the scores, higher scores stop at all nines
+
+# Metrics are exported in the Prometheus text format when a port or a file is given
+METRICS_PORT = int(environ.get('SPACE_INVADERS_METRICS_PORT', 0))
+METRICS_FILE = environ.get('SPACE_INVADERS_METRICS_FILE')
+METRICS_FILE_DELAY = 5.0
+METRICS_SAMPLE_TICKS = 33   # gauges are sampled about once per second
+
+# The last ticks are kept in memory and written to recordings/ when one takes longer than the budget
+RECORDER_SECONDS = 10.0
+RECORDER_BUDGET = float(environ.get('SPACE_INVADERS_RECORDER_BUDGET', TICK_DELAY))  # ms
+
+# Development mode: the images, the font and the sounds are read again when their files change
+HOT_RELOAD = environ.get('SPACE_INVADERS_HOT_RELOAD', '') == '1'
+HOT_RELOAD_DELAY = 500  # ms between two looks at the files
+
+# The kills, bomb drops, hits and shots of the games are written as columns to this directory when given, never for the harnesses
+EVENT_LOG = environ.get('SPACE_INVADERS_EVENT_LOG')
 
 BASE_PATH = abspath(dirname(__file__))
 IMAGE_PATH = BASE_PATH + '/images/'
@@ -44,10 +82,52 @@ def bbox_diff_to_center(bbox1: Tuple[int, int, int, int], bbox2: Tuple[int, int,
     return bbox_x_diff_to_center(bbox1, bbox2), bbox_y_diff_to_center(bbox1, bbox2)
 
 def get_photoimage(image: Image.Image) -> ImageTk.PhotoImage:
-    return ImageTk.PhotoImage(image)
+    # Sprites of the current scale share one PhotoImage each, other images get their own
+    key = id(image)
+    photoimage = Images.photoimages.get(key)
+    if photoimage is None:
+        Metrics.photoimages.inc()
+        photoimage = ImageTk.PhotoImage(image)
+        if key in Images.photoimages:
+            Images.photoimages[key] = photoimage
+    return photoimage
 
 def get_photoimages(images: List[Image.Image]) -> List[ImageTk.PhotoImage]:
-    return [ImageTk.PhotoImage(img) for img in images]
+    return [get_photoimage(img) for img in images]
+
+def paste_photoimage(photoimage: ImageTk.PhotoImage, image: Image.Image) -> None:
+    # Same PhotoImage with other pixels, the canvas items showing it follow without being touched
+    name = str(photoimage)
+    if (photoimage.tk.getint(photoimage.tk.call('image', 'width', name)), photoimage.tk.getint(photoimage.tk.call('image', 'height', name))) != image.size:
+        photoimage.tk.call(name, 'configure', '-width', image.width, '-height', image.height)
+    photoimage.paste(image if image.mode in ('1', 'L', 'RGB', 'RGBA') else image.convert('RGBA'))
+
+################################################################
+#                     Ressources - Cache                       #
+################################################################
+
+class ScaledCache:
+    # Ressources scaled from their 1x sources, the least recently used are dropped past max_bytes
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries: 'OrderedDict[Tuple[str, float], Tuple[Any, int]]' = OrderedDict()
+
+    def get(self, key: Tuple[str, float], build: Callable[[], Tuple[T, int]]) -> T:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = build()
+            self.nbytes += self.entries[key][1]
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+        return self.entries[key][0]
+
+    def discard(self, match: Callable[[Tuple[str, float]], bool]) -> None:
+        for key in [key for key in self.entries if match(key)]:
+            self.nbytes -= self.entries.pop(key)[1]
+
+SCALED_CACHE = ScaledCache(SCALED_CACHE_BYTES)
 
 ################################################################
 #                     Ressources - Images                      #
@@ -55,42 +135,161 @@ def get_photoimages(images: List[Image.Image]) -> List[ImageTk.PhotoImage]:
 
 def load_image(file: str) -> Image.Image:
     image = Image.open(IMAGE_PATH + file)
-    return image.resize((int(image.width * IMAGE_SCALE), int(image.height * IMAGE_SCALE)), resample=Image.NEAREST)
+    image.load()
+    return image
     
 def load_images(file_format: str, nb: int) -> List[Image.Image]:
     return [load_image(file_format % i) for i in range(1, nb + 1)]
 
+def scale_image(image: Image.Image, scale: float) -> Image.Image:
+    return image.resize((int(image.width * scale), int(image.height * scale)), resample=Image.NEAREST)
+
+def get_nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+Sprites = Dict[str, Union[Image.Image, List[Image.Image]]]
+
 class Images:
-    obstacle = load_image("obstacle.png")
-    defender = load_image("defender.png")
-    defender_explosion = load_images("defender_explosion_%d.png", 2)
-    bullet = load_image("bullet.png")
-    bullet_explosion = load_image("bullet_explosion.png")
-    alien_squid = load_images("alien_squid_%d.png", 2)
-    alien_crab = load_images("alien_crab_%d.png", 2)
-    alien_octopus = load_images("alien_octopus_%d.png", 2)
-    alien_explosion = load_image("alien_explosion.png")
-    bomb_1 = load_images("bomb_1_%d.png", 4)
-    bomb_2 = load_images("bomb_2_%d.png", 4)
-    bomb_3 = load_images("bomb_3_%d.png", 4)
-    bomb_explosion = load_image("bomb_explosion.png")
-    alien_ufo = load_image("alien_ufo.png")
-    alien_ufo_explosion = load_image("alien_ufo_explosion.png")
+    # A file, or the format of the files and the number of frames
+    files: Dict[str, Union[str, Tuple[str, int]]] = {
+        'obstacle': "obstacle.png",
+        'defender': "defender.png",
+        'defender_explosion': ("defender_explosion_%d.png", 2),
+        'bullet': "bullet.png",
+        'bullet_explosion': "bullet_explosion.png",
+        'alien_squid': ("alien_squid_%d.png", 2),
+        'alien_crab': ("alien_crab_%d.png", 2),
+        'alien_octopus': ("alien_octopus_%d.png", 2),
+        'alien_explosion': "alien_explosion.png",
+        'bomb_1': ("bomb_1_%d.png", 4),
+        'bomb_2': ("bomb_2_%d.png", 4),
+        'bomb_3': ("bomb_3_%d.png", 4),
+        'bomb_explosion': "bomb_explosion.png",
+        'alien_ufo': "alien_ufo.png",
+        'alien_ufo_explosion': "alien_ufo_explosion.png"
+    }
+    # Read once at 1x, the scaled sprites below are set by use()
+    sources: Sprites = {name: load_image(file) if isinstance(file, str) else load_images(*file) for name, file in files.items()}
+    scale = 0.0
+    sprites: Sprites
+    obstacle: Image.Image
+    defender: Image.Image
+    defender_explosion: List[Image.Image]
+    bullet: Image.Image
+    bullet_explosion: Image.Image
+    alien_squid: List[Image.Image]
+    alien_crab: List[Image.Image]
+    alien_octopus: List[Image.Image]
+    alien_explosion: Image.Image
+    bomb_1: List[Image.Image]
+    bomb_2: List[Image.Image]
+    bomb_3: List[Image.Image]
+    bomb_explosion: Image.Image
+    alien_ufo: Image.Image
+    alien_ufo_explosion: Image.Image
+    # PhotoImages of the current sprites by id, made on first use
+    photoimages: Dict[int, Optional[ImageTk.PhotoImage]] = {}
+
+    @staticmethod
+    def _build(scale: float) -> Tuple[Tuple[Sprites, Dict[int, Optional[ImageTk.PhotoImage]]], int]:
+        sprites: Sprites = {}
+        for name, source in Images.sources.items():
+            sprites[name] = [scale_image(img, scale) for img in source] if isinstance(source, list) else scale_image(source, scale)
+        images = [img for sprite in sprites.values() for img in (sprite if isinstance(sprite, list) else [sprite])]
+        # The PhotoImages take about as much memory as the images
+        return (sprites, dict.fromkeys(map(id, images))), 2 * sum(map(get_nbytes, images))
+
+    @staticmethod
+    def use(scale: float) -> None:
+        Images.sprites, Images.photoimages = SCALED_CACHE.get(('images', scale), lambda: Images._build(scale))
+        for name, sprite in Images.sprites.items():
+            setattr(Images, name, sprite)
+        Images.scale = scale
+
+    @staticmethod
+    def find(file: str) -> Optional[Tuple[str, int]]:
+        # Name of the sprite read from the file, and index of the frame (-1 for a single image)
+        for name, spec in Images.files.items():
+            if isinstance(spec, str):
+                if spec == file:
+                    return name, -1
+            else:
+                for index in range(spec[1]):
+                    if spec[0] % (index + 1) == file:
+                        return name, index
+        return None
+
+    @staticmethod
+    def reload(file: str) -> bool:
+        # Only this sprite is read and scaled again, its PhotoImage keeps showing it on the canvas
+        found = Images.find(file)
+        if found is None:
+            return False
+        name, index = found
+        source = load_image(file)
+        new = scale_image(source, Images.scale)
+        sources, sprite = Images.sources[name], Images.sprites[name]
+        if isinstance(sources, list) and isinstance(sprite, list):
+            # Changed in place, the lists are shared with the fleet and the bombs
+            sources[index] = source
+            old, sprite[index] = sprite[index], new
+        else:
+            Images.sources[name] = source
+            old, Images.sprites[name] = sprite, new
+            setattr(Images, name, new)
+        # The id of the old sprite could be reused by any other image
+        photoimage = Images.photoimages.pop(id(old), None)
+        Images.photoimages[id(new)] = photoimage
+        if photoimage is not None:
+            paste_photoimage(photoimage, new)
+        # The other scales are made again from the sources when used, the menu shows some sprites
+        SCALED_CACHE.discard(lambda key: key[0] == 'images' and key[1] != Images.scale or key[0].startswith('play menu'))
+        return True
 
 ################################################################
 #                      Ressources - Font                       #
 ################################################################
 
+def load_font(file: str) -> bytes:
+    with open(FONT_PATH + file, 'rb') as font:
+        return font.read()
+
 class Font:
-    size = int(6 * IMAGE_SCALE)
-    _font = ImageFont.truetype(FONT_PATH + "space_invaders.ttf", size)
+    # Read once, the glyphs below are drawn at the size of the scale set by use()
+    file = "space_invaders.ttf"
+    source = load_font(file)
+    chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789=*?-"
+    scale = 0.0
+    size: int
+    _chars_as_imgs: Dict[str, Image.Image]
+
+    @staticmethod
+    def _build(scale: float) -> Tuple[Tuple[int, Dict[str, Image.Image]], int]:
+        size = int(6 * scale)
+        font = ImageFont.truetype(BytesIO(Font.source), size)
+
+        # Converts the required chars into images
+        chars_as_imgs = {}
+        for char in Font.chars:
+            img = Image.new('RGBA', (size, size), '#00000000')
+            ImageDraw.Draw(img).text(((size - font.getlength(char)) / 2, 0), char, "#FFFFFF", font)
+            chars_as_imgs[char] = img
+        return (size, chars_as_imgs), sum(map(get_nbytes, chars_as_imgs.values()))
 
-    # Converts the required chars into images
-    _chars_as_imgs = {}
-    for char in "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789=*?-":
-        _img = Image.new('RGBA', (size, size), '#00000000')
-        ImageDraw.Draw(_img).text(((size - _font.getlength(char)) / 2, 0), char, "#FFFFFF", _font)
-        _chars_as_imgs[char] = _img
+    @staticmethod
+    def use(scale: float) -> None:
+        Font.size, Font._chars_as_imgs = SCALED_CACHE.get(('font', scale), lambda: Font._build(scale))
+        Font.scale = scale
+
+    @staticmethod
+    def reload(file: str) -> bool:
+        # The glyphs of the current scale are drawn again, the texts already made are left to their screens
+        if file != Font.file:
+            return False
+        Font.source = load_font(file)
+        SCALED_CACHE.discard(lambda key: key[0] == 'font' or key[0].startswith(('top bar', 'play menu')))
+        Font.use(Font.scale)
+        return True
 
     @staticmethod
     def text_as_image(text: str, color: str = None) -> Image.Image:
@@ -137,417 +336,442 @@ class Sounds:
     alien_ufo_move = load_sound("alien_ufo_move.wav")
     alien_ufo_killed = load_sound("alien_ufo_killed.wav")
 
+# By index in the events of the flight recorder
+SOUNDS = [
+    Sounds.defender_killed, Sounds.defender_shoot, *Sounds.alien_move, Sounds.alien_killed,
+    Sounds.alien_ufo_move, Sounds.alien_ufo_killed
+]
+
 ################################################################
-#                             Core                             #
+#                     Ressources - Reload                      #
 ################################################################
 
-class Defender:
-    def __init__(self, canvas: Canvas) -> None:
-        self.canvas = canvas
-        self.image = get_photoimage(Images.defender)
-        self.images_explosion = get_photoimages(Images.defender_explosion)
-        self.delta_x = 20 * SPEED_SCALE
-        self.lives = 3
-        self.score = 0
-        self.alive = True
-        self.explodes = False
-        self.bullet = None
-        self.id = self._create_id()
-
-    def _create_id(self) -> int:
-        return self.canvas.create_image(self.canvas.winfo_reqwidth() / 2, self.canvas.winfo_reqheight() - self.image.height() / 2, image=self.image)
-
-    def isAlive(self) -> None:
-        return self.alive and not self.explodes
-
-    def kill(self) -> None:
-        if self.alive:
-            self.alive = False
-            self.lives = 0
-            self.canvas.delete(self.id)
-
-    def explode(self) -> None:
-        if self.isAlive():
-            self.explodes = True
-            playsound(Sounds.defender_killed)
-            self.lives -= 1
-            animating = BooleanVar(self.canvas, True)
-            time = 0
-            for _ in range(5):
-                self.canvas.after(time, lambda: self.canvas.itemconfigure(self.id, image=self.images_explosion[0]))
-                time += 120
-                self.canvas.after(time, lambda: self.canvas.itemconfigure(self.id, image=self.images_explosion[1]))
-                time += 120
-            self.canvas.after(time - 60, lambda: animating.set(False))
-            self.canvas.wait_variable(animating)
-            if self.lives > 0:
-                self.canvas.itemconfigure(self.id, image=self.image)
-                self.explodes = False
-            else:
-                self.kill()
-
-    def move(self, dx: float) -> None:
-        if self.isAlive():
-            bbox = self.canvas.bbox(self.id)
-            x2_max = self.canvas.winfo_reqwidth()
-            if bbox[0] + dx < 0:
-                dx -= bbox[0] + dx
-            elif bbox[2] + dx > x2_max:
-                dx -= bbox[2] + dx - x2_max
-            self.canvas.move(self.id, dx, 0)
-
-    def fire(self) -> None:
-        if self.isAlive() and self.bullet is None:
-            self.bullet = Bullet(self.canvas, self)
-            playsound(Sounds.defender_shoot)
-
-    def touched_by(self, bomb: 'Bomb') -> bool:
-        if self.isAlive() and bomb.isAlive():
-            a_bbox = self.canvas.bbox(self.id)
-            b_bbox = self.canvas.bbox(bomb.id)
-            inXRange = a_bbox[0] <= b_bbox[0] <= a_bbox[2] or a_bbox[0] <= b_bbox[2] <= a_bbox[2]
-            inYRange = a_bbox[1] <= b_bbox[1] <= a_bbox[3] or a_bbox[1] <= b_bbox[3] <= a_bbox[3]
-            return inXRange and inYRange
-        return False
-
-class Bullet:
-    def __init__(self, canvas: Canvas, defender: Defender) -> None:
-        self.canvas = canvas
-        self.defender = defender
-        self.image = get_photoimage(Images.bullet)
-        self.image_explosion = get_photoimage(Images.bullet_explosion)
-        self.delta_y = 18 * SPEED_SCALE
-        self.alive = True
-        self.explodes = False
-        self.id = self._create_id()
-
-    def _create_id(self) -> int:
-        bbox = self.canvas.bbox(self.defender.id)
-        return self.canvas.create_image(bbox[0] + int((bbox[2] - bbox[0]) / 2), bbox[1] - self.image.height() / 2, image=self.image)
-
-    def isAlive(self):
-        return self.alive and not self.explodes
-
-    def kill(self) -> None:
-        if self.alive:
-            self.alive = False
-            self.canvas.delete(self.id)
-            self.defender.bullet = None
-
-    def explode(self) -> None:
-        if self.isAlive():
-            self.explodes = True
-            self.canvas.itemconfigure(self.id, image=self.image_explosion)
-            self.canvas.after(60, lambda: self.kill())
-
-    def move(self) -> None:
-        if self.isAlive():
-            bbox = self.canvas.bbox(self.id)
-            if bbox[1] > self.delta_y:
-                self.canvas.move(self.id, 0, -self.delta_y)
-            else:
-                self.explode()
+class AssetWatcher:
+    # Looks at the modification times of the files, a few dozen stats each time
+    def __init__(self) -> None:
+        self.mtimes = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        mtimes = {}
+        for path in (IMAGE_PATH, FONT_PATH, SOUND_PATH):
+            with scandir(path) as entries:
+                for entry in entries:
+                    stat = entry.stat()
+                    mtimes[entry.path] = stat.st_mtime_ns, stat.st_size
+        return mtimes
+
+    def changes(self) -> List[str]:
+        mtimes = self._scan()
+        changed = sorted(path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime)
+        self.mtimes = mtimes
+        return changed
+
+def reload_asset(path: str) -> Optional[str]:
+    # The kind of asset read again, None for a file the game does not use
+    directory, file = dirname(path) + '/', basename(path)
+    if directory == IMAGE_PATH and Images.reload(file):
+        return 'image'
+    if directory == FONT_PATH and Font.reload(file):
+        return 'font'
+    if directory == SOUND_PATH and path in SOUNDS:
+        # Played from the file each time, nothing is kept in memory
+        return 'sound'
+    return None
 
-class Alien:
-    def __init__(self, canvas: Canvas, x: float, y: float, frames: List[Image.Image], tag: str, worth: int) -> None:
-        self.canvas = canvas
-        self.start_pos = x, y
-        self.frames = get_photoimages(frames)
-        self.current_frame = 0
-        self.image_explosion = get_photoimage(Images.alien_explosion)
-        self.tag = tag
-        self.worth = worth
-        self.alive = True
-        self.explodes = False
-        self.id = self._create_id()
-
-    def _create_id(self) -> int:
-        return self.canvas.create_image(*self.start_pos, image=self.frames[0], tags=self.tag)
-
-    def isAlive(self):
-        return self.alive and not self.explodes
-
-    def kill(self) -> None:
-        if self.alive:
-            self.alive = False
-            self.current_frame = 0
-            self.canvas.itemconfigure(self.id, state='hidden', image=self.frames[0])
-            
-    def explode(self) -> None:
-        if self.isAlive():
-            self.explodes = True
-            self.canvas.itemconfigure(self.id, image=self.image_explosion)
-            self.canvas.after(60, lambda: self.kill())
-
-    def move(self, dx: float, dy: float) -> None:
-        if self.alive:
-            self.canvas.move(self.id, dx, dy)
-
-    def animate(self) -> None:
-        if self.isAlive():
-            self.current_frame = (self.current_frame + 1) % len(self.frames)
-            self.canvas.itemconfigure(self.id, image=self.frames[self.current_frame])
-
-    def touched_by(self, bullet: Bullet) -> bool:
-        if self.isAlive() and bullet.isAlive():
-            a_bbox = self.canvas.bbox(self.id)
-            b_bbox = self.canvas.bbox(bullet.id)
-            inXRange = a_bbox[0] <= b_bbox[0] <= a_bbox[2] or a_bbox[0] <= b_bbox[2] <= a_bbox[2]
-            inYRange = a_bbox[1] <= b_bbox[1] <= a_bbox[3] or a_bbox[1] <= b_bbox[3] <= a_bbox[3]
-            return inXRange and inYRange
-        return False
-
-class Bomb:
-    def __init__(self, canvas: Canvas, fleet: 'Fleet', alien: Alien) -> None:
-        self.canvas = canvas
-        self.fleet = fleet
-        self.alien = alien
-        self.current_frame = 0
-        self.frames = get_photoimages([Images.bomb_1, Images.bomb_2, Images.bomb_3][randrange(3)])
-        self.image_explosion = get_photoimage(Images.bomb_explosion)
-        self.delta_y = 8 * SPEED_SCALE
-        self.alive = True
-        self.explodes = False
-        self.id = self._create_id()
-
-    def _create_id(self) -> int:
-        bbox = self.canvas.bbox(self.alien.id)
-        return self.canvas.create_image(bbox[0] + (bbox[2] - bbox[0]) // 2, bbox[3] + self.frames[0].height() / 2, image=self.frames[0])
-
-    def isAlive(self):
-        return self.alive and not self.explodes
-
-    def kill(self) -> None:
-        if self.alive:
-            self.alive = False
-            self.canvas.delete(self.id)
-            self.fleet.dropped_bombs.remove(self)
-
-    def explode(self) -> None:
-        if self.isAlive():
-            self.explodes = True
-            self.canvas.itemconfigure(self.id, image=self.image_explosion)
-            self.canvas.after(60, lambda: self.kill())
-
-    def move(self) -> None:
-        if self.isAlive():
-            bbox = self.canvas.bbox(self.id)
-            if bbox[3] + self.delta_y < self.canvas.winfo_reqheight():
-                self.canvas.move(self.id, 0, self.delta_y)
-            else:
-                self.explode()
+################################################################
+#                            Scale                             #
+################################################################
 
-    def animate(self) -> None:
-        if self.isAlive():
-            self.current_frame = (self.current_frame + 1) % len(self.frames)
-            self.canvas.itemconfigure(self.id, image=self.frames[self.current_frame])
+def set_scale(image_scale: float) -> None:
+    # Speeds follow the image scale so that the game plays the same at any size
+    Scale.image = image_scale
+    Scale.speed = SPEED_SCALE * image_scale / IMAGE_SCALE
+    Images.use(image_scale)
+    Font.use(image_scale)
 
-class Fleet:
-    rows = 5
-    columns = 11
-    inner_gap = 4 * IMAGE_SCALE
-    frames_max_width = max(max(Images.alien_squid[0].width, Images.alien_crab[0].width), Images.alien_octopus[0].width)
+use_assets(Images, Sounds)
+set_scale(IMAGE_SCALE)
+
+################################################################
+#                           Metrics                            #
+################################################################
+
+class Metrics:
+    photoimages = REGISTRY.counter('spaceinvaders_photoimages_created_total', "PhotoImages created")
+    ticks = REGISTRY.counter('spaceinvaders_ticks_total', "Game ticks run")
+    tick = REGISTRY.histogram('spaceinvaders_tick_seconds', "Duration of a game tick")
+    frames = REGISTRY.counter('spaceinvaders_frames_total', "Frames drawn between two ticks")
+    frames_skipped = REGISTRY.counter('spaceinvaders_frames_skipped_total', "Frames skipped since the ticks took their time")
+    ticks_dropped = REGISTRY.counter('spaceinvaders_ticks_dropped_total', "Ticks not run after a stall")
+    phases = {
+        phase: REGISTRY.histogram('spaceinvaders_tick_phase_seconds', "Duration of a phase of a game tick", {'phase': phase})
+        for phase in ('move_bombs', 'move_aliens', 'move_bullet', 'action_defender', 'check_status', 'render', 'callbacks')
+    }
+    bombs = REGISTRY.gauge('spaceinvaders_bombs', "Bombs dropped by the fleet")
+    projectiles = REGISTRY.gauge('spaceinvaders_projectiles', "Bombs and bullets in flight in the challenge mode")
+    aliens = REGISTRY.gauge('spaceinvaders_aliens', "Aliens alive in the fleet")
+    canvas_items = REGISTRY.gauge('spaceinvaders_canvas_items', "Items on the game canvas")
+    sound_threads = REGISTRY.gauge('spaceinvaders_sound_threads', "Threads playing a sound")
+    tcl_calls = REGISTRY.histogram('spaceinvaders_tcl_calls_per_tick', "Calls from the game canvas to Tcl between two ticks", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
 
-    def __init__(self, canvas: Canvas) -> None:
-        self.canvas = canvas
-        self.delta_x = 3 * SPEED_SCALE
-        self.delta_y = 15 * SPEED_SCALE
-        self.animation_last_time = 0.0
-        self.animation_delay = 0.8
-        self.current_sound = 0
-        self.dropped_bombs = []
-        self.dropped_bombs_max = 3
-        self.dropped_bombs_last_time = 0.0
-        self.dropped_bombs_delay = 0.4
-        self.tag = 'fleet'
-        self.aliens = self._create_fleet()
-        
-    def _create_fleet(self) -> None:
-        aliens = []
-        for row in range(Fleet.rows):
-            worth, frames = (
-                (30, Images.alien_squid) if row < 1 else
-                (20, Images.alien_crab) if row < 3 else
-                (10, Images.alien_octopus)
-            )
-            for column in range(Fleet.columns):
-                x = column * (Fleet.frames_max_width + self.inner_gap) + Fleet.frames_max_width / 2
-                y = row * (frames[0].height + self.inner_gap) + frames[0].height / 2
-                alien = Alien(self.canvas, x, y, frames, self.tag, worth)
-                aliens.append(alien)
-        return aliens
-
-    def _rand_bomb_drop(self) -> None:
-        if len(self.dropped_bombs) < self.dropped_bombs_max and time() - self.dropped_bombs_last_time >= self.dropped_bombs_delay:
-            lowest_aliens = []
-            for column in range(Fleet.columns):
-                for row in range(Fleet.rows - 1, -1, -1):
-                    alien = self.aliens[Fleet.columns * row + column]
-                    if alien.isAlive():
-                        lowest_aliens.append(alien)
-                        break
-            if lowest_aliens != []:
-                selected_aliens = sample(lowest_aliens, randrange(0, min(len(lowest_aliens), self.dropped_bombs_max - len(self.dropped_bombs)) + 1))
-                for alien in selected_aliens:
-                    self.dropped_bombs.append(Bomb(self.canvas, self, alien))
-                self.dropped_bombs_last_time = time()
-
-    def move(self) -> None:
-        bbox = self.canvas.bbox(self.tag)
-        animate = time() - self.animation_last_time >= self.animation_delay
-        if bbox is not None:
-            change_direction = bbox[0] + self.delta_x <= 0 or bbox[2] + self.delta_x >= self.canvas.winfo_reqwidth()
-            for alien in self.aliens:
-                if change_direction:
-                    alien.move(0, self.delta_y)
-                else:
-                    alien.move(self.delta_x, 0)
-                if animate:
-                    alien.animate()
-            if change_direction:
-                self.delta_x = -self.delta_x
-            self._rand_bomb_drop()
-        if animate:
-            self.animation_last_time = time()
-            playsound(Sounds.alien_move[self.current_sound])
-            self.current_sound = (self.current_sound + 1) % len(Sounds.alien_move)
-
-    def manage_touched_aliens_by(self, defender: Defender) -> None:
-        if defender.bullet is not None:
-            for alien in self.aliens:
-                if alien.touched_by(defender.bullet):
-                    playsound(Sounds.alien_killed)
-                    alien.explode()
-                    defender.bullet.kill()
-                    defender.score += alien.worth
-                    break
-    
     @staticmethod
-    def get_width() -> int:
-        return Fleet.columns * (Fleet.frames_max_width + Fleet.inner_gap) - Fleet.inner_gap
+    def sample(main_game: 'Game.MainGame') -> None:
+        Metrics.bombs.set(len(main_game.fleet.dropped_bombs))
+        if main_game.world.projectiles is not None:
+            Metrics.projectiles.set(main_game.world.projectiles.count)
+        Metrics.aliens.set(sum(alien.alive for alien in main_game.fleet.aliens))
+        Metrics.canvas_items.set(len(main_game.find_all()))
+        Metrics.sound_threads.set(sum(thread.name == 'playsound' for thread in threads()))
 
     @staticmethod
-    def get_height() -> int:
-        height = -Fleet.inner_gap
-        for row in range(Fleet.rows):
-            img = Images.alien_squid[0] if row < 1 else Images.alien_crab[0] if row < 3 else Images.alien_octopus[0]
-            height += img.height + Fleet.inner_gap
-        return height
+    def export() -> None:
+        if METRICS_PORT:
+            REGISTRY.serve(METRICS_PORT)
+        if METRICS_FILE:
+            REGISTRY.write_every(METRICS_FILE, METRICS_FILE_DELAY)
+
+################################################################
+#                            Render                            #
+################################################################
+
+class TclCounter:
+    # Stands for the Tcl interpreter of a widget to count the calls made through it
+    def __init__(self, tk: Any) -> None:
+        self.tk = tk
+        self.calls = 0
+
+    def call(self, *args: Any) -> Any:
+        self.calls += 1
+        return self.tk.call(*args)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.tk, name)
+
+class RenderBuffer:
+    # Collects the canvas changes of a tick and sends them to Tcl as one script on flush
+    # Values must be numbers or single Tcl words (item ids, tags, image names, states)
+    def __init__(self, canvas: Canvas, batch: bool = BATCH_RENDER) -> None:
+        self.canvas = canvas
+        self.path = str(canvas)
+        self.batch = batch
+        self.width = canvas.winfo_reqwidth()
+        self.height = canvas.winfo_reqheight()
+        self.moves: Dict[ItemRef, List[float]] = {}
+        self.commands: List[str] = []
+        self.listeners: List[EventListener] = []
+
+    def create_image(self, x: float, y: float, **options: Any) -> int:
+        # Not delayed since the id is needed
+        return self.canvas.create_image(x, y, **options)
+
+    def move(self, item: ItemRef, dx: float, dy: float) -> None:
+        if not self.batch:
+            self.canvas.move(item, dx, dy)
+        elif item in self.moves:
+            move = self.moves[item]
+            move[0] += dx
+            move[1] += dy
+        else:
+            self.moves[item] = [dx, dy]
+
+    def _flush_moves(self) -> None:
+        for item, (dx, dy) in self.moves.items():
+            self.commands.append('%s move %s %r %r' % (self.path, item, dx, dy))
+        self.moves.clear()
+
+    def coords(self, item: ItemRef, x: float, y: float) -> None:
+        if not self.batch:
+            self.canvas.coords(item, x, y)
+        else:
+            # A pending move may involve the item through a tag
+            self._flush_moves()
+            self.commands.append('%s coords %s %r %r' % (self.path, item, x, y))
+
+    def itemconfigure(self, item: ItemRef, **options: Any) -> None:
+        if not self.batch:
+            self.canvas.itemconfigure(item, **options)
+        else:
+            self.commands.append('%s itemconfigure %s %s' % (self.path, item, ' '.join('-%s %s' % option for option in options.items())))
+
+    def delete(self, item: ItemRef) -> None:
+        if not self.batch:
+            self.canvas.delete(item)
+        else:
+            self.moves.pop(item, None)
+            self.commands.append('%s delete %s' % (self.path, item))
+
+    def flush(self) -> None:
+        self._flush_moves()
+        if self.commands:
+            self.canvas.tk.call('eval', '\n'.join(self.commands))
+            self.commands.clear()
+
+    def photo(self, image: Image.Image) -> ImageTk.PhotoImage:
+        return get_photoimage(image)
+
+    def photos(self, images: List[Image.Image]) -> List[ImageTk.PhotoImage]:
+        return get_photoimages(images)
+
+    def play(self, sound: str) -> None:
+        playsound(sound)
+        self.event(EVENT_SOUND, ENTITY_NONE, 0, 0, SOUNDS.index(sound))
+
+    def event(self, kind: int, entity: int, x: float, y: float, value: int = 0, index: int = -1) -> None:
+        for listener in self.listeners:
+            listener(kind, entity, x, y, value, index)
+
+################################################################
+#                            World                             #
+################################################################
+
+class Interpolation:
+    # Shows the moving items of a world between its last two ticks
+    # The items are moved back where the world has them before it runs again
+    def __init__(self, world: World) -> None:
+        self.world = world
+        self.wave = world.fleet.wave
+        self.previous: Dict[ItemRef, Tuple[float, float]] = {}
+        self.current = self._positions()
+        self.shown: Dict[ItemRef, Tuple[float, float]] = {}
+
+    def _positions(self) -> Dict[ItemRef, Tuple[float, float]]:
+        world = self.world
+        positions: Dict[ItemRef, Tuple[float, float]] = {world.fleet.tag: (world.fleet.offset_x, world.fleet.offset_y)}
+        if world.defender.alive:
+            positions[world.defender.id] = world.defender.x, world.defender.y
+        bullet = world.defender.bullet
+        if bullet is not None:
+            positions[bullet.id] = bullet.x, bullet.y
+        for bomb in world.fleet.dropped_bombs:
+            positions[bomb.id] = bomb.x, bomb.y
+        return positions
+
+    def tick(self) -> None:
+        self.previous = self.current
+        self.current = self._positions()
+        if self.world.fleet.wave != self.wave:
+            # A new wave starts back at the top, not slid there
+            self.wave = self.world.fleet.wave
+            del self.previous[self.world.fleet.tag]
+
+    def show(self, alpha: float) -> None:
+        # alpha from 0 at the previous tick to 1 at the last one
+        render = self.world.render
+        for item, (x, y) in self.current.items():
+            previous = self.previous.get(item)
+            if previous is None:
+                continue
+            dx, dy = (previous[0] - x) * (1 - alpha), (previous[1] - y) * (1 - alpha)
+            shown_dx, shown_dy = self.shown.get(item, (0.0, 0.0))
+            if dx != shown_dx or dy != shown_dy:
+                render.move(item, dx - shown_dx, dy - shown_dy)
+                self.shown[item] = dx, dy
+
+    def undo(self) -> None:
+        for item, (dx, dy) in self.shown.items():
+            self.world.render.move(item, -dx, -dy)
+        self.shown.clear()
+
+    def reset(self) -> None:
+        self.undo()
+        self.wave = self.world.fleet.wave
+        self.previous = {}
+        self.current = self._positions()
+
+################################################################
+#                            Layout                            #
+################################################################
+
+class Layout:
+    # Places images from their sizes the way the canvas would, without a Tcl round trip per item
+    # Boxes are in whole pixels like the canvas bboxes
+    def __init__(self) -> None:
+        self.images: Dict[str, Image.Image] = {}
+        self.boxes: Dict[str, Tuple[int, int, int, int]] = {}
+        self.tags: Dict[str, List[str]] = {}
+
+    def add(self, name: str, image: Image.Image, x: float, y: float, anchor: str = 'nw', tags: List[str] = []) -> Tuple[int, int, int, int]:
+        x1 = round(x) - (image.width // 2 if anchor == 'n' else 0)
+        y1 = round(y)
+        self.images[name] = image
+        self.boxes[name] = x1, y1, x1 + image.width, y1 + image.height
+        for tag in tags:
+            self.tags.setdefault(tag, []).append(name)
+        return self.boxes[name]
+
+    def _names(self, tag_or_name: str) -> List[str]:
+        return self.tags.get(tag_or_name, [tag_or_name])
+
+    def bbox(self, tag_or_name: str) -> Tuple[int, int, int, int]:
+        boxes = [self.boxes[name] for name in self._names(tag_or_name)]
+        return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+    def move(self, tag_or_name: str, dx: int, dy: int) -> None:
+        for name in self._names(tag_or_name):
+            x1, y1, x2, y2 = self.boxes[name]
+            self.boxes[name] = x1 + dx, y1 + dy, x2 + dx, y2 + dy
+
+    def flatten(self, tag: str) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+        # The images of the tag drawn into one, to be shown as a single canvas item
+        bbox = self.bbox(tag)
+        image = Image.new('RGBA', (bbox[2] - bbox[0], bbox[3] - bbox[1]), '#00000000')
+        for name in self._names(tag):
+            box = self.boxes[name]
+            image.alpha_composite(self.images[name].convert('RGBA'), (box[0] - bbox[0], box[1] - bbox[1]))
+        return image, bbox
+
+    def get_nbytes(self) -> int:
+        return sum(map(get_nbytes, self.images.values()))
+
+class Odometer:
+    # A number drawn as one canvas item per digit, only the digits that change are configured
+    def __init__(self, canvas: Canvas, x: float, y: float, digits_imgs: List[ImageTk.PhotoImage], nb_digits: int = SCORE_DIGITS, tags: str = '') -> None:
+        self.canvas = canvas
+        self.digits_imgs = digits_imgs
+        self.max_value = 10 ** nb_digits - 1
+        self.value = 0
+        self.digits = [0] * nb_digits
+        self.items = [canvas.create_image(x + i * Font.size, y, image=digits_imgs[0], anchor='nw', tags=tags) for i in range(nb_digits)]
+
+    def set(self, value: int) -> None:
+        value = min(value, self.max_value)
+        if value != self.value:
+            self.value = value
+            for i in range(len(self.digits) - 1, -1, -1):
+                value, digit = divmod(value, 10)
+                if digit != self.digits[i]:
+                    self.digits[i] = digit
+                    self.canvas.itemconfigure(self.items[i], image=self.digits_imgs[digit])
 
 class Game(Frame):
     class TopBar(Canvas):
         def __init__(self, game: 'Game') -> None:
             super().__init__(game, width=game.default_width, height=0, bg='#000000', highlightthickness=0)
-            self.label_score_img = get_photoimage(Font.text_as_image("SCORE"))
-            self.value_score_img = get_photoimage(Font.text_as_image("0000"))
-            self.label_high_score_img = get_photoimage(Font.text_as_image("HI-SCORE"))
-            self.value_high_score_img = get_photoimage(Font.text_as_image("0000"))
-
-            label_score = self.create_image(Font.size, 0, image=self.label_score_img, anchor='nw', tags='content')
-            
-            self.value_score = self.create_image(0, 0, image=self.value_score_img, anchor='n', tags='content')
-            bbox_label_score = self.bbox(label_score)
-            self.move(self.value_score, bbox_x_diff_to_center(self.bbox(self.value_score), bbox_label_score), bbox_label_score[3] + Font.size)
-            
-            label_high_score = self.create_image(0, 0, image=self.label_high_score_img, anchor='nw', tags='content')
-            self.move(label_high_score, bbox_label_score[2] + Font.size, bbox_y_diff_to_center(self.bbox(label_high_score), bbox_label_score))
-            
-            self.value_high_score = self.create_image(0, 0, image=self.value_high_score_img, anchor='n', tags='content')
-            bbox_label_high_score = self.bbox(label_high_score)
-            self.move(self.value_high_score, bbox_x_diff_to_center(self.bbox(self.value_high_score), bbox_label_high_score), bbox_label_high_score[3] + Font.size)
-            
-            self.configure(height=self.bbox('content')[3])
+            layout, labels, bbox_labels = Game.TopBar.get_layout()
+            self.labels_img = get_photoimage(labels)
+            self.digits_imgs = [get_photoimage(Font.text_as_image(str(digit))) for digit in range(10)]
+            self.create_image(*bbox_labels[:2], image=self.labels_img, anchor='nw', tags='content')
+            self.value_score = Odometer(self, *layout.boxes['value_score'][:2], self.digits_imgs, tags='content')
+            self.value_high_score = Odometer(self, *layout.boxes['value_high_score'][:2], self.digits_imgs, tags='content')
+            self.configure(height=layout.bbox('content')[3])
+
+        def refresh(self) -> None:
+            # Drawn again into the same PhotoImages once the font changed
+            paste_photoimage(self.labels_img, Game.TopBar.get_layout()[1])
+            for digit, photoimage in enumerate(self.digits_imgs):
+                paste_photoimage(photoimage, Font.text_as_image(str(digit)))
+
+        @staticmethod
+        def get_layout() -> Tuple[Layout, Image.Image, Tuple[int, int, int, int]]:
+            return SCALED_CACHE.get(('top bar %d' % SCORE_DIGITS, Scale.image), Game.TopBar.build_layout)
+
+        @staticmethod
+        def build_layout() -> Tuple[Tuple[Layout, Image.Image, Tuple[int, int, int, int]], int]:
+            layout = Layout()
+            bbox_label_score = layout.add('label_score', Font.text_as_image("SCORE"), Font.size, 0, 'nw', ['labels', 'content'])
+            bbox_value_score = layout.add('value_score', Font.text_as_image("0" * SCORE_DIGITS), 0, 0, 'n', ['content'])
+            layout.move('value_score', bbox_x_diff_to_center(bbox_value_score, bbox_label_score), bbox_label_score[3] + Font.size)
+            bbox_label_high_score = layout.add('label_high_score', Font.text_as_image("HI-SCORE"), 0, 0, 'nw', ['labels', 'content'])
+            layout.move('label_high_score', bbox_label_score[2] + Font.size, bbox_y_diff_to_center(bbox_label_high_score, bbox_label_score))
+            bbox_label_high_score = layout.boxes['label_high_score']
+            bbox_value_high_score = layout.add('value_high_score', Font.text_as_image("0" * SCORE_DIGITS), 0, 0, 'n', ['content'])
+            layout.move('value_high_score', bbox_x_diff_to_center(bbox_value_high_score, bbox_label_high_score), bbox_label_high_score[3] + Font.size)
+            labels, bbox_labels = layout.flatten('labels')
+            return (layout, labels, bbox_labels), layout.get_nbytes() + 2 * get_nbytes(labels)
 
         def set_score(self, score: int) -> None:
-            score %= 10000
-            self.value_score_img = get_photoimage(Font.text_as_image(str(score).zfill(4)))
-            self.itemconfigure(self.value_score, image=self.value_score_img)
+            self.value_score.set(score)
 
         def set_high_score(self, score: int) -> None:
-            score %= 10000
-            self.value_high_score_img = get_photoimage(Font.text_as_image(str(score).zfill(4)))
-            self.itemconfigure(self.value_high_score, image=self.value_high_score_img)
+            self.value_high_score.set(score)
 
     class PlayMenu(Canvas):
         def __init__(self, game: 'Game') -> None:
             self.game = game
             super().__init__(self.game, width=self.game.default_width, height=self.game.default_height, bg='#000000', highlightthickness=0)
+            layout, content, bbox_content = self.get_layout()
             self.images = {
                 'btn': {
-                    'play': get_photoimage(Font.text_as_image("PLAY")),
-                    'play_hover': get_photoimage(Font.text_as_image("PLAY", "#FF0000"))
+                    'play': get_photoimage(layout.images['btn_play']),
+                    'play_hover': get_photoimage(layout.images['btn_play_hover'])
                 },
-                'img': {
-                    'ufo': get_photoimage(Images.alien_ufo),
-                    'squid': get_photoimage(Images.alien_squid[1]),
-                    'crab': get_photoimage(Images.alien_crab[0]),
-                    'octopus': get_photoimage(Images.alien_octopus[1])
-                },
-                'label': {
-                    'title': get_photoimage(Font.text_as_image("SPACES  INVADERS")),
-                    'sat': get_photoimage(Font.text_as_image("*SCORE ADVANCE TABLE*")),
-                    'ufo': get_photoimage(Font.text_as_image("=? MYSTERY")),
-                    'squid': get_photoimage(Font.text_as_image("=30 POINTS")),
-                    'crab': get_photoimage(Font.text_as_image("=20 POINTS")),
-                    'octopus': get_photoimage(Font.text_as_image("=10 POINTS"))
-                }
+                'content': get_photoimage(content)
             }
-
-            self.btn_play = self.create_image(0, 0, image=self.images['btn']['play'], anchor='n', tags='content')
-            label_title = self.create_image(0, self.bbox(self.btn_play)[3] + Font.size * 2, image=self.images['label']['title'], anchor='n', tags='content')
-            label_sat = self.create_image(0, self.bbox(label_title)[3] + Font.size * 3, image=self.images['label']['sat'], anchor='n', tags='content')
-            bbox_label_sat = self.bbox(label_sat)
-
-            img_ufo = self.create_image(0, bbox_label_sat[3] + Font.size, image=self.images['img']['ufo'], anchor='n', tags=['score_table_img', 'score_table', 'content'])
-            bbox_img_ufo = self.bbox(img_ufo)
-            img_squid = self.create_image(0, bbox_img_ufo[3] + Font.size, image=self.images['img']['squid'], anchor='n', tags=['score_table_img', 'score_table', 'content'])
-            bbox_img_squid = self.bbox(img_squid)
-            img_crab = self.create_image(0, bbox_img_squid[3] + Font.size, image=self.images['img']['crab'], anchor='n', tags=['score_table_img', 'score_table', 'content'])
-            bbox_img_crab = self.bbox(img_crab)
-            img_octopus = self.create_image(0, bbox_img_crab[3] + Font.size, image=self.images['img']['octopus'], anchor='n', tags=['score_table_img', 'score_table', 'content'])
-            bbox_img_octopus = self.bbox(img_octopus)
-
-            bbox_imgs = self.bbox('score_table_img')
-            label_ufo = self.create_image(bbox_imgs[2], bbox_label_sat[3] + Font.size, image=self.images['label']['ufo'], anchor='nw', tags=['score_table_label', 'score_table', 'content'])
-            bbox_label_ufo = self.bbox(label_ufo)
-            label_squid = self.create_image(bbox_imgs[2], bbox_label_ufo[3] + Font.size, image=self.images['label']['squid'], anchor='nw', tags=['score_table_label', 'score_table', 'content'])
-            bbox_label_squid = self.bbox(label_squid)
-            label_crab = self.create_image(bbox_imgs[2], bbox_label_squid[3] + Font.size, image=self.images['label']['crab'], anchor='nw', tags=['score_table_label', 'score_table', 'content'])
-            bbox_label_crab = self.bbox(label_crab)
-            label_octopus = self.create_image(bbox_imgs[2], bbox_label_crab[3] + Font.size, image=self.images['label']['octopus'], anchor='nw', tags=['score_table_label', 'score_table', 'content'])
-            bbox_label_octopus = self.bbox(label_octopus)
-
-            bbox_labels = self.bbox('score_table_label')
-            if bbox_imgs[3] > bbox_labels[3]:
-                self.move(label_ufo, 0, bbox_y_diff_to_center(bbox_label_ufo, bbox_img_ufo))
-                self.move(label_squid, 0, bbox_y_diff_to_center(bbox_label_squid, bbox_img_squid))
-                self.move(label_crab, 0, bbox_y_diff_to_center(bbox_label_crab, bbox_img_crab))
-                self.move(label_octopus, 0, bbox_y_diff_to_center(bbox_label_octopus, bbox_img_octopus))
-            elif bbox_imgs[3] < bbox_labels[3]:
-                self.move(img_ufo, 0, bbox_y_diff_to_center(bbox_img_ufo, bbox_label_ufo))
-                self.move(img_squid, 0, bbox_y_diff_to_center(bbox_img_squid, bbox_label_squid))
-                self.move(img_crab, 0, bbox_y_diff_to_center(bbox_img_crab, bbox_label_crab))
-                self.move(img_octopus, 0, bbox_y_diff_to_center(bbox_img_octopus, bbox_label_octopus))
-            
-            self.move('score_table', bbox_x_diff_to_center(self.bbox('score_table'), bbox_label_sat), 0)
-            self.move('content', *bbox_diff_to_center(self.bbox('content'), (0, 0, self.winfo_reqwidth(), self.winfo_reqheight())))
+            self.bbox_btn_play = layout.boxes['btn_play']
+            self.hover = False
+            self.btn_play = self.create_image(*self.bbox_btn_play[:2], image=self.images['btn']['play'], anchor='nw', tags='content')
+            self.content = self.create_image(*bbox_content[:2], image=self.images['content'], anchor='nw', tags='content')
 
             self.init_bindings()
-        
+
+        def get_layout(self) -> Tuple[Layout, Image.Image, Tuple[int, int, int, int]]:
+            width, height = self.winfo_reqwidth(), self.winfo_reqheight()
+            return SCALED_CACHE.get(('play menu %dx%d' % (width, height), Scale.image), lambda: Game.PlayMenu.build_layout(width, height))
+
+        def refresh(self) -> None:
+            # Drawn again into the same PhotoImages once the font or a sprite of the score table changed
+            layout, content, bbox_content = self.get_layout()
+            paste_photoimage(self.images['btn']['play'], layout.images['btn_play'])
+            paste_photoimage(self.images['btn']['play_hover'], layout.images['btn_play_hover'])
+            paste_photoimage(self.images['content'], content)
+            self.coords(self.content, *bbox_content[:2])
+
+        @staticmethod
+        def build_layout(width: int, height: int) -> Tuple[Tuple[Layout, Image.Image, Tuple[int, int, int, int]], int]:
+            # Everything but the button is static and drawn as one image
+            layout = Layout()
+            score_table = [
+                ('ufo', Images.alien_ufo, "=? MYSTERY"),
+                ('squid', Images.alien_squid[1], "=30 POINTS"),
+                ('crab', Images.alien_crab[0], "=20 POINTS"),
+                ('octopus', Images.alien_octopus[1], "=10 POINTS")
+            ]
+            bbox_btn_play = layout.add('btn_play', Font.text_as_image("PLAY"), 0, 0, 'n', ['content'])
+            layout.images['btn_play_hover'] = Font.text_as_image("PLAY", "#FF0000")
+            bbox_label_title = layout.add('label_title', Font.text_as_image("SPACES  INVADERS"), 0, bbox_btn_play[3] + Font.size * 2, 'n', ['static', 'content'])
+            bbox_label_sat = layout.add('label_sat', Font.text_as_image("*SCORE ADVANCE TABLE*"), 0, bbox_label_title[3] + Font.size * 3, 'n', ['static', 'content'])
+
+            y = bbox_label_sat[3]
+            for name, image, _ in score_table:
+                y = layout.add('img_' + name, image, 0, y + Font.size, 'n', ['score_table_img', 'score_table', 'static', 'content'])[3]
+            bbox_imgs = layout.bbox('score_table_img')
+            y = bbox_label_sat[3]
+            for name, _, text in score_table:
+                y = layout.add('label_' + name, Font.text_as_image(text), bbox_imgs[2], y + Font.size, 'nw', ['score_table_label', 'score_table', 'static', 'content'])[3]
+            bbox_labels = layout.bbox('score_table_label')
+
+            # The shorter column is centered on the rows of the other one
+            for name, _, _ in score_table:
+                bbox_img, bbox_label = layout.boxes['img_' + name], layout.boxes['label_' + name]
+                if bbox_imgs[3] > bbox_labels[3]:
+                    layout.move('label_' + name, 0, bbox_y_diff_to_center(bbox_label, bbox_img))
+                elif bbox_imgs[3] < bbox_labels[3]:
+                    layout.move('img_' + name, 0, bbox_y_diff_to_center(bbox_img, bbox_label))
+
+            layout.move('score_table', bbox_x_diff_to_center(layout.bbox('score_table'), bbox_label_sat), 0)
+            layout.move('content', *bbox_diff_to_center(layout.bbox('content'), (0, 0, width, height)))
+            content, bbox_content = layout.flatten('static')
+            return (layout, content, bbox_content), layout.get_nbytes() + 2 * get_nbytes(content)
+
         def init_bindings(self) -> None:
             self.bind('<Motion>', lambda e: self.on_move(e.x, e.y))
             self.bind('<Button-1>', lambda e: self.on_click(e.x, e.y))
+            self.bind('<KeyPress-plus>', lambda e: self.game.set_scale(Scale.image + 1))
+            self.bind('<KeyPress-KP_Add>', lambda e: self.game.set_scale(Scale.image + 1))
+            self.bind('<KeyPress-minus>', lambda e: self.game.set_scale(Scale.image - 1))
+            self.bind('<KeyPress-KP_Subtract>', lambda e: self.game.set_scale(Scale.image - 1))
             self.focus_set()
 
         def on_move(self, x: int, y: int) -> None:
-            btn_play_bbox = self.bbox(self.btn_play)
-            if btn_play_bbox[0] <= x <= btn_play_bbox[2] and btn_play_bbox[1] <= y <= btn_play_bbox[3]:
-                self.itemconfigure(self.btn_play, image=self.images['btn']['play_hover'])
-            else:
-                self.itemconfigure(self.btn_play, image=self.images['btn']['play'])
+            # The button only changes when the pointer enters or leaves it
+            btn_play_bbox = self.bbox_btn_play
+            hover = btn_play_bbox[0] <= x <= btn_play_bbox[2] and btn_play_bbox[1] <= y <= btn_play_bbox[3]
+            if hover != self.hover:
+                self.hover = hover
+                self.itemconfigure(self.btn_play, image=self.images['btn']['play_hover' if hover else 'play'])
 
         def on_click(self, x: int, y: int) -> None:
-            btn_play_bbox = self.bbox(self.btn_play)
+            btn_play_bbox = self.bbox_btn_play
             if btn_play_bbox[0] <= x <= btn_play_bbox[2] and btn_play_bbox[1] <= y <= btn_play_bbox[3]:
                 self.game.play()
 
@@ -556,9 +780,30 @@ class Game(Frame):
             self.game = game
             super().__init__(self.game, width=self.game.default_width, height=self.game.default_height, bg='#000000', highlightthickness=0)
             self.gameover_img = get_photoimage(Font.text_as_image("GAME OVER", "#FF0000"))
-            self.gameover = False
-            self.fleet = Fleet(self)
-            self.defender = Defender(self)
+            self.seed = getrandbits(32)
+            self.start_time = 0.0
+            self.paused = False
+            self.after_id: Optional[str] = None
+            self.task: Optional[Task[None]] = None
+            self.tcl_counter = TclCounter(self.tk)
+            self.tk = self.tcl_counter
+            self.render = RenderBuffer(self)
+            self.render.listeners.append(self.game.recorder.event)
+            self.world = World(self.render, self.seed, self.game.challenge)
+            if self.game.event_log is not None:
+                self.game.event_log.attach(self.world)
+            self.fleet = self.world.fleet
+            self.defender = self.world.defender
+            self.interpolation = Interpolation(self.world)
+            self.last_frame_time = 0.0
+            self.lag = 0.0
+            self.phases = [
+                (self.world.move_bombs, Metrics.phases['move_bombs']),
+                (self.move_aliens, Metrics.phases['move_aliens']),
+                (self.world.move_bullet, Metrics.phases['move_bullet']),
+                (self.action_defender, Metrics.phases['action_defender']),
+                (self.world.check_status, Metrics.phases['check_status'])
+            ]
             self.left_key_pressed = False
             self.right_key_pressed = False
             self.space_key_pressed = False
@@ -576,61 +821,179 @@ class Game(Frame):
             self.bind('<KeyRelease-space>', lambda e: setSpaceKeyPressed(False))
             self.focus_set()
 
-        def move_bombs(self) -> None:
-            for bomb in self.fleet.dropped_bombs:
-                if self.defender.touched_by(bomb):
-                    bomb.kill()
-                    self.defender.explode()
-                    if self.defender.bullet is not None:
-                        self.defender.bullet.explode()
-                    for bomb in self.fleet.dropped_bombs.copy():
-                        bomb.explode()
-                    break
-                bomb.move()
-                bomb.animate()
+        @property
+        def tick(self) -> int: return self.world.tick
+
+        @property
+        def gameover(self) -> bool: return self.world.gameover
 
         def move_aliens(self) -> None:
-            self.fleet.manage_touched_aliens_by(self.defender)
+            self.world.move_aliens()
             self.game.top_bar.set_score(self.defender.score)
-            self.fleet.move()
 
         def action_defender(self) -> None:
-            if self.left_key_pressed and not self.right_key_pressed:
-                self.defender.move(-self.defender.delta_x)
-            if not self.left_key_pressed and self.right_key_pressed:
-                self.defender.move(self.defender.delta_x)
-            if self.space_key_pressed:
-                self.defender.fire()
-
-        def move_bullet(self) -> None:
-            if self.defender.bullet is not None:
-                self.defender.bullet.move()
-
-        def check_status(self) -> None:
-            bbox_fleet = self.bbox(self.fleet.tag)
-            bbox_defender = self.bbox(self.defender.id)
-            self.gameover = self.defender.lives == 0 or (bbox_fleet is not None and bbox_fleet[3] >= bbox_defender[1])
+            self.world.action_defender(self.left_key_pressed, self.right_key_pressed, self.space_key_pressed)
+
+        def save(self) -> bytes:
+            return self.world.save()
+
+        def restore(self, data: bytes) -> None:
+            # Pause/resume: the canvas follows the restored state on the next flush
+            self.interpolation.undo()
+            self.world.restore(data)
+            self.interpolation.reset()
+            self.game.top_bar.set_score(self.defender.score)
+            self.render.flush()
+
+        def step(self) -> bool:
+            # Runs one tick and returns whether the game goes on
+            tick_start = start = perf_counter()
+            recorder = self.game.recorder
+            self.interpolation.undo()
+            self.world.update_timers()
+            if not self.defender.explodes:
+                for index, (phase, histogram) in enumerate(self.phases):
+                    phase()
+                    end = perf_counter()
+                    histogram.observe(end - start)
+                    recorder.times[index] = end - start
+                    start = end
+            self.render.flush()
+            end = perf_counter()
+            Metrics.phases['render'].observe(end - start)
+            recorder.times[-2] = end - start
+            start = end
+            tcl_calls = self.tcl_counter.calls
+            Metrics.tcl_calls.observe(tcl_calls)
+            self.tcl_counter.calls = 0
+            self.world.tick += 1
+            self.interpolation.tick()
+            for callback in self.game.tick_callbacks:
+                callback(self)
+            end = perf_counter()
+            Metrics.phases['callbacks'].observe(end - start)
+            recorder.times[-1] = end - start
+            Metrics.tick.observe(end - tick_start)
+            Metrics.ticks.inc()
+            inputs = (
+                (INPUT_LEFT if self.left_key_pressed else 0) | (INPUT_RIGHT if self.right_key_pressed else 0) | (INPUT_FIRE if self.space_key_pressed else 0) |
+                (DEFENDER_EXPLODES if self.defender.explodes else 0) | (BULLET_FLYING if self.defender.bullet is not None else 0)
+            )
+            recorder.end_tick(tick_start, end - tick_start, tcl_calls, self.fleet.alive_count, len(self.fleet.exploding), len(self.fleet.dropped_bombs), inputs)
+            if self.tick % METRICS_SAMPLE_TICKS == 0:
+                Metrics.sample(self)
+            if self.gameover:
+                self.create_image(self.winfo_reqwidth() / 2, 0, image=self.gameover_img, anchor='n')
+                self.game.record_score(self.defender.score, time() - self.start_time, self.fleet.wave, self.seed)
+                # On disk now rather than when the next game starts, which may never come
+                if self.game.event_log is not None:
+                    self.game.event_log.flush()
+                self.after(TICK_DELAY, self.settle)
+            return not self.gameover
+
+        def settle(self) -> None:
+            # The explosions of the last tick still play once the game is over
+            if self.world.update_timers():
+                self.after(TICK_DELAY, self.settle)
+            self.render.flush()
+
+        def frame(self) -> bool:
+            # Runs the ticks due at the fixed tick rate, then draws the frame between the last two
+            start = perf_counter()
+            self.lag += start - self.last_frame_time
+            self.last_frame_time = start
+            ticks = 0
+            while self.lag >= TICK_DELAY / 1000:
+                if not self.step():
+                    return False
+                self.lag -= TICK_DELAY / 1000
+                ticks += 1
+                if ticks == MAX_CATCHUP_TICKS and self.lag >= TICK_DELAY / 1000:
+                    Metrics.ticks_dropped.inc(int(self.lag * 1000 // TICK_DELAY))
+                    self.lag %= TICK_DELAY / 1000
+            if ticks > 0 and perf_counter() - start >= FRAME_DELAY / 1000:
+                # No time left for this frame, the canvas shows the last tick
+                Metrics.frames_skipped.inc()
+            else:
+                self.interpolation.show(self.lag * 1000 / TICK_DELAY)
+                self.render.flush()
+                Metrics.frames.inc()
+            return True
 
         def animation(self) -> None:
-            if not self.gameover:
-                self.move_bombs()
-                self.move_aliens()
-                self.move_bullet()
-                self.action_defender()
-                self.check_status()
-                self.after(30, self.animation)
+            self.after_id = self.after(FRAME_DELAY, self.animation) if self.frame() else None
+
+        async def run(self, loop: AbstractEventLoop) -> None:
+            # Same as animation but scheduled by asyncio
+            while self.frame():
+                await sleep(FRAME_DELAY / 1000)
+
+        def _schedule(self) -> None:
+            if self.game.loop is None:
+                self.after_id = self.after(FRAME_DELAY, self.animation)
             else:
-                self.create_image(self.winfo_reqwidth() / 2, 0, image=self.gameover_img, anchor='n')
-            
-        def play(self) -> None:
-            self.after(10, self.animation)
+                self.task = self.game.loop.create_task(self.run(self.game.loop))
+
+        def _unschedule(self) -> None:
+            # Between two frames, frame() is never cut short
+            if self.after_id is not None:
+                self.after_cancel(self.after_id)
+                self.after_id = None
+            if self.task is not None:
+                self.task.cancel()
+                self.task = None
 
-    def __init__(self, root: Tk) -> None:
+        def play(self) -> None:
+            self.start_time = time()
+            # The first tick runs with the first frame
+            self.last_frame_time = perf_counter()
+            self.lag = TICK_DELAY / 1000
+            self._schedule()
+
+        def pause(self) -> None:
+            # No ticks, hence no sounds, until resume
+            if self.start_time and not self.paused and not self.gameover:
+                self.paused = True
+                self._unschedule()
+                # The releases of the keys held when the focus went away never come
+                self.left_key_pressed = False
+                self.right_key_pressed = False
+                self.space_key_pressed = False
+
+        def resume(self) -> None:
+            if self.paused:
+                self.paused = False
+                # The time away is not caught up
+                self.last_frame_time = perf_counter()
+                self._schedule()
+
+        def running(self) -> bool:
+            return self.start_time != 0 and not self.paused and not self.gameover
+
+    def __init__(self, root: Tk, leaderboard_path: str = DB_PATH, event_log_path: Optional[str] = EVENT_LOG) -> None:
         super().__init__(root, highlightthickness=0)
         self.pack(fill='both', expand=True)
-        self.default_width = Fleet.get_width() * 1.5
-        self.default_height = Fleet.get_height() * 2.5
+        self.tick_callbacks: List[Callable[[Game.MainGame], None]] = []
+        self.loop: Optional[AbstractEventLoop] = None
+        self.pause_when_away = PAUSE_WHEN_AWAY
+        self.challenge = CHALLENGE
+        # Kept across games, a hitch may come from the previous one
+        self.recorder = FlightRecorder(list(Metrics.phases), [basename(sound) for sound in SOUNDS], TICK_DELAY, RECORDER_SECONDS, RECORDER_BUDGET)
+        for sequence in ('<FocusIn>', '<FocusOut>', '<Map>', '<Unmap>'):
+            # Also sent for the widgets inside, the state of the window is looked at once they are handled
+            root.bind(sequence, lambda e: self.after_idle(self.check_away), add='+')
+        Metrics.export()
+        self.leaderboard = Leaderboard(leaderboard_path)
+        self.event_log = EventLog(event_log_path) if event_log_path else None
+        self._create_screens()
+        if HOT_RELOAD:
+            self.asset_watcher = AssetWatcher()
+            self.after(HOT_RELOAD_DELAY, self.reload_assets)
+
+    def _create_screens(self) -> None:
+        self.default_width, self.default_height = World.get_size()
         self.top_bar = Game.TopBar(self)
+        self.top_bar.set_high_score(self.leaderboard.high_score())
         self.top_bar.pack(side='top')
         self.menu_play = Game.PlayMenu(self)
         self.menu_play.pack(side='top')
@@ -641,15 +1004,83 @@ class Game(Frame):
         self.main_game.pack_configure(side='top')
         self.main_game.play()
 
+    def check_away(self) -> None:
+        away = self.focus_get() is None or self.winfo_toplevel().state() in ('iconic', 'withdrawn')
+        if away and self.pause_when_away:
+            self.main_game.pause()
+        else:
+            self.main_game.resume()
+
+    def restart(self) -> None:
+        # Replaces a finished game, its explosions must be over
+        self.main_game.destroy()
+        self.main_game = Game.MainGame(self)
+        self.play()
+
+    def set_scale(self, image_scale: float) -> None:
+        # Rebuilds the screens at the new scale, only from the menu since a game would be lost
+        image_scale = min(max(image_scale, MIN_IMAGE_SCALE), MAX_IMAGE_SCALE)
+        if image_scale != Scale.image and self.main_game.start_time == 0:
+            set_scale(image_scale)
+            for screen in (self.top_bar, self.menu_play, self.main_game):
+                screen.destroy()
+            self._create_screens()
+
+    def reload_assets(self) -> None:
+        # The screens are kept, only what shows the changed files is drawn again
+        for path in self.asset_watcher.changes():
+            start = perf_counter()
+            try:
+                kind = reload_asset(path)
+            except OSError as e:
+                # Most likely still being written, it is read again on its next change
+                print("Could not reload %s: %s" % (path, e))
+                continue
+            if kind == 'font':
+                self.top_bar.refresh()
+            if kind in ('font', 'image'):
+                self.menu_play.refresh()
+            if kind is not None:
+                print("Reloaded %s %s in %.1f ms" % (kind, basename(path), (perf_counter() - start) * 1000))
+        self.after(HOT_RELOAD_DELAY, self.reload_assets)
+
+    def record_score(self, score: int, duration: float, wave: int, seed: int) -> None:
+        self.leaderboard.submit(score, duration, wave, seed)
+        self.top_bar.set_high_score(self.leaderboard.high_score())
+
 class SpaceInvaders(Tk):
-    def __init__(self) -> None:
+    def __init__(self, image_scale: float = IMAGE_SCALE, rows: int = FLEET_ROWS, columns: int = FLEET_COLUMNS, leaderboard_path: str = DB_PATH,
+                 event_log_path: Optional[str] = EVENT_LOG) -> None:
         super().__init__()
+        set_scale(image_scale)
+        set_fleet_size(rows, columns)
         self.wm_title('Space Invaders')
         self.wm_resizable(False, False)
-        self.game = Game(self)
+        self.game = Game(self, leaderboard_path, event_log_path)
 
     def play(self) -> None:
         self.mainloop()
+        self.game.leaderboard.close()
+        if self.game.event_log is not None:
+            self.game.event_log.close()
+
+    async def play_async(self) -> None:
+        # Lets asyncio own the loop so that other coroutines share the thread with the game
+        loop = get_running_loop()
+        self.game.loop = loop
+        closed = False
+        def close(): nonlocal closed; closed = True
+        self.protocol('WM_DELETE_WINDOW', close)
+        while not closed:
+            self.update()
+            # Slower on the menu and while paused, the pointer is still followed closely enough
+            await sleep((EVENTS_DELAY if self.game.main_game.running() else IDLE_EVENTS_DELAY) / 1000)
+        if self.game.main_game.task is not None:
+            self.game.main_game.task.cancel()
+        self.destroy()
+        await loop.run_in_executor(None, self.game.leaderboard.close)
+        if self.game.event_log is not None:
+            await loop.run_in_executor(None, self.game.event_log.close)
 
 if __name__ == '__main__':
     SpaceInvaders().play()
\ No newline at end of file
@@ -0,0 +1,344 @@
+from asyncio import AbstractEventLoop, IncompleteReadError, StreamReader, StreamWriter, get_running_loop, new_event_loop, open_connection, run, start_server
+from collections import OrderedDict
+from spaceinvaders import Fleet, Font, Game, Images, SpaceInvaders, get_photoimage, get_photoimages
+from struct import Struct
+from sys import argv
+from threading import Thread
+from time import perf_counter, time
+from tkinter import Canvas, Tk
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+################################################################
+#                           Configs                            #
+################################################################
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+HISTORY = 64                # snapshots kept to encode deltas against
+SKIP_BUFFER = 16 * 1024     # a client with more bytes pending misses the tick
+DROP_BUFFER = 256 * 1024    # a client with more bytes pending is disconnected
+REPORT_DELAY = 5.0
+
+################################################################
+#                           Snapshots                          #
+################################################################
+
+# Defender x, defender flags, lives, score, wave, fleet offset x and y, fleet frame, aliens
+HEAD = Struct('<hBBIHhhBH')
+# Flags, x and y
+BULLET = Struct('<Bhh')
+# x, y, kind, frame and explodes
+BOMB = Struct('<hhBBB')
+COUNT = Struct('<B')
+
+# Kind, sequence and base sequence of a message (the base is the sequence itself for a keyframe)
+# Numbered by the server, the ticks start over with each new game
+MESSAGE = Struct('<BII')
+KEYFRAME = 1
+DELTA = 2
+# Offset and length of a run of changed bytes
+PATCH = Struct('<HB')
+LENGTH = Struct('<H')
+FRAME = Struct('<I')
+ACK = Struct('<I')
+
+ALIVE = 1
+EXPLODES = 2
+
+class State(NamedTuple):
+    defender_x: int
+    defender_flags: int
+    lives: int
+    score: int
+    wave: int
+    offset_x: int
+    offset_y: int
+    fleet_frame: int
+    alive: List[bool]
+    exploding: List[bool]
+    bullet: Tuple[int, int, int]
+    bombs: List[Tuple[int, int, int, int, int]]
+
+def flags(entity: object) -> int:
+    return (ALIVE if getattr(entity, 'alive') else 0) | (EXPLODES if getattr(entity, 'explodes') else 0)
+
+def encode_state(main_game: Game.MainGame) -> bytes:
+    defender = main_game.defender
+    fleet = main_game.fleet
+    alive = exploding = 0
+    for index, alien in enumerate(fleet.aliens):
+        if alien.alive:
+            alive |= 1 << index
+            if alien.explodes:
+                exploding |= 1 << index
+    size = (len(fleet.aliens) + 7) // 8
+    bullet = defender.bullet
+    parts = [
+        HEAD.pack(round(defender.x), flags(defender), defender.lives, defender.score, fleet.wave, round(fleet.offset_x), round(fleet.offset_y), fleet.current_frame, len(fleet.aliens)),
+        alive.to_bytes(size, 'little'),
+        exploding.to_bytes(size, 'little'),
+        BULLET.pack(0, 0, 0) if bullet is None else BULLET.pack(flags(bullet), round(bullet.x), round(bullet.y)),
+        COUNT.pack(len(fleet.dropped_bombs))
+    ]
+    for bomb in fleet.dropped_bombs:
+        parts.append(BOMB.pack(round(bomb.x), round(bomb.y), bomb.kind, bomb.current_frame, bomb.explodes))
+    return b''.join(parts)
+
+def decode_state(data: bytes) -> State:
+    defender_x, defender_flags, lives, score, wave, offset_x, offset_y, fleet_frame, nb_aliens = HEAD.unpack_from(data)
+    offset = HEAD.size
+    size = (nb_aliens + 7) // 8
+    alive = int.from_bytes(data[offset:offset + size], 'little')
+    exploding = int.from_bytes(data[offset + size:offset + 2 * size], 'little')
+    offset += 2 * size
+    bullet = BULLET.unpack_from(data, offset)
+    offset += BULLET.size
+    bombs = [BOMB.unpack_from(data, offset + COUNT.size + BOMB.size * i) for i in range(data[offset])]
+    return State(
+        defender_x, defender_flags, lives, score, wave, offset_x, offset_y, fleet_frame,
+        [alive >> i & 1 == 1 for i in range(nb_aliens)],
+        [exploding >> i & 1 == 1 for i in range(nb_aliens)],
+        bullet, bombs
+    )
+
+def encode_delta(base: bytes, state: bytes) -> bytes:
+    # Runs of bytes that differ from the base, bytes past the end of the base always differ
+    parts = [LENGTH.pack(len(state))]
+    common = min(len(base), len(state))
+    index = 0
+    while index < len(state):
+        if index < common and base[index] == state[index]:
+            index += 1
+            continue
+        start = index
+        while index < len(state) and index - start < 255 and (index >= common or base[index] != state[index]):
+            index += 1
+        parts.append(PATCH.pack(start, index - start))
+        parts.append(state[start:index])
+    return b''.join(parts)
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    length = LENGTH.unpack_from(delta)[0]
+    state = bytearray(base[:length].ljust(length, b'\0'))
+    offset = LENGTH.size
+    while offset < len(delta):
+        start, size = PATCH.unpack_from(delta, offset)
+        offset += PATCH.size
+        state[start:start + size] = delta[offset:offset + size]
+        offset += size
+    return bytes(state)
+
+################################################################
+#                            Server                            #
+################################################################
+
+class Client:
+    def __init__(self, writer: StreamWriter) -> None:
+        self.writer = writer
+        self.acked: Optional[int] = None
+        self.skipped = 0
+
+class SpectatorServer:
+    def __init__(self, host: str = HOST, port: int = PORT) -> None:
+        self.host = host
+        self.port = port
+        self.loop: Optional[AbstractEventLoop] = None
+        self.clients: Set[Client] = set()
+        self.history: 'OrderedDict[int, bytes]' = OrderedDict()
+        self.sequence = 0
+        self.report_last_time = time()
+        self.ticks = 0
+        self.bytes_sent = 0
+        self.encode_time = 0.0
+
+    async def start(self, loop: AbstractEventLoop) -> None:
+        self.loop = loop
+        self.server = await start_server(self._handle, self.host, self.port)
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                sequence = ACK.unpack(await reader.readexactly(ACK.size))[0]
+                if sequence in self.history and (client.acked is None or sequence > client.acked):
+                    client.acked = sequence
+        except (ConnectionError, IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    def on_tick(self, main_game: Game.MainGame) -> None:
+        # Called from the game loop, the state is captured here and sent from the server loop
+        start = perf_counter()
+        state = encode_state(main_game)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.publish, state, perf_counter() - start)
+
+    def publish(self, state: bytes, capture_time: float = 0.0) -> None:
+        start = perf_counter() - capture_time
+        self.sequence += 1
+        sequence = self.sequence
+        self.history[sequence] = state
+        while len(self.history) > HISTORY:
+            self.history.popitem(last=False)
+        messages: Dict[Optional[int], bytes] = {}
+        for client in list(self.clients):
+            buffered = client.writer.transport.get_write_buffer_size()
+            if buffered > DROP_BUFFER:
+                self.clients.discard(client)
+                client.writer.close()
+                continue
+            if buffered > SKIP_BUFFER:
+                client.skipped += 1
+                continue
+            # A client whose acked snapshot fell out of the history gets a keyframe
+            base = client.acked if client.acked in self.history else None
+            if base not in messages:
+                messages[base] = self._encode_message(sequence, state, base)
+            client.writer.write(messages[base])
+            self.bytes_sent += len(messages[base])
+        self.encode_time += perf_counter() - start
+        self.ticks += 1
+        self._report()
+
+    def _encode_message(self, sequence: int, state: bytes, base: Optional[int]) -> bytes:
+        if base is None:
+            payload = MESSAGE.pack(KEYFRAME, sequence, sequence) + state
+        else:
+            payload = MESSAGE.pack(DELTA, sequence, base) + encode_delta(self.history[base], state)
+        return FRAME.pack(len(payload)) + payload
+
+    def _report(self) -> None:
+        now = time()
+        if now - self.report_last_time >= REPORT_DELAY:
+            print("Spectators: %d clients, %.1f bytes/tick, %.1f us/tick encoding" % (
+                len(self.clients), self.bytes_sent / self.ticks, self.encode_time / self.ticks * 1e6
+            ))
+            self.report_last_time = now
+            self.ticks = 0
+            self.bytes_sent = 0
+            self.encode_time = 0.0
+
+################################################################
+#                            Client                            #
+################################################################
+
+class SpectatorView(Canvas):
+    def __init__(self, root: Tk) -> None:
+        self.width = Fleet.get_width() * 1.5
+        self.height = Fleet.get_height() * 2.5
+        super().__init__(root, width=self.width, height=self.height + Font.size, bg='#000000', highlightthickness=0)
+        self.pack()
+        self.images = {
+            'defender': get_photoimage(Images.defender),
+            'defender_explosion': get_photoimage(Images.defender_explosion[0]),
+            'bullet': get_photoimage(Images.bullet),
+            'bullet_explosion': get_photoimage(Images.bullet_explosion),
+            'alien_explosion': get_photoimage(Images.alien_explosion),
+            'bomb_explosion': get_photoimage(Images.bomb_explosion)
+        }
+        self.bomb_frames = [get_photoimages(frames) for frames in (Images.bomb_1, Images.bomb_2, Images.bomb_3)]
+        self.score_img = get_photoimage(Font.text_as_image("0000"))
+        self.score = self.create_image(Font.size, 0, image=self.score_img, anchor='nw')
+        self.defender = self.create_image(self.width / 2, Font.size + self.height - Images.defender.height / 2, image=self.images['defender'])
+        self.bullet = self.create_image(0, 0, image=self.images['bullet'], state='hidden')
+        self.bombs: List[int] = []
+        self.aliens: List[Tuple[int, float, float, List[object]]] = []
+        self.state: Optional[State] = None
+
+    def _create_aliens(self, nb_aliens: int) -> None:
+        for index in range(len(self.aliens), nb_aliens):
+            row, column = divmod(index, Fleet.columns)
+            frames = get_photoimages(Fleet.get_row_type(row)[2])
+            x, y = Fleet.get_start_pos(row, column)
+            self.aliens.append((self.create_image(x, Font.size + y, image=frames[0]), x, y, frames))
+
+    def render(self, state: State) -> None:
+        last = self.state
+        self._create_aliens(len(state.alive))
+        if last is None or last.score != state.score:
+            self.score_img = get_photoimage(Font.text_as_image(str(state.score).zfill(4)))
+            self.itemconfigure(self.score, image=self.score_img)
+        self.coords(self.defender, state.defender_x, Font.size + self.height - Images.defender.height / 2)
+        self.itemconfigure(self.defender, image=self.images['defender_explosion' if state.defender_flags & EXPLODES else 'defender'])
+        for index, (item, x, y, frames) in enumerate(self.aliens):
+            if index >= len(state.alive) or not state.alive[index]:
+                self.itemconfigure(item, state='hidden')
+                continue
+            self.coords(item, x + state.offset_x, Font.size + y + state.offset_y)
+            self.itemconfigure(item, state='normal', image=self.images['alien_explosion'] if state.exploding[index] else frames[state.fleet_frame])
+        bullet_flags, bullet_x, bullet_y = state.bullet
+        if bullet_flags & ALIVE:
+            self.coords(self.bullet, bullet_x, Font.size + bullet_y)
+            self.itemconfigure(self.bullet, state='normal', image=self.images['bullet_explosion' if bullet_flags & EXPLODES else 'bullet'])
+        else:
+            self.itemconfigure(self.bullet, state='hidden')
+        while len(self.bombs) < len(state.bombs):
+            self.bombs.append(self.create_image(0, 0, image=self.images['bomb_explosion'], state='hidden'))
+        for index, item in enumerate(self.bombs):
+            if index < len(state.bombs):
+                x, y, kind, frame, explodes = state.bombs[index]
+                self.coords(item, x, Font.size + y)
+                self.itemconfigure(item, state='normal', image=self.images['bomb_explosion'] if explodes else self.bomb_frames[kind][frame])
+            else:
+                self.itemconfigure(item, state='hidden')
+        self.state = state
+
+class SpectatorClient(Tk):
+    def __init__(self, host: str = HOST, port: int = PORT) -> None:
+        super().__init__()
+        self.wm_title('Space Invaders - Spectator')
+        self.wm_resizable(False, False)
+        self.view = SpectatorView(self)
+        self.host = host
+        self.port = port
+        self.snapshots: 'OrderedDict[int, bytes]' = OrderedDict()
+        self.latest: Optional[Tuple[int, bytes]] = None
+        self.rendered_sequence = -1
+        Thread(target=lambda: new_event_loop().run_until_complete(self._receive()), name='spectator-client', daemon=True).start()
+
+    async def _receive(self) -> None:
+        reader, writer = await open_connection(self.host, self.port)
+        while True:
+            size = FRAME.unpack(await reader.readexactly(FRAME.size))[0]
+            payload = await reader.readexactly(size)
+            kind, sequence, base = MESSAGE.unpack_from(payload)
+            if kind == KEYFRAME:
+                state = payload[MESSAGE.size:]
+            elif base in self.snapshots:
+                state = apply_delta(self.snapshots[base], payload[MESSAGE.size:])
+            else:
+                continue
+            self.snapshots[sequence] = state
+            while len(self.snapshots) > HISTORY:
+                self.snapshots.popitem(last=False)
+            self.latest = sequence, state
+            writer.write(ACK.pack(sequence))
+
+    def refresh(self) -> None:
+        latest = self.latest
+        if latest is not None and latest[0] != self.rendered_sequence:
+            self.rendered_sequence = latest[0]
+            self.view.render(decode_state(latest[1]))
+        self.after(15, self.refresh)
+
+    def play(self) -> None:
+        self.after(15, self.refresh)
+        self.mainloop()
+
+async def serve() -> None:
+    # The server and the game share the asyncio loop
+    game = SpaceInvaders()
+    server = SpectatorServer()
+    await server.start(get_running_loop())
+    game.game.tick_callbacks.append(server.on_tick)
+    await game.play_async()
+
+if __name__ == '__main__':
+    if len(argv) > 1 and argv[1] == 'watch':
+        SpectatorClient(*argv[2:3], *map(int, argv[3:4])).play()
+    else:
+        run(serve())
@@ -0,0 +1,160 @@
+from argparse import ArgumentParser
+from core import BARRAGE_DY, PROJECTILE_BULLET
+from leaderboard import MEMORY_PATH
+from math import ceil, sqrt
+from random import Random
+from soak import RESTART_DELAY, Autopilot, percentile, slope
+from spaceinvaders import FLEET_COLUMNS, FLEET_ROWS, TICK_DELAY, Defender, Fleet, Game, Scale, SpaceInvaders, World, set_fleet_size, set_scale
+from sys import exit
+from time import perf_counter
+from typing import Callable, List, NamedTuple
+
+################################################################
+#                           Configs                            #
+################################################################
+
+SIZES = [55, 500, 1000, 2000, 5000]
+TICKS = 600         # measured per fleet size
+WARMUP_TICKS = 30   # not measured
+IMAGE_SCALE = 1     # keeps the window of a huge fleet on screen
+SEED = 1
+PROJECTILES = 0     # kept in flight in the challenge mode, see refill
+
+################################################################
+#                            Stress                            #
+################################################################
+
+class Result(NamedTuple):
+    aliens: int
+    projectiles: int
+    ticks: int
+    tick_p50: float
+    tick_p95: float
+    tick_p99: float
+    tick_max: float
+
+def fleet_shape(aliens: int) -> List[int]:
+    # Rows and columns of at least that many aliens, in the proportions of the default fleet
+    columns = max(1, round(sqrt(aliens * FLEET_COLUMNS / FLEET_ROWS)))
+    return [ceil(aliens / columns), columns]
+
+def result(aliens: int, projectiles: int, tick_times: List[float]) -> Result:
+    tick_times = tick_times[WARMUP_TICKS:]
+    return Result(
+        aliens, projectiles, len(tick_times), percentile(tick_times, 50) * 1000, percentile(tick_times, 95) * 1000,
+        percentile(tick_times, 99) * 1000, max(tick_times, default=0.0) * 1000
+    )
+
+class HeadlessGame:
+    # What the autopilot reads and drives, for a World without a window
+    def __init__(self, world: World) -> None:
+        self.world = world
+        self.left_key_pressed = False
+        self.right_key_pressed = False
+        self.space_key_pressed = False
+
+    @property
+    def fleet(self) -> Fleet: return self.world.fleet
+
+    @property
+    def defender(self) -> Defender: return self.world.defender
+
+def refill(world: World, projectiles: int, random: Random) -> None:
+    # Tops the challenge mode up, bombs from the top and bullets from the bottom in turn
+    pool = world.projectiles
+    if pool is None:
+        return
+    width, height = world.render.width, world.render.height
+    while pool.count < min(projectiles, pool.capacity):
+        kind = PROJECTILE_BULLET if pool.count % 2 else random.randrange(3)
+        dx = random.uniform(-2, 2) * Scale.speed
+        if kind == PROJECTILE_BULLET:
+            pool.add(kind, random.uniform(0, width), height - pool.half_heights[kind] - 1, dx, -3 * BARRAGE_DY * Scale.speed)
+        else:
+            pool.add(kind, random.uniform(0, width), pool.half_heights[kind] + 1, dx, BARRAGE_DY * Scale.speed)
+
+def run_headless(aliens: int, ticks: int, projectiles: int = PROJECTILES) -> Result:
+    set_fleet_size(*fleet_shape(aliens))
+    random = Random(SEED)
+    game = HeadlessGame(World.headless(SEED, projectiles > 0))
+    autopilot = Autopilot(game)
+    tick_times = []
+    while len(tick_times) < ticks + WARMUP_TICKS:
+        if game.world.gameover:
+            game = HeadlessGame(World.headless(SEED, projectiles > 0))
+            autopilot = Autopilot(game)
+        refill(game.world, projectiles, random)
+        autopilot.drive()
+        start = perf_counter()
+        game.world.step(game.left_key_pressed, game.right_key_pressed, game.space_key_pressed)
+        tick_times.append(perf_counter() - start)
+    return result(len(game.world.fleet.aliens), projectiles, tick_times)
+
+def run_rendered(aliens: int, ticks: int, image_scale: float, projectiles: int = PROJECTILES) -> Result:
+    rows, columns = fleet_shape(aliens)
+    app = SpaceInvaders(image_scale, rows, columns, MEMORY_PATH, None)
+    random = Random(SEED)
+    if projectiles > 0:
+        # The first game was made before
+        app.game.challenge = True
+        app.game.main_game.destroy()
+        app.game.main_game = Game.MainGame(app.game)
+    tick_times: List[float] = []
+    autopilot = Autopilot(app.game.main_game)
+
+    def timed(step: Callable[[], bool]) -> Callable[[], bool]:
+        # Tk also redraws the canvas between the ticks, that time shows in the frame rate, not here
+        def run():
+            start = perf_counter()
+            going = step()
+            tick_times.append(perf_counter() - start)
+            if len(tick_times) >= ticks + WARMUP_TICKS:
+                app.destroy()
+                return False
+            return going
+        return run
+
+    def on_tick(main_game: Game.MainGame) -> None:
+        if main_game.gameover:
+            app.after(RESTART_DELAY, new_game)
+        else:
+            refill(main_game.world, projectiles, random)
+            autopilot.drive()
+
+    def new_game() -> None:
+        nonlocal autopilot
+        app.game.restart()
+        app.game.main_game.step = timed(app.game.main_game.step)
+        autopilot = Autopilot(app.game.main_game)
+
+    app.game.pause_when_away = False
+    app.game.tick_callbacks.append(on_tick)
+    app.game.main_game.step = timed(app.game.main_game.step)
+    app.game.play()
+    app.play()
+    return result(rows * columns, projectiles, tick_times)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Times the ticks of the game with fleets of growing sizes")
+    parser.add_argument('sizes', type=int, nargs='*', default=SIZES, help="aliens per fleet, rounded up to full rows")
+    parser.add_argument('--ticks', type=int, default=TICKS, help="ticks measured per size")
+    parser.add_argument('--scale', type=float, default=IMAGE_SCALE, help="image scale")
+    parser.add_argument('--rendered', action='store_true', help="plays in a window instead of headless")
+    parser.add_argument('--projectiles', type=int, default=PROJECTILES, help="kept in flight, in the challenge mode")
+    args = parser.parse_args()
+    set_scale(args.scale)
+    results = []
+    for size in args.sizes:
+        r = run_rendered(size, args.ticks, args.scale, args.projectiles) if args.rendered else run_headless(size, args.ticks, args.projectiles)
+        results.append(r)
+        print("%6d aliens, %d projectiles: tick p50 %.2f p95 %.2f p99 %.2f max %.2f ms" % (r.aliens, r.projectiles, r.tick_p50, r.tick_p95, r.tick_p99, r.tick_max))
+    if len(results) > 1:
+        print("Growth per 1000 aliens: p50 %+.3f ms, p95 %+.3f ms, p99 %+.3f ms" % (
+            slope([r.aliens for r in results], [r.tick_p50 for r in results]) * 1000,
+            slope([r.aliens for r in results], [r.tick_p95 for r in results]) * 1000,
+            slope([r.aliens for r in results], [r.tick_p99 for r in results]) * 1000
+        ))
+    over = [r for r in results if r.tick_p95 > TICK_DELAY]
+    for r in over:
+        print("Over the %d ms budget with %d aliens" % (TICK_DELAY, r.aliens))
+    exit(1 if over else 0)
@@ -0,0 +1,366 @@
+from argparse import ArgumentParser
+from asyncio import (
+    AbstractEventLoop, Future, IncompleteReadError, StreamReader, StreamWriter, gather, get_running_loop, open_connection,
+    open_unix_connection, run, sleep, start_server, start_unix_server, wait_for
+)
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from os import cpu_count
+from random import getrandbits
+from recorder import INPUT_FIRE, INPUT_LEFT, INPUT_RIGHT
+from soak import Autopilot, percentile
+from spaceinvaders import FLEET_COLUMNS, FLEET_ROWS, NullRender, Scale, World, set_fleet_size, set_scale
+from stress import HeadlessGame
+from struct import Struct
+from time import perf_counter, time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+################################################################
+#                           Configs                            #
+################################################################
+
+HOST = '127.0.0.1'  # bots run on this machine
+PORT = 8766         # next to the one of spectator.py
+WORKERS = max((cpu_count() or 2) - 1, 1)
+MAX_SESSIONS = 1000         # in all, a worker keeps up to about 2000 before its pipe fills up
+MAX_TICKS = 10000           # per match, the bot is told the match is over once reached
+ACTION_TIMEOUT = 10.0       # s a bot has to answer an observation, it is disconnected after
+WORKER_TIMEOUT = 5.0        # s a worker has to answer a command, the session ends with STATUS_ERROR after
+REPORT_DELAY = 5.0
+
+MAGIC = b'SIBT'
+VERSION = 1
+
+################################################################
+#                           Protocol                           #
+################################################################
+
+# Bot -> server, once: magic, version, seed of the game (0 for one picked by the server)
+HELLO = Struct('<4sBxxxQ')
+# Server -> bot, once: magic, version, session, width, height, image scale, rows, columns of the fleet
+WELCOME = Struct('<4sBxxxIdddHH')
+# Server -> bot, each tick: status, length of the snapshot that follows (see World.save and World.restore), none with STATUS_ERROR
+OBSERVATION = Struct('<BxH')
+# Bot -> server, each tick: keys pressed as INPUT_LEFT, INPUT_RIGHT and INPUT_FIRE bits
+ACTION = Struct('<B')
+
+STATUS_PLAYING = 0
+STATUS_GAMEOVER = 1
+STATUS_TICKS = 2    # MAX_TICKS reached
+STATUS_ERROR = 3    # the worker of the game died or did not answer
+STATUS_CLOSED = 255 # never sent, the server went away
+
+# Commands of the server to a worker
+NEW = 0
+STEP = 1
+END = 2
+
+################################################################
+#                           Workers                            #
+################################################################
+
+def work(conn: Connection, rows: int, columns: int) -> None:
+    # The games of many sessions: each batch of commands is answered by a batch of snapshots
+    set_fleet_size(rows, columns)
+    worlds: Dict[int, World] = {}
+    while True:
+        try:
+            batch = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        replies = []
+        for session, command, value in batch:
+            if command == END:
+                worlds.pop(session, None)
+                continue
+            if command == NEW:
+                world = worlds[session] = World.headless(value)
+            else:
+                world = worlds[session]
+                world.step(value & INPUT_LEFT != 0, value & INPUT_RIGHT != 0, value & INPUT_FIRE != 0)
+            replies.append((session, world.gameover, world.defender.score, world.save()))
+        if replies:
+            conn.send(replies)
+
+class Worker:
+    # The server side of a worker process, answers come back through the event loop
+    def __init__(self, index: int, rows: int, columns: int) -> None:
+        self.conn, child = Pipe()
+        self.process = Process(target=work, args=(child, rows, columns), name='tournament-worker-%d' % index, daemon=True)
+        self.process.start()
+        child.close()
+        self.sessions = 0
+        self.pending: Dict[int, Future] = {}
+        self.batch: List[Tuple[int, int, int]] = []
+        self.loop: Optional[AbstractEventLoop] = None
+        self.alive = True
+
+    def start(self, loop: AbstractEventLoop) -> None:
+        self.loop = loop
+        loop.add_reader(self.conn.fileno(), self._receive)
+
+    def request(self, session: int, command: int, value: int) -> Future:
+        # Commands of one loop iteration are sent together
+        future = self.loop.create_future()
+        if command != END:
+            if not self.alive:
+                future.set_exception(ChildProcessError("%s is gone" % self.process.name))
+                return future
+            self.pending[session] = future
+        else:
+            # Also a reply given up on by call
+            self.pending.pop(session, None)
+            future.set_result(None)
+            if not self.alive:
+                return future
+        if not self.batch:
+            self.loop.call_soon(self._send)
+        self.batch.append((session, command, value))
+        return future
+
+    async def call(self, session: int, command: int, value: int) -> Tuple[bool, int, bytes]:
+        # The reply to a command, the session is given up on when the worker takes too long
+        try:
+            return await wait_for(self.request(session, command, value), WORKER_TIMEOUT)
+        except TimeoutError:
+            # Stuck rather than slow: killed so that its other sessions end now and the new ones go elsewhere
+            if self.alive:
+                print("%s did not answer session %d within %.0f s, killed" % (self.process.name, session, WORKER_TIMEOUT))
+                self.process.kill()
+                self._fail()
+            raise ChildProcessError("%s did not answer" % self.process.name) from None
+
+    def _send(self) -> None:
+        if not self.alive:
+            return
+        try:
+            self.conn.send(self.batch)
+        except OSError:
+            self._fail()
+        self.batch = []
+
+    def _receive(self) -> None:
+        # The pipe reads as closed once the process exits, whether it returned or was killed
+        try:
+            while self.conn.poll():
+                for session, gameover, score, snapshot in self.conn.recv():
+                    future = self.pending.pop(session, None)
+                    if future is not None and not future.done():
+                        future.set_result((gameover, score, snapshot))
+        except (EOFError, OSError):
+            self._fail()
+
+    def _fail(self) -> None:
+        # The sessions waiting for the worker end with an error, the new ones go to the other workers
+        self.alive = False
+        self.loop.remove_reader(self.conn.fileno())
+        self.process.join(1)
+        print("%s is gone (exit code %s), %d sessions end" % (self.process.name, self.process.exitcode, self.sessions))
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ChildProcessError("%s is gone" % self.process.name))
+
+    def close(self) -> None:
+        if self.loop is not None and self.alive:
+            self.loop.remove_reader(self.conn.fileno())
+        self.conn.close()
+        self.process.join(1)
+
+################################################################
+#                            Server                            #
+################################################################
+
+class Session:
+    def __init__(self, number: int, seed: int) -> None:
+        self.number = number
+        self.seed = seed
+        self.ticks = 0
+        self.score = 0
+        # s from an action to its observation, and from an observation to the next action
+        self.step_times: List[float] = []
+        self.think_times: List[float] = []
+
+class TournamentServer:
+    # One headless game per connected bot, played tick by tick as the bot answers
+    # A bot only waits for its own game, the writes to a slow bot hold back its session alone
+    def __init__(self, workers: int = WORKERS, max_sessions: int = MAX_SESSIONS, max_ticks: int = MAX_TICKS, rows: int = FLEET_ROWS, columns: int = FLEET_COLUMNS) -> None:
+        set_fleet_size(rows, columns)
+        self.rows = rows
+        self.columns = columns
+        self.size = World.get_size()
+        self.max_sessions = max_sessions
+        self.max_ticks = max_ticks
+        # Started before the event loop, the workers are forked from a process without one
+        self.workers = [Worker(index, rows, columns) for index in range(workers)]
+        self.sessions: Dict[int, Session] = {}
+        self.last_number = 0
+        self.report_last_time = time()
+        # Since the last report
+        self.ticks = 0
+        self.step_times: List[float] = []
+        self.think_times: List[float] = []
+
+    async def start(self, host: str = HOST, port: int = PORT, path: Optional[str] = None) -> None:
+        loop = get_running_loop()
+        for worker in self.workers:
+            worker.start(loop)
+        if path is not None:
+            self.server = await start_unix_server(self._handle, path, backlog=self.max_sessions)
+            print("Tournament on %s with %d workers" % (path, len(self.workers)))
+        else:
+            self.server = await start_server(self._handle, host, port, backlog=self.max_sessions)
+            print("Tournament on %s:%d with %d workers" % (host, port, len(self.workers)))
+
+    async def serve(self) -> None:
+        while True:
+            await sleep(REPORT_DELAY)
+            self._report()
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        session: Optional[Session] = None
+        worker: Optional[Worker] = None
+        try:
+            magic, version, seed = HELLO.unpack(await wait_for(reader.readexactly(HELLO.size), ACTION_TIMEOUT))
+            workers = [worker for worker in self.workers if worker.alive]
+            if magic != MAGIC or version != VERSION or len(self.sessions) >= self.max_sessions or not workers:
+                return
+            self.last_number += 1
+            session = self.sessions[self.last_number] = Session(self.last_number, seed or getrandbits(63))
+            worker = min(workers, key=lambda w: w.sessions)
+            worker.sessions += 1
+            writer.write(WELCOME.pack(MAGIC, VERSION, session.number, *self.size, Scale.image, self.rows, self.columns))
+            gameover, session.score, snapshot = await worker.call(session.number, NEW, session.seed)
+            while True:
+                status = STATUS_GAMEOVER if gameover else STATUS_TICKS if session.ticks >= self.max_ticks else STATUS_PLAYING
+                writer.write(OBSERVATION.pack(status, len(snapshot)) + snapshot)
+                sent = perf_counter()
+                await writer.drain()
+                if status != STATUS_PLAYING:
+                    break
+                inputs, = ACTION.unpack(await wait_for(reader.readexactly(ACTION.size), ACTION_TIMEOUT))
+                received = perf_counter()
+                gameover, session.score, snapshot = await worker.call(session.number, STEP, inputs)
+                step_time = perf_counter() - received
+                session.step_times.append(step_time)
+                session.think_times.append(received - sent)
+                session.ticks += 1
+                self.step_times.append(step_time)
+                self.think_times.append(received - sent)
+                self.ticks += 1
+        except (IncompleteReadError, ConnectionError, TimeoutError):
+            pass
+        except ChildProcessError:
+            # Told to the bot rather than leaving it waiting for an observation that never comes
+            writer.write(OBSERVATION.pack(STATUS_ERROR, 0))
+        finally:
+            if session is not None and worker is not None:
+                worker.request(session.number, END, 0)
+                worker.sessions -= 1
+                del self.sessions[session.number]
+                self._end(session)
+            writer.close()
+
+    def _end(self, session: Session) -> None:
+        print("Session %d (seed %d): %d ticks, score %d, step p50 %.2f p99 %.2f ms, bot p50 %.2f p99 %.2f ms" % (
+            session.number, session.seed, session.ticks, session.score,
+            percentile(session.step_times, 50) * 1000, percentile(session.step_times, 99) * 1000,
+            percentile(session.think_times, 50) * 1000, percentile(session.think_times, 99) * 1000
+        ))
+
+    def _report(self) -> None:
+        now = time()
+        if self.ticks:
+            print("%d sessions, %.0f ticks/s, step p50 %.2f p99 %.2f ms, bot p50 %.2f p99 %.2f ms" % (
+                len(self.sessions), self.ticks / (now - self.report_last_time),
+                percentile(self.step_times, 50) * 1000, percentile(self.step_times, 99) * 1000,
+                percentile(self.think_times, 50) * 1000, percentile(self.think_times, 99) * 1000
+            ))
+        self.report_last_time = now
+        self.ticks = 0
+        self.step_times = []
+        self.think_times = []
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.close()
+
+################################################################
+#                             Bots                             #
+################################################################
+
+class Match(NamedTuple):
+    session: int
+    ticks: int
+    score: int
+    status: int
+    seconds: float
+
+async def play_bot(host: str, port: int, path: Optional[str], seed: int) -> Match:
+    # The autopilot of soak.py, reading the snapshots into a world of its own
+    reader, writer = await (open_unix_connection(path) if path is not None else open_connection(host, port))
+    start = perf_counter()
+    try:
+        writer.write(HELLO.pack(MAGIC, VERSION, seed))
+        magic, version, session, width, height, image_scale, rows, columns = WELCOME.unpack(await reader.readexactly(WELCOME.size))
+        if image_scale != Scale.image:
+            set_scale(image_scale)
+        set_fleet_size(rows, columns)
+        game = HeadlessGame(World(NullRender(width, height), 0))
+        autopilot = Autopilot(game)
+        ticks = 0
+        while True:
+            try:
+                status, length = OBSERVATION.unpack(await reader.readexactly(OBSERVATION.size))
+                if length:
+                    game.world.restore(await reader.readexactly(length))
+            except (IncompleteReadError, ConnectionError):
+                status = STATUS_CLOSED
+            if status != STATUS_PLAYING:
+                return Match(session, ticks, game.defender.score, status, perf_counter() - start)
+            autopilot.drive()
+            writer.write(ACTION.pack(
+                (INPUT_LEFT if game.left_key_pressed else 0) | (INPUT_RIGHT if game.right_key_pressed else 0) | (INPUT_FIRE if game.space_key_pressed else 0)
+            ))
+            ticks += 1
+    finally:
+        writer.close()
+
+async def play_bots(host: str, port: int, path: Optional[str], bots: int, seed: int) -> None:
+    matches = await gather(*(play_bot(host, port, path, seed + index if seed else 0) for index in range(bots)))
+    for match in matches:
+        print("Session %d: %d ticks, score %d, %s, %.0f ticks/s" % (
+            match.session, match.ticks, match.score, {STATUS_GAMEOVER: 'game over', STATUS_TICKS: 'out of ticks', STATUS_ERROR: 'error'}.get(match.status, 'closed'),
+            match.ticks / match.seconds
+        ))
+    print("%d matches, %d ticks, mean score %.0f" % (len(matches), sum(m.ticks for m in matches), sum(m.score for m in matches) / max(len(matches), 1)))
+
+async def host(server: TournamentServer, host: str, port: int, path: Optional[str]) -> None:
+    await server.start(host, port, path)
+    await server.serve()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Plays headless games against bots connected on a socket, or runs bots against such a server")
+    parser.add_argument('command', nargs='?', choices=['serve', 'bots'], default='serve')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--unix', help="path of a Unix domain socket, used instead of TCP")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="processes running the games")
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS)
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS, help="per match")
+    parser.add_argument('--rows', type=int, default=FLEET_ROWS)
+    parser.add_argument('--columns', type=int, default=FLEET_COLUMNS)
+    parser.add_argument('--bots', type=int, default=10, help="bots run at once by the bots command")
+    parser.add_argument('--seed', type=int, default=0, help="of the first bot, the next ones get the next seeds, 0 for random ones")
+    args = parser.parse_args()
+    try:
+        if args.command == 'bots':
+            run(play_bots(args.host, args.port, args.unix, args.bots, args.seed))
+        else:
+            server = TournamentServer(args.workers, args.max_sessions, args.max_ticks, args.rows, args.columns)
+            try:
+                run(host(server, args.host, args.port, args.unix))
+            finally:
+                server.close()
+    except KeyboardInterrupt:
+        pass